@@ -0,0 +1,332 @@
+"""
+Banco de pruebas del Background Remover: genera imágenes sintéticas a
+varias resoluciones y mide, para cada combinación de modelo y ajustes,
+imágenes por segundo, latencia p50/p95 y el pico de memoria (RSS) del
+proceso que más usó: no es la suma del pool. Escribe
+un informe JSON que se puede comparar entre versiones.
+
+Cada escenario se ejecuta en un proceso aparte con la caché aislada y
+vacía, así el pico de memoria es solo suyo y ningún resultado sale de
+la caché. Sin conexión, indicar un modelo local con --model-path (o
+tener ya descargado el modelo en ~/.u2net).
+
+Uso:
+    python bgbench.py --model-path u2net.onnx -o informe.json
+    python bgbench.py --workers 1 2 --fast-mask 0 1024 --formats png webp
+    python bgbench.py -o nuevo.json --compare anterior.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import itertools
+import platform
+import tempfile
+import subprocess
+import multiprocessing
+from datetime import datetime
+from PIL import Image, ImageDraw
+
+# --------------------------------------------------
+#   Ajustes del banco de pruebas
+# --------------------------------------------------
+RESOLUCIONES_POR_DEFECTO = ["640x480", "1920x1080", "4000x3000"]
+IMAGENES_POR_RESOLUCION = 6
+SEMILLA = 1234
+INFORME_POR_DEFECTO = "bgbench.json"
+
+# --------------------------------------------------
+#   Imágenes sintéticas
+# --------------------------------------------------
+def generar_imagen(ancho, alto, semilla):
+    """
+    Fondo degradado con ruido y una figura central, para que el JPEG y
+    el modelo trabajen con algo parecido a una foto de producto.
+    Siempre la misma imagen para la misma semilla.
+    """
+    import numpy as np
+    rng = np.random.default_rng(semilla)
+    x = np.linspace(0, 1, ancho, dtype=np.float32)[None, :, None]
+    y = np.linspace(0, 1, alto, dtype=np.float32)[:, None, None]
+    colores = rng.uniform(40, 215, size=(2, 3)).astype(np.float32)
+    fondo = colores[0] * (1 - x) * (1 - y / 2) + colores[1] * x * (0.5 + y / 2)
+    fondo += rng.normal(0, 6, size=(alto, ancho, 3)).astype(np.float32)
+    imagen = Image.fromarray(np.clip(fondo, 0, 255).astype(np.uint8), "RGB")
+
+    dibujo = ImageDraw.Draw(imagen)
+    cx, cy = ancho * rng.uniform(0.4, 0.6), alto * rng.uniform(0.45, 0.6)
+    rx, ry = ancho * rng.uniform(0.15, 0.25), alto * rng.uniform(0.25, 0.35)
+    relleno = tuple(int(v) for v in rng.integers(0, 256, 3))
+    dibujo.ellipse((cx - rx, cy - ry, cx + rx, cy + ry), fill=relleno)
+    dibujo.ellipse((cx - rx / 2, cy - ry * 1.6, cx + rx / 2, cy - ry * 0.8), fill=relleno)
+    return imagen
+
+def generar_conjunto(carpeta, resoluciones, cantidad, semilla=SEMILLA):
+    """
+    Guarda cantidad JPEG por resolución y devuelve {resolución: [rutas]}.
+    """
+    conjunto = {}
+    for resolucion in resoluciones:
+        ancho, alto = (int(v) for v in resolucion.lower().split("x"))
+        rutas = []
+        for i in range(cantidad):
+            ruta = os.path.join(carpeta, f"{resolucion}_{i}.jpg")
+            generar_imagen(ancho, alto, semilla + i).save(ruta, quality=90)
+            rutas.append(ruta)
+        conjunto[resolucion] = rutas
+    return conjunto
+
+# --------------------------------------------------
+#   Medidas
+# --------------------------------------------------
+def pico_rss_proceso_mb():
+    """
+    Mayor pico de memoria residente entre este proceso y cada uno de sus
+    hijos ya terminados (los procesos del pool), en MB: el sistema solo
+    da el máximo de los hijos, no su suma, así que con varios workers la
+    memoria total es mayor. En Windows solo cuenta este proceso. None si
+    no se puede medir.
+    """
+    try:
+        import resource
+    except ImportError:
+        return _pico_rss_windows_mb()
+    propio = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    hijos = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # Linux da KB y macOS bytes
+    escala = 1024 ** 2 if sys.platform == "darwin" else 1024
+    return max(propio, hijos) / escala
+
+def _pico_rss_windows_mb():
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        class ContadoresMemoria(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+                (nombre, ctypes.c_size_t) for nombre in (
+                    "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage",
+                    "QuotaPagedPoolUsage", "QuotaPeakNonPagedPoolUsage",
+                    "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage")
+            ]
+
+        contadores = ContadoresMemoria()
+        contadores.cb = ctypes.sizeof(contadores)
+        proceso = ctypes.windll.kernel32.GetCurrentProcess()
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(
+                proceso, ctypes.byref(contadores), contadores.cb):
+            return None
+        return contadores.PeakWorkingSetSize / 1024 ** 2
+    except (AttributeError, OSError):
+        return None
+
+def percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+def ejecutar_escenario(escenario):
+    """
+    Corre un escenario en este proceso y devuelve sus medidas. La
+    sesión se crea y calienta antes de medir; con workers > 1 el
+    tiempo incluye el arranque del pool (cada proceso carga el modelo).
+    """
+    from bgcore import crear_sesion, remove, procesar_lote
+    modelo, workers = escenario["modelo"], escenario["workers"]
+    runtime = escenario.get("runtime") or {}
+    sesion = None
+    if workers <= 1:
+        sesion = crear_sesion(modelo, runtime)
+        remove(Image.new("RGB", (64, 64)), session=sesion)
+
+    latencias = []
+
+    def al_avanzar(hechas, total, ruta, registro, error):
+        if registro:
+            latencias.append(registro["total"])
+
+    inicio = time.perf_counter()
+    registros, errores = procesar_lote(
+        escenario["rutas"], modelo, workers, escenario["ajustes"], escenario["salida"],
+        al_avanzar=al_avanzar, sesion=sesion, runtime=runtime
+    )
+    segundos = time.perf_counter() - inicio
+    return {
+        "imagenes": len(registros),
+        "errores": [f"{os.path.basename(r)}: {e}" for r, e in errores],
+        "segundos": segundos,
+        "img_por_s": len(registros) / segundos if registros and segundos > 0 else None,
+        "latencia_p50_s": percentil(latencias, 50),
+        "latencia_p95_s": percentil(latencias, 95),
+        "pico_rss_proceso_mb": pico_rss_proceso_mb(),
+    }
+
+def medir_en_subproceso(escenario, carpeta_cache):
+    """
+    Lanza este mismo script con --scenario en un proceso nuevo, con la
+    caché aislada, y devuelve su resultado.
+    """
+    entorno = dict(os.environ, YUURUII_CACHE_DIR=carpeta_cache)
+    proceso = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--scenario", json.dumps(escenario)],
+        capture_output=True, text=True, env=entorno
+    )
+    if proceso.returncode != 0:
+        raise RuntimeError(proceso.stderr.strip().splitlines()[-1] if proceso.stderr else
+                           f"código de salida {proceso.returncode}")
+    return json.loads(proceso.stdout.strip().splitlines()[-1])
+
+# --------------------------------------------------
+#   Informe
+# --------------------------------------------------
+def version_codigo():
+    """
+    Commit actual si el script está en un repositorio git.
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def clave_escenario(resultado):
+    return (resultado["modelo"], resultado["resolucion"], resultado["workers"],
+            resultado["lado_mascara"], resultado["formato"])
+
+def comparar(actual, anterior):
+    """
+    Líneas de texto con la variación de img/s y p95 de cada escenario
+    presente en los dos informes.
+    """
+    previos = {clave_escenario(r): r for r in anterior.get("resultados", [])}
+    lineas = []
+    for resultado in actual["resultados"]:
+        previo = previos.get(clave_escenario(resultado))
+        if not previo or not previo.get("img_por_s") or not resultado.get("img_por_s"):
+            continue
+        cambio = (resultado["img_por_s"] / previo["img_por_s"] - 1) * 100
+        lineas.append(
+            f"{describir(resultado)}: {previo['img_por_s']:.2f} → {resultado['img_por_s']:.2f} img/s "
+            f"({cambio:+.1f} %), p95 {previo['latencia_p95_s']:.2f} → {resultado['latencia_p95_s']:.2f} s"
+        )
+    return lineas
+
+def describir(resultado):
+    mascara = f"máscara {resultado['lado_mascara']}" if resultado["lado_mascara"] else "máscara completa"
+    return (f"{resultado['modelo']} {resultado['resolucion']} · {resultado['workers']} proc · "
+            f"{mascara} · {resultado['formato']}")
+
+# --------------------------------------------------
+#   Línea de comandos
+# --------------------------------------------------
+def crear_parser():
+    from bgcore import MODELO_POR_DEFECTO, EXTENSIONES_SALIDA
+    parser = argparse.ArgumentParser(
+        prog="bgbench",
+        description="Mide rendimiento y memoria del Background Remover con imágenes sintéticas."
+    )
+    parser.add_argument("-o", "--output", default=INFORME_POR_DEFECTO,
+                        help=f"Informe JSON (por defecto: {INFORME_POR_DEFECTO})")
+    parser.add_argument("--models", nargs="+", default=[MODELO_POR_DEFECTO],
+                        help="Modelos de rembg a medir")
+    parser.add_argument("--model-path", default=None, metavar="ONNX",
+                        help="Modelo .onnx local (sin descargas); se mide con el primer modelo de --models")
+    parser.add_argument("--resolutions", nargs="+", default=RESOLUCIONES_POR_DEFECTO,
+                        metavar="ANCHOxALTO", help="Resoluciones de las imágenes sintéticas")
+    parser.add_argument("--images", type=int, default=IMAGENES_POR_RESOLUCION,
+                        help=f"Imágenes por resolución (por defecto: {IMAGENES_POR_RESOLUCION})")
+    parser.add_argument("--workers", nargs="+", type=int, default=[1],
+                        help="Números de procesos a medir")
+    parser.add_argument("--fast-mask", nargs="+", type=int, default=[0, 1024], metavar="LADO",
+                        help="Lados de la máscara rápida a medir (0 = máscara completa)")
+    parser.add_argument("--formats", nargs="+", default=["png"], choices=list(EXTENSIONES_SALIDA),
+                        help="Formatos de salida a medir")
+    parser.add_argument("--compare", default=None, metavar="JSON",
+                        help="Informe anterior con el que comparar")
+    parser.add_argument("--scenario", default=None, help=argparse.SUPPRESS)
+    return parser
+
+def main(argv=None):
+    args = crear_parser().parse_args(argv)
+    if args.scenario:
+        print(json.dumps(ejecutar_escenario(json.loads(args.scenario))))
+        return 0
+
+    runtime = {"ruta_modelo": os.path.abspath(args.model_path)} if args.model_path else {}
+    modelos = args.models[:1] if args.model_path else args.models
+    informe = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "version": version_codigo(),
+        "maquina": {
+            "nombre": platform.node(),
+            "sistema": platform.platform(),
+            "procesador": platform.processor(),
+            "nucleos": os.cpu_count(),
+            "python": platform.python_version(),
+        },
+        "parametros": {k: v for k, v in vars(args).items() if k != "scenario"},
+        "resultados": [],
+    }
+
+    temporal = tempfile.mkdtemp(prefix="bgbench_")
+    try:
+        print("Generando imágenes sintéticas…", flush=True)
+        entrada = os.path.join(temporal, "entrada")
+        os.makedirs(entrada)
+        conjunto = generar_conjunto(entrada, args.resolutions, args.images)
+        combinaciones = itertools.product(
+            modelos, conjunto, args.workers, args.fast_mask, args.formats
+        )
+        for modelo, resolucion, workers, lado, formato in combinaciones:
+            ajustes = {"formato": formato}
+            if lado:
+                ajustes["lado_mascara"] = lado
+            resultado = {
+                "modelo": modelo, "resolucion": resolucion, "workers": workers,
+                "lado_mascara": lado or None, "formato": formato,
+            }
+            cache = os.path.join(temporal, "cache")
+            salida = os.path.join(temporal, "salida")
+            shutil.rmtree(cache, ignore_errors=True)
+            shutil.rmtree(salida, ignore_errors=True)
+            try:
+                resultado.update(medir_en_subproceso({
+                    "modelo": modelo, "workers": workers, "ajustes": ajustes,
+                    "runtime": runtime, "rutas": conjunto[resolucion], "salida": salida,
+                }, cache))
+            except Exception as e:
+                resultado["error"] = str(e)
+                print(f"{describir(resultado)}: error: {e}", file=sys.stderr, flush=True)
+            else:
+                if not resultado["imagenes"]:
+                    print(f"{describir(resultado)}: error: {resultado['errores'][0]}",
+                          file=sys.stderr, flush=True)
+                else:
+                    print(f"{describir(resultado)}: {resultado['img_por_s']:.2f} img/s · "
+                          f"p50 {resultado['latencia_p50_s']:.2f} s · "
+                          f"p95 {resultado['latencia_p95_s']:.2f} s · "
+                          f"RSS máx. por proceso {resultado['pico_rss_proceso_mb'] or 0:.0f} MB", flush=True)
+            informe["resultados"].append(resultado)
+    finally:
+        shutil.rmtree(temporal, ignore_errors=True)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(informe, f, indent=2, ensure_ascii=False)
+    print(f"Informe guardado en {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            anterior = json.load(f)
+        print(f"Comparación con {args.compare} ({anterior.get('version') or anterior.get('fecha')}):")
+        for linea in comparar(informe, anterior) or ["Sin escenarios en común."]:
+            print(f"  {linea}")
+    return 1 if any("error" in r or r.get("errores") for r in informe["resultados"]) else 0
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
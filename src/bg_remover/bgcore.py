@@ -0,0 +1,1421 @@
+"""
+Núcleo del Background Remover: sesión de rembg, caché, máscara a baja
+resolución, codificación de la salida, medición de etapas y lotes con
+pool de procesos. No importa tkinter, así que se puede usar desde
+scripts, servidores o pruebas sin abrir ninguna ventana.
+
+Uso por línea de comandos:
+    python bgcore.py foto1.jpg carpeta/ -o salida --workers 4 --model u2net
+"""
+import os
+import sys
+import io
+import time
+import json
+import shutil
+import hashlib
+import csv
+import zlib
+import struct
+import queue
+import platform
+import statistics
+import argparse
+import threading
+import functools
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from PIL import Image, ImageOps
+
+# --------------------------------------------------
+#   Importaciones pesadas bajo demanda
+#   (rembg arrastra onnxruntime y NumPy; cargarlos
+#   al importar el módulo retrasa segundos el arranque)
+# --------------------------------------------------
+def remove(*args, **kwargs):
+    from rembg import remove as _remove
+    return _remove(*args, **kwargs)
+
+def new_session(*args, **kwargs):
+    from rembg import new_session as _new_session
+    return _new_session(*args, **kwargs)
+
+# --------------------------------------------------
+#   Función para obtener la ruta de recursos 
+#   (imágenes, .exe, .ico) tanto en modo script 
+#   como en modo PyInstaller
+# --------------------------------------------------
+def resource_path(filename):
+    if getattr(sys, "frozen", False):
+        base_path = sys._MEIPASS
+    else:
+        base_path = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(base_path, filename)
+
+# --------------------------------------------------
+#   Variables y carpetas para guardar resultados
+# --------------------------------------------------
+SCRIPT_DIR = resource_path("")
+# La carpeta se crea al guardar el primer resultado, no al importar
+OUTPUT_DIR = os.path.join(SCRIPT_DIR, "Yuuruii PNGS")
+
+# --------------------------------------------------
+#   Sesión de rembg reutilizable
+# --------------------------------------------------
+MODELOS_DISPONIBLES = [
+    "u2net", "u2netp", "u2net_human_seg", "isnet-general-use", "silueta"
+]
+MODELO_POR_DEFECTO = "u2net"
+
+# --------------------------------------------------
+#   Ajustes de onnxruntime
+# --------------------------------------------------
+# Claves del diccionario "runtime":
+#   - "hilos_intra" / "hilos_inter": hilos de onnxruntime
+#   - "optimizacion": nivel de optimización del grafo (ver NIVELES_OPTIMIZACION)
+#   - "ruta_modelo": archivo .onnx local (p. ej. cuantizado a int8);
+#     se carga tal cual, sin descargar nada
+NIVELES_OPTIMIZACION = {
+    "desactivado": "ORT_DISABLE_ALL",
+    "basico": "ORT_ENABLE_BASIC",
+    "extendido": "ORT_ENABLE_EXTENDED",
+    "todo": "ORT_ENABLE_ALL",
+}
+RUNTIME_CALIBRADO = os.path.join(SCRIPT_DIR, "runtime_calibrado.json")
+NUCLEOS = os.cpu_count() or 1
+
+def crear_sesion(modelo=MODELO_POR_DEFECTO, runtime=None):
+    """
+    Crea la sesión de rembg. Sin ajustes de runtime usa new_session()
+    tal cual; con ellos construye la sesión con unas SessionOptions
+    propias. Un modelo local se carga con la sesión "u2net_custom"
+    de rembg, que aplica el pre/posprocesado de U²-Net.
+    """
+    runtime = runtime or {}
+    if not runtime:
+        return new_session(modelo)
+
+    import onnxruntime as ort
+    from rembg.sessions import sessions_class
+
+    opciones = ort.SessionOptions()
+    if runtime.get("hilos_intra"):
+        opciones.intra_op_num_threads = int(runtime["hilos_intra"])
+    if runtime.get("hilos_inter"):
+        opciones.inter_op_num_threads = int(runtime["hilos_inter"])
+    if runtime.get("optimizacion"):
+        opciones.graph_optimization_level = getattr(
+            ort.GraphOptimizationLevel, NIVELES_OPTIMIZACION[runtime["optimizacion"]]
+        )
+
+    nombre = "u2net_custom" if runtime.get("ruta_modelo") else modelo
+    clase = next((c for c in sessions_class if c.name() == nombre), None)
+    if clase is None:
+        raise ValueError(f"Modelo desconocido: {nombre}")
+    if runtime.get("ruta_modelo"):
+        ruta_modelo = os.path.abspath(os.path.expanduser(runtime["ruta_modelo"]))
+        if not os.path.isfile(ruta_modelo):
+            raise FileNotFoundError(f"No existe el modelo local: {ruta_modelo}")
+        return clase(nombre, opciones, model_path=ruta_modelo)
+    return clase(nombre, opciones)
+
+def identidad_modelo(modelo, runtime=None):
+    """
+    Identifica el modelo para la caché: un archivo local (cuantizado o
+    no) da resultados distintos que el modelo descargado.
+    """
+    ruta_modelo = (runtime or {}).get("ruta_modelo")
+    if ruta_modelo:
+        return f"{modelo}@{os.path.abspath(ruta_modelo)}"
+    return modelo
+
+def repartir_hilos(runtime, workers):
+    """
+    Ajusta los hilos de cada proceso de un pool para que entre todos
+    no pidan más núcleos de los que hay.
+    """
+    runtime = dict(runtime or {})
+    if workers <= 1:
+        return runtime
+    por_worker = max(1, NUCLEOS // workers)
+    runtime["hilos_intra"] = min(int(runtime.get("hilos_intra") or por_worker), por_worker)
+    runtime["hilos_inter"] = 1
+    return runtime
+
+def _clave_calibrado(modelo, ruta_modelo=None):
+    return identidad_modelo(modelo, {"ruta_modelo": ruta_modelo})
+
+def cargar_runtime_calibrado(modelo, ruta_modelo=None, ruta_config=RUNTIME_CALIBRADO):
+    """
+    Ajustes guardados por calibrar_runtime() para esta máquina y modelo,
+    o {} si no se ha calibrado.
+    """
+    try:
+        with open(ruta_config, "r", encoding="utf-8") as f:
+            config = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    guardado = config.get(platform.node(), {}).get(_clave_calibrado(modelo, ruta_modelo))
+    if not guardado:
+        return {}
+    return {k: v for k, v in guardado.items() if k != "segundos"}
+
+def calibrar_runtime(modelo=MODELO_POR_DEFECTO, ruta_modelo=None, repeticiones=3,
+                     ruta_config=RUNTIME_CALIBRADO, al_probar=None):
+    """
+    Mide varias combinaciones de hilos y nivel de optimización sobre
+    una imagen sintética, guarda la más rápida para esta máquina en
+    ruta_config y la devuelve. al_probar(runtime, segundos) se llama
+    tras cada combinación.
+    """
+    hilos = sorted({1, 2, 4, max(1, NUCLEOS // 2), NUCLEOS} & set(range(1, NUCLEOS + 1)))
+    candidatos = [
+        {"hilos_intra": h, "hilos_inter": 1, "optimizacion": nivel}
+        for h in hilos for nivel in ("basico", "todo")
+    ]
+    imagen = Image.linear_gradient("L").resize((1024, 768)).convert("RGB")
+
+    mejor, mejor_segundos = None, None
+    for candidato in candidatos:
+        runtime = dict(candidato)
+        if ruta_modelo:
+            runtime["ruta_modelo"] = ruta_modelo
+        sesion = crear_sesion(modelo, runtime)
+        remove(imagen, session=sesion, only_mask=True)  # Calentamiento
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            remove(imagen, session=sesion, only_mask=True)
+            tiempos.append(time.perf_counter() - inicio)
+        segundos = statistics.median(tiempos)
+        if al_probar:
+            al_probar(runtime, segundos)
+        if mejor_segundos is None or segundos < mejor_segundos:
+            mejor, mejor_segundos = runtime, segundos
+
+    try:
+        with open(ruta_config, "r", encoding="utf-8") as f:
+            config = json.load(f)
+    except (OSError, ValueError):
+        config = {}
+    config.setdefault(platform.node(), {})[_clave_calibrado(modelo, ruta_modelo)] = {
+        **mejor, "segundos": mejor_segundos
+    }
+    with open(ruta_config, "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+    return mejor
+
+class GestorSesion:
+    """
+    Carga el modelo elegido una sola vez y entrega la misma sesión
+    a todas las llamadas a remove(). Si se cambia de modelo, la
+    siguiente llamada crea la sesión nueva. Sin runtime explícito
+    usa el calibrado para esta máquina, si lo hay.
+    """
+    def __init__(self, modelo=MODELO_POR_DEFECTO, runtime=None):
+        self._modelo = modelo
+        self._runtime = runtime
+        self._sesion = None
+        self._lock = threading.Lock()
+
+    @property
+    def modelo(self):
+        return self._modelo
+
+    @property
+    def runtime(self):
+        if self._runtime is not None:
+            return self._runtime
+        return cargar_runtime_calibrado(self._modelo)
+
+    @property
+    def identidad(self):
+        return identidad_modelo(self._modelo, self.runtime)
+
+    @property
+    def cargada(self):
+        """
+        True si la sesión del modelo actual ya está creada.
+        """
+        return self._sesion is not None
+
+    def cambiar_modelo(self, modelo):
+        with self._lock:
+            if modelo != self._modelo:
+                self._modelo = modelo
+                self._sesion = None
+
+    def obtener(self):
+        """
+        Devuelve la sesión del modelo actual, creándola si aún no existe.
+        """
+        with self._lock:
+            if self._sesion is None:
+                self._sesion = crear_sesion(self._modelo, self.runtime)
+            return self._sesion
+
+    def precalentar(self):
+        """
+        Crea la sesión y ejecuta una inferencia mínima para que la
+        primera imagen real no pague la inicialización de onnxruntime.
+        """
+        sesion = self.obtener()
+        remove(Image.new("RGB", (64, 64)), session=sesion)
+
+    def precalentar_en_segundo_plano(self, al_terminar=None):
+        """
+        Precalienta en un hilo aparte. Si se indica, al_terminar(error)
+        se llama desde ese hilo al acabar (error es None si todo fue bien).
+        """
+        hilo = threading.Thread(target=self._precalentar_seguro, args=(al_terminar,), daemon=True)
+        hilo.start()
+        return hilo
+
+    def _precalentar_seguro(self, al_terminar=None):
+        error = None
+        try:
+            self.precalentar()
+        except Exception as e:
+            # Si falla aquí, el error se mostrará al procesar la primera imagen
+            error = e
+        if al_terminar:
+            al_terminar(error)
+
+
+# --------------------------------------------------
+#   Caché de resultados en disco
+# --------------------------------------------------
+# YUURUII_CACHE_DIR permite aislar la caché (p. ej. en bgbench.py); los
+# procesos del pool la heredan del entorno
+CACHE_DIR = os.environ.get("YUURUII_CACHE_DIR") or os.path.join(SCRIPT_DIR, "Yuuruii Cache")
+CACHE_LIMITE_BYTES = 2 * 1024 ** 3  # 2 GB
+# Cambia cuando cambia cómo se calcula un resultado con los mismos datos
+# (2: las entradas se orientan según su EXIF antes de segmentar)
+VERSION_CACHE = 2
+
+class CacheResultados:
+    """
+    Guarda cada recorte bajo una clave derivada del hash de la imagen
+    de entrada, el modelo y los ajustes. Las entradas menos usadas
+    (por fecha de modificación) se eliminan al superar el límite.
+    Junto a cada entrada se anota la última ruta de salida escrita
+    para no duplicar archivos en OUTPUT_DIR.
+    """
+    def __init__(self, carpeta=CACHE_DIR, limite_bytes=CACHE_LIMITE_BYTES):
+        self.carpeta = carpeta
+        self.limite_bytes = limite_bytes
+
+    def clave(self, datos, modelo, ajustes=None):
+        h = hashlib.sha256(datos)
+        h.update(json.dumps([VERSION_CACHE, modelo, ajustes or {}], sort_keys=True).encode("utf-8"))
+        return h.hexdigest()
+
+    def claves(self, datos, modelo, ajustes=None):
+        """
+        Devuelve (clave del resultado, clave de la máscara) con un solo
+        hash de los datos. La máscara solo depende del modelo y de la
+        resolución a la que se calcula, no del formato de salida, así
+        que la comparten todas las variantes de una misma imagen.
+        """
+        h = hashlib.sha256(datos)
+        h_mascara = h.copy()
+        h.update(json.dumps([VERSION_CACHE, modelo, ajustes or {}], sort_keys=True).encode("utf-8"))
+        h_mascara.update(json.dumps(
+            [VERSION_CACHE, modelo, {"lado_mascara": (ajustes or {}).get("lado_mascara")}], sort_keys=True
+        ).encode("utf-8"))
+        return h.hexdigest(), h_mascara.hexdigest()
+
+    def clave_archivo(self, ruta, modelo, ajustes=None, bloque=1024 ** 2):
+        """
+        Igual que clave(), pero leyendo el archivo por bloques para no
+        tenerlo entero en memoria.
+        """
+        h = hashlib.sha256()
+        with open(ruta, "rb") as f:
+            for trozo in iter(lambda: f.read(bloque), b""):
+                h.update(trozo)
+        h.update(json.dumps([VERSION_CACHE, modelo, ajustes or {}], sort_keys=True).encode("utf-8"))
+        return h.hexdigest()
+
+    def _ruta(self, clave, extension):
+        return os.path.join(self.carpeta, f"{clave}.{extension}")
+
+    def obtener(self, clave, extension="png"):
+        """
+        Devuelve la ruta del recorte cacheado o None. Un acierto
+        actualiza su fecha para la política LRU.
+        """
+        ruta = self._ruta(clave, extension)
+        try:
+            os.utime(ruta)
+        except OSError:
+            return None
+        return ruta
+
+    def guardar(self, clave, ruta_resultado):
+        """
+        Copia a la caché un resultado ya codificado y aplica el límite.
+        """
+        os.makedirs(self.carpeta, exist_ok=True)
+        extension = os.path.splitext(ruta_resultado)[1].lstrip(".")
+        destino = self._ruta(clave, extension)
+        temporal = f"{destino}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.copyfile(ruta_resultado, temporal)
+        os.replace(temporal, destino)
+        self.registrar_salida(clave, ruta_resultado)
+        self.recortar()
+
+    def obtener_mascara(self, clave):
+        """
+        Devuelve la máscara (L) cacheada para la clave o None.
+        """
+        ruta = self._ruta(clave, "mascara.png")
+        try:
+            os.utime(ruta)
+            mascara = Image.open(ruta)
+            mascara.load()
+        except OSError:
+            return None
+        return mascara
+
+    def guardar_mascara(self, clave, mascara):
+        """
+        Guarda la máscara con compresión rápida: se escribe en cada
+        inferencia y solo se lee al recomponer.
+        """
+        os.makedirs(self.carpeta, exist_ok=True)
+        destino = self._ruta(clave, "mascara.png")
+        temporal = f"{destino}.{os.getpid()}.{threading.get_ident()}.tmp"
+        mascara.save(temporal, format="PNG", compress_level=1)
+        os.replace(temporal, destino)
+        self.recortar()
+
+    def salida_previa(self, clave):
+        """
+        Última ruta de salida escrita para esta clave, si aún existe.
+        """
+        try:
+            with open(self._ruta(clave, "txt"), "r", encoding="utf-8") as f:
+                ruta = f.read().strip()
+        except OSError:
+            return None
+        return ruta if os.path.isfile(ruta) else None
+
+    def registrar_salida(self, clave, ruta_salida):
+        ruta = self._ruta(clave, "txt")
+        temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            f.write(ruta_salida)
+        os.replace(temporal, ruta)
+
+    def recortar(self):
+        """
+        Elimina las entradas menos usadas hasta quedar bajo el límite.
+        """
+        entradas = []
+        total = 0
+        try:
+            with os.scandir(self.carpeta) as it:
+                for entrada in it:
+                    if not entrada.name.endswith((".txt", ".tmp")):
+                        st = entrada.stat()
+                        entradas.append((st.st_mtime, st.st_size, entrada.name))
+                        total += st.st_size
+        except FileNotFoundError:
+            return
+        entradas.sort()
+        for _, tamano, nombre in entradas:
+            if total <= self.limite_bytes:
+                break
+            clave = os.path.splitext(nombre)[0]
+            for ruta in (os.path.join(self.carpeta, nombre), self._ruta(clave, "txt")):
+                try:
+                    os.remove(ruta)
+                except OSError:
+                    pass
+            total -= tamano
+
+    def limpiar(self):
+        """
+        Vacía la caché por completo. Devuelve los bytes liberados.
+        """
+        liberados = 0
+        try:
+            with os.scandir(self.carpeta) as it:
+                for entrada in it:
+                    if entrada.is_file():
+                        liberados += entrada.stat().st_size
+                        try:
+                            os.remove(entrada.path)
+                        except OSError:
+                            pass
+        except FileNotFoundError:
+            pass
+        return liberados
+
+cache_resultados = CacheResultados()
+
+# --------------------------------------------------
+#   Decodificación y orientación EXIF
+# --------------------------------------------------
+ORIENTACION_EXIF = 0x0112
+# Orientaciones que intercambian ancho y alto
+ORIENTACIONES_GIRADAS = (5, 6, 7, 8)
+
+def orientar(imagen):
+    """
+    Gira o voltea la imagen según su orientación EXIF (fotos de móvil)
+    y quita la etiqueta, para que original, máscara y caché compartan
+    la misma geometría. Sin orientación devuelve la misma imagen.
+    """
+    if imagen.getexif().get(ORIENTACION_EXIF, 1) == 1:
+        return imagen
+    return ImageOps.exif_transpose(imagen)
+
+def decodificar(datos):
+    """
+    Decodifica una imagen completa desde bytes, ya orientada.
+    """
+    imagen = Image.open(io.BytesIO(datos))
+    imagen.load()
+    return orientar(imagen)
+
+# --------------------------------------------------
+#   Máscara a baja resolución
+# --------------------------------------------------
+# Lado mayor (px) de la copia reducida que se pasa al modelo
+LADO_MASCARA_POR_DEFECTO = 1024
+
+try:
+    RESAMPLE_REDUCIR = Image.Resampling.BOX
+    RESAMPLE_AMPLIAR = Image.Resampling.BICUBIC
+except AttributeError:
+    RESAMPLE_REDUCIR = Image.BOX
+    RESAMPLE_AMPLIAR = Image.BICUBIC
+
+@functools.lru_cache(maxsize=None)
+def _tabla_refinado(bajo=0.04, alto=0.96):
+    """
+    Tabla de 256 valores que estira el contraste de la máscara y
+    suaviza la transición (smoothstep). Al ampliar una máscara los
+    bordes se vuelven difusos; esto los recupera sin tocar el modelo.
+    """
+    import numpy as np
+    x = np.arange(256, dtype=np.float32) / 255.0
+    t = np.clip((x - bajo) / (alto - bajo), 0.0, 1.0)
+    t = t * t * (3.0 - 2.0 * t)
+    return np.rint(t * 255.0).astype(np.uint8).tolist()
+
+def calcular_mascara_baja_resolucion(imagen, sesion, lado_max=LADO_MASCARA_POR_DEFECTO):
+    """
+    Segmenta una copia reducida de la imagen y devuelve la máscara (L)
+    ampliada y refinada al tamaño original. La imagen se orienta antes
+    de reducirla: si no, el modelo gira la copia reducida por su cuenta
+    y la máscara se estira sobre el original sin girar.
+    """
+    imagen = orientar(imagen)
+    escala = lado_max / max(imagen.size)
+    if escala < 1:
+        tam_reducido = (max(1, round(imagen.width * escala)),
+                        max(1, round(imagen.height * escala)))
+        reducida = imagen.convert("RGB").resize(tam_reducido, RESAMPLE_REDUCIR)
+    else:
+        reducida = imagen.convert("RGB")
+
+    mascara = remove(reducida, session=sesion, only_mask=True).convert("L")
+    if mascara.size != imagen.size:
+        mascara = mascara.resize(imagen.size, RESAMPLE_AMPLIAR)
+    return mascara.point(_tabla_refinado())
+
+# --------------------------------------------------
+#   Recorte y codificación de la salida
+# --------------------------------------------------
+# Formatos de salida: "png", "webp" (sin pérdida) o "mascara" (PNG en grises)
+FORMATO_POR_DEFECTO = "png"
+EXTENSIONES_SALIDA = {"png": "png", "webp": "webp", "mascara": "png"}
+COMPRESION_PNG_POR_DEFECTO = 6
+
+def calcular_recorte(original, sesion, ajustes, mascara=None):
+    """
+    Recibe la imagen ya decodificada y devuelve otra PIL.Image: el
+    recorte RGBA o, con formato "mascara", solo la máscara en grises.
+    Nunca pasa por bytes PNG intermedios. Con una máscara ya calculada
+    (de la caché) no usa el modelo. Una imagen con orientación EXIF se
+    orienta antes (ver orientar).
+    """
+    original = orientar(original)
+    solo_mascara = ajustes.get("formato") == "mascara"
+    if mascara is not None:
+        if solo_mascara:
+            return mascara
+        imagen_full = original.convert("RGBA")
+        imagen_full.putalpha(mascara)
+        return imagen_full
+
+    if ajustes.get("lado_mascara"):
+        # Máscara a baja resolución aplicada sobre la imagen original
+        mascara = calcular_mascara_baja_resolucion(original, sesion, ajustes["lado_mascara"])
+        if solo_mascara:
+            return mascara
+        imagen_full = original.convert("RGBA")
+        imagen_full.putalpha(mascara)
+        return imagen_full
+
+    resultado = remove(original, session=sesion, only_mask=solo_mascara)
+    return resultado.convert("L" if solo_mascara else "RGBA")
+
+def extraer_mascara(imagen):
+    """
+    Máscara (L) de un resultado de calcular_recorte().
+    """
+    return imagen if imagen.mode == "L" else imagen.getchannel("A")
+
+def extension_salida(ajustes):
+    return EXTENSIONES_SALIDA[ajustes.get("formato", FORMATO_POR_DEFECTO)]
+
+def guardar_resultado(imagen, ruta_salida, ajustes):
+    """
+    Única codificación de la imagen resultante. El nivel de compresión
+    PNG (0-9) permite cambiar tiempo de CPU por tamaño de archivo.
+    """
+    if ajustes.get("formato") == "webp":
+        imagen.save(ruta_salida, format="WEBP", lossless=True)
+    else:
+        imagen.save(
+            ruta_salida,
+            format="PNG",
+            compress_level=ajustes.get("compresion_png", COMPRESION_PNG_POR_DEFECTO)
+        )
+
+# --------------------------------------------------
+#   Etapas del procesamiento y registro de tiempos
+# --------------------------------------------------
+# Peso de cada etapa en la barra de progreso (suman 100)
+PESOS_ETAPAS = {
+    "leer": 5,
+    "decodificar": 10,
+    "inferencia": 60,
+    "guardar": 20,
+    "miniatura": 5,
+}
+ETAPAS = list(PESOS_ETAPAS)
+
+class MedidorEtapas:
+    """
+    Mide el tiempo de pared de cada etapa de una imagen y, si se indica
+    al_avanzar(porcentaje, etapa), avisa al empezar y al terminar cada una.
+    """
+    def __init__(self, ruta_archivo, al_avanzar=None):
+        self.ruta_archivo = ruta_archivo
+        self.tiempos = {}
+        self.desde_cache = False
+        self._al_avanzar = al_avanzar
+        self._porcentaje = 0
+        self._inicio = time.perf_counter()
+
+    @contextmanager
+    def etapa(self, nombre):
+        self._avisar(nombre)
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.tiempos[nombre] = time.perf_counter() - inicio
+            self._porcentaje += PESOS_ETAPAS.get(nombre, 0)
+            self._avisar(nombre)
+
+    def terminar(self):
+        self._porcentaje = 100
+        self._avisar("listo")
+
+    def _avisar(self, nombre):
+        if self._al_avanzar:
+            self._al_avanzar(min(self._porcentaje, 100), nombre)
+
+    def registro(self):
+        """
+        Diccionario serializable con los tiempos de la imagen.
+        """
+        return {
+            "archivo": self.ruta_archivo,
+            "fecha": datetime.now().isoformat(timespec="seconds"),
+            "cache": self.desde_cache,
+            "total": time.perf_counter() - self._inicio,
+            **{etapa: self.tiempos.get(etapa) for etapa in ETAPAS},
+        }
+
+# Tiempos de cada imagen procesada en esta sesión (exportables)
+registro_tiempos = []
+registro_lock = threading.Lock()
+
+def anotar_tiempos(registro):
+    with registro_lock:
+        registro_tiempos.append(registro)
+
+def exportar_tiempos(ruta, arranque=None):
+    """
+    Escribe el registro de tiempos en JSON o CSV según la extensión.
+    En JSON, si se indican métricas de arranque, se guardan junto a
+    las imágenes como {"arranque": {...}, "imagenes": [...]}.
+    """
+    with registro_lock:
+        registros = list(registro_tiempos)
+    if ruta.lower().endswith(".json"):
+        contenido = {"arranque": arranque, "imagenes": registros} if arranque else registros
+        with open(ruta, "w", encoding="utf-8") as f:
+            json.dump(contenido, f, indent=2, ensure_ascii=False)
+    else:
+        columnas = ["archivo", "fecha", "cache", "total", *ETAPAS]
+        with open(ruta, "w", newline="", encoding="utf-8") as f:
+            escritor = csv.DictWriter(f, fieldnames=columnas)
+            escritor.writeheader()
+            escritor.writerows(registros)
+    return len(registros)
+
+def medias_por_etapa(registros):
+    """
+    Media en segundos de cada etapa (ignorando las que no se ejecutaron).
+    """
+    medias = {}
+    for etapa in ETAPAS:
+        valores = [r[etapa] for r in registros if r.get(etapa) is not None]
+        if valores:
+            medias[etapa] = sum(valores) / len(valores)
+    return medias
+
+# --------------------------------------------------
+#   Modo por franjas con memoria acotada
+# --------------------------------------------------
+MEMORIA_MAXIMA_MB_POR_DEFECTO = 256
+# Bytes aproximados por píxel de una franja en vuelo: recorte RGB,
+# copia RGBA, máscara, filas filtradas para PNG y búfer de zlib
+BYTES_POR_PIXEL_FRANJA = 16
+# Lado de la vista previa que se devuelve en este modo
+LADO_VISTA_PREVIA = 300
+
+def filas_por_franja(ancho, memoria_max_mb):
+    return max(1, int(memoria_max_mb * 1024 ** 2) // (ancho * BYTES_POR_PIXEL_FRANJA))
+
+class EscritorPNGPorFranjas:
+    """
+    Escribe un PNG de 8 bits (RGBA o L) franja a franja. Las filas se
+    filtran con el filtro "Up" de PNG (vectorizado con NumPy) y se
+    comprimen con zlib en streaming, así que nunca se tiene la imagen
+    completa ni sus bytes codificados en memoria.
+    """
+    TIPOS_COLOR = {"L": (0, 1), "RGBA": (6, 4)}
+
+    def __init__(self, ruta, ancho, alto, modo="RGBA", nivel=COMPRESION_PNG_POR_DEFECTO):
+        import numpy as np
+        self._np = np
+        tipo_color, self._canales = self.TIPOS_COLOR[modo]
+        self._modo = modo
+        self._ancho = ancho
+        self._fila_anterior = np.zeros(ancho * self._canales, dtype=np.uint8)
+        self._zlib = zlib.compressobj(nivel)
+        self._f = open(ruta, "wb")
+        self._f.write(b"\x89PNG\r\n\x1a\n")
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", ancho, alto, 8, tipo_color, 0, 0, 0))
+
+    def _chunk(self, tipo, datos):
+        self._f.write(struct.pack(">I", len(datos)))
+        self._f.write(tipo)
+        self._f.write(datos)
+        self._f.write(struct.pack(">I", zlib.crc32(datos, zlib.crc32(tipo)) & 0xFFFFFFFF))
+
+    def escribir(self, franja):
+        np = self._np
+        filas = np.asarray(franja.convert(self._modo), dtype=np.uint8).reshape(franja.height, -1)
+        filtradas = np.empty((filas.shape[0], filas.shape[1] + 1), dtype=np.uint8)
+        filtradas[:, 0] = 2  # Filtro "Up": cada byte menos el de la fila anterior
+        filtradas[0, 1:] = filas[0] - self._fila_anterior
+        filtradas[1:, 1:] = filas[1:] - filas[:-1]
+        self._fila_anterior = filas[-1].copy()
+        comprimido = self._zlib.compress(filtradas.tobytes())
+        if comprimido:
+            self._chunk(b"IDAT", comprimido)
+
+    def cerrar(self):
+        if self._f.closed:
+            return
+        resto = self._zlib.flush()
+        if resto:
+            self._chunk(b"IDAT", resto)
+        self._chunk(b"IEND", b"")
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+def eliminar_fondo_por_franjas(ruta_archivo, ruta_salida, sesion, ajustes, medidor):
+    """
+    Calcula la máscara a resolución acotada y escribe la salida PNG
+    franja a franja: cada franja amplía solo su trozo de máscara, le
+    aplica el alfa y se comprime. Aparte de las franjas, la única
+    copia a tamaño completo es la imagen original decodificada (y ni
+    eso con formato "mascara"). En JPEG la copia reducida sale
+    directamente del decodificador con draft(). Con orientación EXIF
+    se orientan las dos, la copia reducida y la original (girar esta
+    exige una segunda copia completa mientras dura el giro).
+    Devuelve una vista previa pequeña en lugar de la imagen completa.
+    """
+    solo_mascara = ajustes.get("formato") == "mascara"
+    lado = ajustes.get("lado_mascara") or LADO_MASCARA_POR_DEFECTO
+
+    with medidor.etapa("decodificar"):
+        with Image.open(ruta_archivo) as im:
+            orientacion = im.getexif().get(ORIENTACION_EXIF, 1)
+            ancho, alto = im.size
+            im.draft("RGB", (lado, lado))
+            reducida = orientar(im.convert("RGB"))
+        if orientacion in ORIENTACIONES_GIRADAS:
+            ancho, alto = alto, ancho
+        reducida.thumbnail((lado, lado), RESAMPLE_REDUCIR)
+
+    with medidor.etapa("inferencia"):
+        mascara_reducida = remove(reducida, session=sesion, only_mask=True).convert("L")
+
+    with medidor.etapa("guardar"):
+        tabla = _tabla_refinado()
+        filas = filas_por_franja(ancho, ajustes["memoria_max_mb"])
+        escala_y = mascara_reducida.height / alto
+        modo = "L" if solo_mascara else "RGBA"
+        nivel = ajustes.get("compresion_png", COMPRESION_PNG_POR_DEFECTO)
+        original = None
+        try:
+            if not solo_mascara:
+                original = Image.open(ruta_archivo)
+                if orientacion != 1:
+                    with original:
+                        original = orientar(original)
+            with EscritorPNGPorFranjas(ruta_salida, ancho, alto, modo, nivel) as escritor:
+                for y0 in range(0, alto, filas):
+                    y1 = min(alto, y0 + filas)
+                    caja = (0, y0 * escala_y, mascara_reducida.width, y1 * escala_y)
+                    mascara = mascara_reducida.resize(
+                        (ancho, y1 - y0), RESAMPLE_AMPLIAR, box=caja
+                    ).point(tabla)
+                    if solo_mascara:
+                        escritor.escribir(mascara)
+                    else:
+                        franja = original.crop((0, y0, ancho, y1)).convert("RGBA")
+                        franja.putalpha(mascara)
+                        escritor.escribir(franja)
+        finally:
+            if original is not None:
+                original.close()
+
+    # Vista previa a partir de las copias reducidas (sin tocar la full-res)
+    mascara_previa = mascara_reducida.point(tabla)
+    if solo_mascara:
+        vista_previa = mascara_previa
+    else:
+        vista_previa = reducida.convert("RGBA")
+        vista_previa.putalpha(mascara_previa)
+    vista_previa.thumbnail((LADO_VISTA_PREVIA, LADO_VISTA_PREVIA), RESAMPLE_REDUCIR)
+    return vista_previa
+
+# --------------------------------------------------
+#   Procesamiento de una imagen
+# --------------------------------------------------
+# Rutas ya entregadas en este proceso (aún pueden no existir en disco)
+_rutas_reservadas = set()
+_rutas_lock = threading.Lock()
+
+def generar_ruta_salida(ruta_entrada=None, extension="png", carpeta=None):
+    """
+    Ruta de salida basada en fecha/hora dentro de carpeta (por defecto
+    OUTPUT_DIR, que se crea si no existe). En lotes se añade el nombre
+    del archivo original. Si esa ruta ya existe o ya se entregó (dos
+    entradas con el mismo nombre en el mismo segundo), se añade _2, _3...
+    """
+    carpeta = carpeta or OUTPUT_DIR
+    os.makedirs(carpeta, exist_ok=True)
+    ahora = datetime.now().strftime("%Y%m%d_%H%M%S")
+    if ruta_entrada:
+        nombre_base = os.path.splitext(os.path.basename(ruta_entrada))[0]
+        base = os.path.join(carpeta, f"{ahora}_{nombre_base}")
+    else:
+        base = os.path.join(carpeta, ahora)
+    with _rutas_lock:
+        ruta, n = f"{base}.{extension}", 1
+        while ruta in _rutas_reservadas or os.path.exists(ruta):
+            n += 1
+            ruta = f"{base}_{n}.{extension}"
+        _rutas_reservadas.add(ruta)
+    return ruta
+
+def reutilizar_de_cache(clave, extension, ruta_salida=None, destino_pedido=True):
+    """
+    Si la clave está en la caché, copia el recorte a ruta_salida. La
+    salida anterior solo se reutiliza tal cual si no se pidió destino
+    (sin ruta_salida, o con destino_pedido=False cuando ruta_salida es
+    solo el nombre por defecto). Devuelve (ruta en caché, ruta de
+    salida), o (None, None) si no hay acierto.
+    """
+    ruta_cache = cache_resultados.obtener(clave, extension)
+    if not ruta_cache:
+        return None, None
+    ruta_previa = cache_resultados.salida_previa(clave)
+    if ruta_previa and (not ruta_salida or not destino_pedido
+                        or os.path.abspath(ruta_previa) == os.path.abspath(ruta_salida)):
+        return ruta_cache, ruta_previa
+    ruta_salida = ruta_salida or generar_ruta_salida(extension=extension)
+    shutil.copyfile(ruta_cache, ruta_salida)
+    cache_resultados.registrar_salida(clave, ruta_salida)
+    return ruta_cache, ruta_salida
+
+def eliminar_fondo_archivo(ruta_archivo, sesion, modelo, ajustes=None, ruta_salida=None,
+                           medidor=None, destino_pedido=True):
+    """
+    Lee el archivo, elimina el fondo con la sesión indicada y guarda el
+    resultado. Si la misma entrada ya se procesó con el mismo modelo y
+    ajustes, reutiliza el recorte de la caché sin inferencia.
+    Ajustes admitidos:
+      - "lado_mascara": si se indica, la máscara se calcula sobre una
+        copia reducida a ese lado mayor (ver calcular_mascara_baja_resolucion).
+      - "formato": "png", "webp" o "mascara".
+      - "compresion_png": nivel de compresión PNG de 0 a 9.
+      - "memoria_max_mb": activa el modo por franjas con ese techo de
+        memoria (ver eliminar_fondo_por_franjas). No aplica a "webp",
+        que no se puede escribir por partes.
+    El medidor (MedidorEtapas) registra el tiempo de cada etapa.
+    Devuelve (imagen full-res, ruta de salida, acierto de caché). En el
+    modo por franjas la imagen es solo una vista previa, o None si
+    vino de la caché.
+    """
+    ajustes = ajustes or {}
+    extension = extension_salida(ajustes)
+    medidor = medidor or MedidorEtapas(ruta_archivo)
+    por_franjas = bool(ajustes.get("memoria_max_mb")) and ajustes.get("formato") != "webp"
+
+    # 1) Leer bytes originales (en el modo por franjas solo se calcula el hash)
+    with medidor.etapa("leer"):
+        if por_franjas:
+            clave = cache_resultados.clave_archivo(ruta_archivo, modelo, ajustes)
+        else:
+            with open(ruta_archivo, "rb") as f:
+                datos_originales = f.read()
+            clave, clave_mascara = cache_resultados.claves(datos_originales, modelo, ajustes)
+
+    ruta_cache, ruta_reutilizada = reutilizar_de_cache(clave, extension, ruta_salida, destino_pedido)
+    if ruta_cache:
+        medidor.desde_cache = True
+        if por_franjas:
+            return None, ruta_reutilizada, True
+        return Image.open(ruta_cache), ruta_reutilizada, True
+
+    if por_franjas:
+        ruta_salida = ruta_salida or generar_ruta_salida(extension=extension)
+        vista_previa = eliminar_fondo_por_franjas(ruta_archivo, ruta_salida, sesion, ajustes, medidor)
+        cache_resultados.guardar(clave, ruta_salida)
+        return vista_previa, ruta_salida, False
+
+    # 2) Decodificar la entrada una sola vez (si la máscara ya se calculó
+    #    para otro formato, se reutiliza y no hace falta el modelo)
+    with medidor.etapa("decodificar"):
+        mascara = cache_resultados.obtener_mascara(clave_mascara)
+        original = decodificar(datos_originales)
+
+    # 3) Eliminar fondo (puede tardar) reutilizando la sesión del modelo
+    with medidor.etapa("inferencia"):
+        imagen_full = calcular_recorte(original, sesion, ajustes, mascara)
+
+    # 4) Codificar y guardar una sola vez, y registrar en la caché junto a su máscara
+    with medidor.etapa("guardar"):
+        ruta_salida = ruta_salida or generar_ruta_salida(extension=extension)
+        guardar_resultado(imagen_full, ruta_salida, ajustes)
+        cache_resultados.guardar(clave, ruta_salida)
+        if mascara is None:
+            cache_resultados.guardar_mascara(clave_mascara, extraer_mascara(imagen_full))
+    return imagen_full, ruta_salida, False
+
+# --------------------------------------------------
+#   Recomposición sobre fondos nuevos (sin modelo)
+# --------------------------------------------------
+# Un fondo puede ser "transparente", un color por nombre o "#RRGGBB",
+# o la ruta de una imagen (se escala y recorta para cubrir el recorte)
+COLORES_FONDO = {
+    "blanco": (255, 255, 255),
+    "negro": (0, 0, 0),
+    "gris": (128, 128, 128),
+}
+
+def interpretar_fondo(fondo):
+    """
+    Devuelve None (transparente), una tupla RGB o la ruta de una imagen.
+    """
+    if fondo is None or isinstance(fondo, tuple):
+        return fondo
+    texto = fondo.strip()
+    if texto.lower() in ("", "transparente"):
+        return None
+    if texto.lower() in COLORES_FONDO:
+        return COLORES_FONDO[texto.lower()]
+    if os.path.isfile(texto):
+        return texto
+    hexa = texto.lstrip("#")
+    if len(hexa) == 6:
+        try:
+            return tuple(int(hexa[i:i + 2], 16) for i in (0, 2, 4))
+        except ValueError:
+            pass
+    raise ValueError(f"Fondo no válido: {fondo}")
+
+def nombre_fondo(fondo):
+    """
+    Sufijo del archivo de salida para cada fondo.
+    """
+    if fondo is None:
+        return "transparente"
+    if isinstance(fondo, tuple):
+        return "{:02x}{:02x}{:02x}".format(*fondo)
+    return os.path.splitext(os.path.basename(fondo))[0]
+
+def componer(original, mascara, fondo):
+    """
+    Mezcla el original sobre el fondo usando la máscara como alfa,
+    en enteros de 16 bits con NumPy: out = (fg·a + bg·(255 - a)) / 255.
+    fondo es el resultado de interpretar_fondo() o un array HxWx3 ya
+    preparado. Sin fondo devuelve el recorte RGBA.
+    """
+    if fondo is None:
+        recorte = original.convert("RGBA")
+        recorte.putalpha(mascara)
+        return recorte
+
+    import numpy as np
+    primer_plano = np.asarray(original.convert("RGB"), dtype=np.uint16)
+    alfa = np.asarray(mascara, dtype=np.uint16)[..., None]
+    if isinstance(fondo, str):
+        fondo = preparar_fondo(fondo, original.size)
+    fondo = np.asarray(fondo, dtype=np.uint16)
+
+    mezcla = primer_plano * alfa
+    mezcla += fondo * (255 - alfa)
+    mezcla += 127
+    mezcla //= 255
+    return Image.fromarray(mezcla.astype(np.uint8), "RGB")
+
+def preparar_fondo(ruta, tam):
+    """
+    Decodifica la imagen de fondo y la ajusta a tam cubriéndolo por
+    completo (escala y recorte centrado). Devuelve un array HxWx3.
+    """
+    import numpy as np
+    with Image.open(ruta) as fondo:
+        return np.asarray(ImageOps.fit(fondo.convert("RGB"), tam, RESAMPLE_AMPLIAR))
+
+def mascara_archivo(ruta_archivo, gestor, ajustes=None):
+    """
+    Devuelve (original, máscara, acierto de caché) de una imagen. Solo
+    pide la sesión al gestor (GestorSesion) y ejecuta el modelo si su
+    máscara no está en la caché.
+    """
+    ajustes = {k: v for k, v in (ajustes or {}).items() if k == "lado_mascara"}
+    with open(ruta_archivo, "rb") as f:
+        datos = f.read()
+    _, clave_mascara = cache_resultados.claves(datos, gestor.identidad, ajustes)
+    original = decodificar(datos)
+
+    mascara = cache_resultados.obtener_mascara(clave_mascara)
+    if mascara is not None:
+        return original, mascara, True
+    mascara = calcular_recorte(original, gestor.obtener(), {**ajustes, "formato": "mascara"})
+    cache_resultados.guardar_mascara(clave_mascara, mascara)
+    return original, mascara, False
+
+def componer_fondos(ruta_archivo, fondos, gestor=None, ajustes=None, carpeta=None):
+    """
+    Exporta la imagen sobre cada fondo de la lista con una sola
+    máscara: como mucho una inferencia (ninguna si ya estaba en la
+    caché) y una mezcla por fondo. Los fondos opacos se guardan en
+    RGB. Devuelve (rutas de salida, acierto de caché de la máscara).
+    """
+    gestor = gestor or GestorSesion()
+    ajustes = dict(ajustes or {})
+    if ajustes.get("formato") not in ("png", "webp"):
+        ajustes["formato"] = FORMATO_POR_DEFECTO
+    extension = extension_salida(ajustes)
+    fondos = [interpretar_fondo(f) for f in fondos]
+
+    original, mascara, desde_cache = mascara_archivo(ruta_archivo, gestor, ajustes)
+    base = os.path.splitext(generar_ruta_salida(ruta_archivo, extension, carpeta))[0]
+    rutas = []
+    for fondo in fondos:
+        ruta_salida = f"{base}_{nombre_fondo(fondo)}.{extension}"
+        guardar_resultado(componer(original, mascara, fondo), ruta_salida, ajustes)
+        rutas.append(ruta_salida)
+    return rutas, desde_cache
+
+# --------------------------------------------------
+#   Pipeline por etapas (un solo proceso)
+# --------------------------------------------------
+# Imágenes que pueden esperar entre dos etapas (acota la memoria)
+PROFUNDIDAD_COLAS = 4
+ESCRITORES_POR_DEFECTO = max(1, min(4, (os.cpu_count() or 2) // 2))
+_FIN = object()
+
+def procesar_pipeline(rutas, sesion, modelo, ajustes=None, carpeta=None,
+                      al_terminar_imagen=None, escritores=ESCRITORES_POR_DEFECTO,
+                      profundidad=PROFUNDIDAD_COLAS):
+    """
+    Procesa las imágenes en tres etapas solapadas unidas por colas
+    acotadas: un hilo lector (lee, consulta la caché y decodifica), la
+    inferencia en el hilo que llama y varios hilos que codifican y
+    guardan. Mientras el modelo trabaja en una imagen, la siguiente ya
+    se está decodificando y las anteriores guardando, así que el ritmo
+    se acerca al de la inferencia sola. No admite el modo por franjas.
+    al_terminar_imagen(ruta, registro, error) se llama desde el hilo
+    que termina cada imagen.
+    """
+    ajustes = ajustes or {}
+    extension = extension_salida(ajustes)
+    cola_inferencia = queue.Queue(maxsize=profundidad)
+    cola_escritura = queue.Queue(maxsize=profundidad)
+
+    def terminar(ruta, medidor, error=None):
+        if al_terminar_imagen:
+            al_terminar_imagen(ruta, None if error else medidor.registro(), error)
+
+    def lector():
+        try:
+            for ruta in rutas:
+                medidor = MedidorEtapas(ruta)
+                try:
+                    ruta_salida = generar_ruta_salida(ruta, extension, carpeta)
+                    with medidor.etapa("leer"):
+                        with open(ruta, "rb") as f:
+                            datos = f.read()
+                        clave, clave_mascara = cache_resultados.claves(datos, modelo, ajustes)
+                    if reutilizar_de_cache(clave, extension, ruta_salida, carpeta is not None)[0]:
+                        medidor.desde_cache = True
+                        terminar(ruta, medidor)
+                        continue
+                    with medidor.etapa("decodificar"):
+                        mascara = cache_resultados.obtener_mascara(clave_mascara)
+                        original = decodificar(datos)
+                    cola_inferencia.put(
+                        (ruta, medidor, (clave, clave_mascara), ruta_salida, original, mascara)
+                    )
+                except Exception as e:
+                    terminar(ruta, medidor, e)
+        finally:
+            cola_inferencia.put(_FIN)
+
+    def escritor():
+        while True:
+            item = cola_escritura.get()
+            if item is _FIN:
+                return
+            ruta, medidor, (clave, clave_mascara), ruta_salida, imagen, mascara_nueva = item
+            try:
+                with medidor.etapa("guardar"):
+                    guardar_resultado(imagen, ruta_salida, ajustes)
+                    cache_resultados.guardar(clave, ruta_salida)
+                    if mascara_nueva:
+                        cache_resultados.guardar_mascara(clave_mascara, extraer_mascara(imagen))
+                terminar(ruta, medidor)
+            except Exception as e:
+                terminar(ruta, medidor, e)
+
+    hilo_lector = threading.Thread(target=lector, daemon=True)
+    hilo_lector.start()
+    hilos_escritores = [threading.Thread(target=escritor, daemon=True) for _ in range(escritores)]
+    for hilo in hilos_escritores:
+        hilo.start()
+
+    try:
+        while True:
+            item = cola_inferencia.get()
+            if item is _FIN:
+                break
+            ruta, medidor, claves, ruta_salida, original, mascara = item
+            try:
+                with medidor.etapa("inferencia"):
+                    imagen = calcular_recorte(original, sesion, ajustes, mascara)
+            except Exception as e:
+                terminar(ruta, medidor, e)
+                continue
+            cola_escritura.put((ruta, medidor, claves, ruta_salida, imagen, mascara is None))
+    finally:
+        for _ in hilos_escritores:
+            cola_escritura.put(_FIN)
+        for hilo in hilos_escritores:
+            hilo.join()
+    hilo_lector.join()
+
+# --------------------------------------------------
+#   Procesamiento por lotes (pool de procesos)
+# --------------------------------------------------
+EXTENSIONES_IMAGEN = (".png", ".jpg", ".jpeg", ".bmp")
+WORKERS_POR_DEFECTO = max(1, (os.cpu_count() or 2) // 2)
+
+# Sesión propia de cada proceso del pool
+_sesion_worker = None
+_modelo_worker = None
+
+def _inicializar_worker(modelo, runtime=None):
+    """
+    Se ejecuta una vez en cada proceso del pool y crea su sesión.
+    """
+    global _sesion_worker, _modelo_worker
+    _sesion_worker = crear_sesion(modelo, runtime)
+    _modelo_worker = identidad_modelo(modelo, runtime)
+
+def _procesar_en_worker(ruta_archivo, ajustes=None, ruta_salida=None, destino_pedido=True):
+    """
+    Procesa una imagen dentro de un proceso del pool. La ruta de salida
+    se genera en el proceso principal para que no choquen dos workers.
+    Devuelve la ruta de salida y el registro de tiempos por etapa.
+    """
+    medidor = MedidorEtapas(ruta_archivo)
+    _, ruta_salida, _ = eliminar_fondo_archivo(
+        ruta_archivo, _sesion_worker, _modelo_worker, ajustes,
+        ruta_salida=ruta_salida, medidor=medidor, destino_pedido=destino_pedido
+    )
+    return ruta_salida, medidor.registro()
+
+def listar_imagenes(rutas):
+    """
+    Expande carpetas a las imágenes que contienen (sin recursión)
+    y descarta archivos con extensiones no admitidas.
+    """
+    encontradas = []
+    for ruta in rutas:
+        if os.path.isdir(ruta):
+            for nombre in sorted(os.listdir(ruta)):
+                completa = os.path.join(ruta, nombre)
+                if os.path.isfile(completa) and nombre.lower().endswith(EXTENSIONES_IMAGEN):
+                    encontradas.append(completa)
+        elif ruta.lower().endswith(EXTENSIONES_IMAGEN):
+            encontradas.append(ruta)
+    return encontradas
+
+def procesar_lote(rutas, modelo=MODELO_POR_DEFECTO, workers=1, ajustes=None, carpeta=None,
+                  al_avanzar=None, sesion=None, escritores=ESCRITORES_POR_DEFECTO, runtime=None):
+    """
+    Procesa varias imágenes. Con workers > 1 las reparte entre un pool
+    de procesos (cada uno con su propia sesión); con 1 las procesa en
+    este mismo proceso con una única sesión (la indicada o una nueva
+    del modelo) mediante procesar_pipeline, o una a una en el modo
+    por franjas. runtime son los ajustes de onnxruntime (ver
+    crear_sesion); en el pool los hilos se reparten entre procesos.
+    Tras cada imagen llama a al_avanzar(hechas, total, ruta, registro, error).
+    Devuelve (registros, errores) donde errores es una lista (ruta, excepción).
+    """
+    total = len(rutas)
+    registros = []
+    errores = []
+    lock = threading.Lock()
+    contador = [0]
+
+    def anotar(ruta, registro, error):
+        with lock:
+            contador[0] += 1
+            hechas = contador[0]
+            if error is None:
+                anotar_tiempos(registro)
+                registros.append(registro)
+            else:
+                errores.append((ruta, error))
+        if al_avanzar:
+            al_avanzar(hechas, total, ruta, registro, error)
+
+    identidad = identidad_modelo(modelo, runtime)
+
+    if workers <= 1 and not (ajustes or {}).get("memoria_max_mb"):
+        procesar_pipeline(
+            rutas, sesion or crear_sesion(modelo, runtime), identidad, ajustes, carpeta,
+            al_terminar_imagen=anotar, escritores=escritores
+        )
+        return registros, errores
+
+    if workers <= 1:
+        sesion = sesion or crear_sesion(modelo, runtime)
+        for ruta in rutas:
+            medidor = MedidorEtapas(ruta)
+            try:
+                eliminar_fondo_archivo(
+                    ruta, sesion, identidad, ajustes,
+                    ruta_salida=generar_ruta_salida(ruta, extension_salida(ajustes or {}), carpeta),
+                    medidor=medidor, destino_pedido=carpeta is not None
+                )
+                anotar(ruta, medidor.registro(), None)
+            except Exception as e:
+                anotar(ruta, None, e)
+        return registros, errores
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_inicializar_worker,
+        initargs=(modelo, repartir_hilos(runtime, workers))
+    ) as pool:
+        extension = extension_salida(ajustes or {})
+        futuros = {
+            pool.submit(
+                _procesar_en_worker, ruta, ajustes,
+                generar_ruta_salida(ruta, extension, carpeta), carpeta is not None
+            ): ruta
+            for ruta in rutas
+        }
+        for futuro in as_completed(futuros):
+            ruta = futuros[futuro]
+            try:
+                _, registro = futuro.result()
+                anotar(ruta, registro, None)
+            except Exception as e:
+                anotar(ruta, None, e)
+    return registros, errores
+
+# --------------------------------------------------
+#   Línea de comandos
+# --------------------------------------------------
+def crear_parser():
+    parser = argparse.ArgumentParser(
+        prog="bgcore",
+        description="Elimina el fondo de imágenes sin interfaz gráfica."
+    )
+    parser.add_argument("input", nargs="*", help="Imágenes o carpetas de entrada")
+    parser.add_argument("-o", "--output", default=None,
+                        help=f"Carpeta de salida (por defecto: {OUTPUT_DIR})")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Procesos en paralelo, cada uno con su sesión (por defecto: 1)")
+    parser.add_argument("--writers", type=int, default=ESCRITORES_POR_DEFECTO,
+                        help="Hilos que codifican y guardan en el pipeline de un proceso "
+                             f"(por defecto: {ESCRITORES_POR_DEFECTO})")
+    parser.add_argument("--model", default=MODELO_POR_DEFECTO, choices=MODELOS_DISPONIBLES,
+                        help=f"Modelo de rembg (por defecto: {MODELO_POR_DEFECTO})")
+    parser.add_argument("--format", default=FORMATO_POR_DEFECTO, choices=list(EXTENSIONES_SALIDA),
+                        help="Formato de salida")
+    parser.add_argument("--png-compression", type=int, default=None, choices=range(10),
+                        metavar="0-9", help="Nivel de compresión PNG")
+    parser.add_argument("--fast-mask", nargs="?", type=int, const=LADO_MASCARA_POR_DEFECTO,
+                        default=None, metavar="LADO",
+                        help="Calcula la máscara a baja resolución (lado mayor en px)")
+    parser.add_argument("--max-memory", type=int, default=None, metavar="MB",
+                        help="Modo por franjas: procesa con un techo de memoria (PNG y máscara)")
+    parser.add_argument("--backgrounds", nargs="+", default=None, metavar="FONDO",
+                        help="Exporta cada imagen sobre estos fondos (transparente, blanco, "
+                             "#RRGGBB o una imagen) con una sola máscara")
+    parser.add_argument("--intra-threads", type=int, default=None, metavar="N",
+                        help="Hilos intra-op de onnxruntime por sesión")
+    parser.add_argument("--inter-threads", type=int, default=None, metavar="N",
+                        help="Hilos inter-op de onnxruntime por sesión")
+    parser.add_argument("--graph-opt", default=None, choices=list(NIVELES_OPTIMIZACION),
+                        help="Nivel de optimización del grafo de onnxruntime")
+    parser.add_argument("--model-path", default=None, metavar="ONNX",
+                        help="Modelo .onnx local (p. ej. cuantizado a int8); no descarga nada")
+    parser.add_argument("--calibrate", action="store_true",
+                        help="Mide hilos y optimización en esta máquina y guarda los más rápidos")
+    parser.add_argument("--timings", default=None, metavar="ARCHIVO",
+                        help="Exporta los tiempos por imagen a CSV o JSON")
+    parser.add_argument("--clear-cache", action="store_true",
+                        help="Vacía la caché de resultados")
+    return parser
+
+def ajustes_desde_args(args):
+    ajustes = {"formato": args.format}
+    if args.png_compression is not None:
+        ajustes["compresion_png"] = args.png_compression
+    if args.fast_mask:
+        ajustes["lado_mascara"] = args.fast_mask
+    if args.max_memory:
+        ajustes["memoria_max_mb"] = args.max_memory
+    return ajustes
+
+def runtime_desde_args(args):
+    """
+    Ajustes de onnxruntime pedidos en la línea de comandos; lo que no
+    se indique sale de la calibración guardada para esta máquina.
+    """
+    runtime = cargar_runtime_calibrado(args.model, args.model_path)
+    if args.model_path:
+        runtime["ruta_modelo"] = args.model_path
+    if args.intra_threads:
+        runtime["hilos_intra"] = args.intra_threads
+    if args.inter_threads:
+        runtime["hilos_inter"] = args.inter_threads
+    if args.graph_opt:
+        runtime["optimizacion"] = args.graph_opt
+    return runtime
+
+def componer_desde_args(args, rutas):
+    """
+    Modo --backgrounds: una máscara por imagen y una mezcla por fondo.
+    La sesión solo se crea si alguna máscara no está en la caché.
+    """
+    gestor = GestorSesion(args.model, runtime_desde_args(args))
+    ajustes = ajustes_desde_args(args)
+    errores = 0
+    inicio = time.perf_counter()
+    for i, ruta in enumerate(rutas, 1):
+        nombre = os.path.basename(ruta)
+        try:
+            t0 = time.perf_counter()
+            salidas, desde_cache = componer_fondos(ruta, args.backgrounds, gestor, ajustes, args.output)
+            origen = "máscara en caché" if desde_cache else "máscara nueva"
+            print(f"[{i}/{len(rutas)}] {nombre}: {len(salidas)} fondos en "
+                  f"{time.perf_counter() - t0:.2f} s ({origen})")
+        except Exception as e:
+            errores += 1
+            print(f"[{i}/{len(rutas)}] {nombre}: error: {e}", file=sys.stderr)
+    print(f"{len(rutas) - errores}/{len(rutas)} imágenes en {time.perf_counter() - inicio:.1f} s")
+    return 1 if errores else 0
+
+def main(argv=None):
+    args = crear_parser().parse_args(argv)
+
+    if args.clear_cache:
+        liberados = cache_resultados.limpiar()
+        print(f"Caché vaciada ({liberados / 1024 ** 2:.1f} MB liberados)")
+        if not args.input:
+            return 0
+
+    if args.calibrate:
+        def al_probar(runtime, segundos):
+            print(f"  intra={runtime['hilos_intra']} optimizacion={runtime['optimizacion']}: "
+                  f"{segundos * 1000:.0f} ms")
+        mejor = calibrar_runtime(args.model, args.model_path, al_probar=al_probar)
+        print(f"Guardado en {RUNTIME_CALIBRADO}: intra={mejor['hilos_intra']} "
+              f"optimizacion={mejor['optimizacion']}")
+        if not args.input:
+            return 0
+
+    rutas = listar_imagenes(args.input)
+    if not rutas:
+        print("No se encontraron imágenes para procesar.", file=sys.stderr)
+        return 1
+
+    if args.backgrounds:
+        return componer_desde_args(args, rutas)
+
+    def al_avanzar(hechas, total, ruta, registro, error):
+        nombre = os.path.basename(ruta)
+        if error is None:
+            print(f"[{hechas}/{total}] {nombre}: {registro['total']:.2f} s")
+        else:
+            print(f"[{hechas}/{total}] {nombre}: error: {error}", file=sys.stderr)
+
+    inicio = time.perf_counter()
+    registros, errores = procesar_lote(
+        rutas, args.model, max(1, min(args.workers, len(rutas))),
+        ajustes_desde_args(args), args.output, al_avanzar,
+        escritores=max(1, args.writers), runtime=runtime_desde_args(args)
+    )
+    transcurrido = time.perf_counter() - inicio
+    ritmo = len(rutas) / transcurrido if transcurrido > 0 else 0.0
+    print(f"{len(registros)}/{len(rutas)} imágenes en {transcurrido:.1f} s ({ritmo:.2f} img/s)")
+
+    if args.timings:
+        exportar_tiempos(args.timings)
+    return 1 if errores else 0
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -1,108 +1,295 @@
+import time
+
+# Instante de arranque para medir el tiempo hasta la primera ventana
+T_INICIO = time.perf_counter()
+
 import os
-import sys
 import threading
-import io
+import multiprocessing
 import tkinter as tk
-from tkinter import filedialog, messagebox, ttk
+from tkinter import filedialog, messagebox, ttk, colorchooser
 from PIL import Image, ImageTk
-from rembg import remove
-from datetime import datetime
+from bgcore import (
+    resource_path, OUTPUT_DIR, MODELOS_DISPONIBLES, GestorSesion, cache_resultados,
+    LADO_MASCARA_POR_DEFECTO, MEMORIA_MAXIMA_MB_POR_DEFECTO, ETAPAS, MedidorEtapas, registro_tiempos, anotar_tiempos,
+    exportar_tiempos, medias_por_etapa, eliminar_fondo_archivo, WORKERS_POR_DEFECTO,
+    listar_imagenes, procesar_lote, componer_fondos
+)
 
 # --------------------------------------------------
-#   Función para obtener la ruta de recursos 
-#   (imágenes, .exe, .ico) tanto en modo script 
-#   como en modo PyInstaller
+#   Estado de la ventana (el procesamiento vive en
+#   bgcore.py, que no depende de tkinter)
 # --------------------------------------------------
-def resource_path(filename):
-    if getattr(sys, "frozen", False):
-        base_path = sys._MEIPASS
-    else:
-        base_path = os.path.dirname(os.path.abspath(__file__))
-    return os.path.join(base_path, filename)
+# Guardaremos la imagen 'full' en memoria para poder redibujarla si la ventana cambia de tamaño
+current_image_full = None
+# Lado mayor de la pantalla: la pirámide no guarda niveles más grandes
+lado_pantalla = 4096
+# Última imagen de entrada procesada (para recomponerla sobre otro fondo)
+ultima_entrada = None
+
+# Sesión de rembg compartida por todas las imágenes sueltas
+gestor_sesion = GestorSesion()
+
+# El modelo se carga en segundo plano al mostrarse la ventana; lo que
+# el usuario pida antes de que esté listo se encola aquí
+modelo_listo = threading.Event()
+solicitudes_pendientes = []
+
+# Segundos desde el arranque hasta la primera ventana y hasta el modelo listo
+metricas_arranque = {}
+
+# Opciones de salida que se muestran en la ventana
+OPCIONES_SALIDA = {
+    "PNG": {"formato": "png"},
+    "PNG rápido": {"formato": "png", "compresion_png": 1},
+    "WebP sin pérdida": {"formato": "webp"},
+    "Solo máscara": {"formato": "mascara"},
+}
 
 # --------------------------------------------------
-#   Variables y carpetas para guardar resultados
+#   Visor del resultado con pirámide de vistas previas
 # --------------------------------------------------
-SCRIPT_DIR = resource_path("")  
-OUTPUT_DIR = os.path.join(SCRIPT_DIR, "Yuuruii PNGS")
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-
-# Evento para notificar al hilo principal cuando termine el procesamiento
-done_event = threading.Event()
-
-# Guardaremos la imagen 'full' en memoria para poder redibujarla si la ventana cambia de tamaño
-current_image_full = None
+try:
+    RESAMPLE_VISTA = Image.Resampling.LANCZOS
+except AttributeError:
+    RESAMPLE_VISTA = Image.LANCZOS
+
+# Nivel más pequeño que se guarda en la pirámide
+LADO_MINIMO_PIRAMIDE = 256
+# Espera tras el último <Configure> antes de reescalar
+RETARDO_REESCALADO_MS = 120
+# Margen para que la imagen no empuje el tamaño de la etiqueta
+MARGEN_VISOR = 8
+
+class PiramideVistaPrevia:
+    """
+    Copias del resultado a la mitad, la cuarta parte, etc. hasta
+    LADO_MINIMO_PIRAMIDE. Los niveles mayores que la pantalla no se
+    guardan (basta con el primero que aún la cubre), así que un recorte
+    de 40 MP no se vuelve a tocar al redimensionar. El alfa se guarda
+    premultiplicado para que los bordes no se oscurezcan al reducir.
+    """
+    def __init__(self, imagen, lado_maximo=None):
+        if imagen.mode == "RGBA":
+            imagen = imagen.convert("RGBa")
+        elif imagen.mode not in ("RGB", "L", "RGBa"):
+            imagen = imagen.convert("RGBA").convert("RGBa")
+        self.tam_original = imagen.size
+        niveles = [imagen]
+        while max(niveles[-1].size) > LADO_MINIMO_PIRAMIDE:
+            niveles.append(niveles[-1].reduce(2))
+        if lado_maximo:
+            # El último nivel que aún cubre la pantalla y todos los menores
+            cubren = [i for i, nivel in enumerate(niveles) if max(nivel.size) >= lado_maximo]
+            if cubren:
+                niveles = niveles[cubren[-1]:]
+        self.niveles = niveles
+
+    def tam_ajustado(self, caja):
+        """
+        Tamaño que cabe en caja (ancho, alto) manteniendo la proporción,
+        sin ampliar por encima del original.
+        """
+        ancho, alto = self.tam_original
+        escala = min(caja[0] / ancho, caja[1] / alto, 1.0)
+        return max(1, round(ancho * escala)), max(1, round(alto * escala))
+
+    def escalar(self, tam):
+        """
+        Reduce desde el nivel más pequeño que aún cubre tam.
+        """
+        nivel = next(
+            (n for n in reversed(self.niveles) if n.width >= tam[0] and n.height >= tam[1]),
+            self.niveles[0]
+        )
+        if nivel.size != tam:
+            nivel = nivel.resize(tam, RESAMPLE_VISTA)
+        return nivel.convert("RGBA") if nivel.mode == "RGBa" else nivel
+
+class VisorResultado:
+    """
+    Ajusta la imagen de la etiqueta al espacio disponible. Los eventos
+    <Configure> se agrupan (RETARDO_REESCALADO_MS) y el reescalado se
+    hace en un hilo aparte; en el hilo principal solo se crea la
+    PhotoImage. Si llega un tamaño nuevo antes de terminar, el
+    resultado anterior se descarta.
+    """
+    def __init__(self, root, label):
+        self.root = root
+        self.label = label
+        self.piramide = None
+        self._pendiente = None
+        self._generacion = 0
+        self._tam_mostrado = None
+        label.bind("<Configure>", lambda event: self._programar(RETARDO_REESCALADO_MS))
+
+    def mostrar(self, piramide):
+        self.piramide = piramide
+        self._tam_mostrado = None
+        self._programar(0)
+
+    def limpiar(self):
+        self.piramide = None
+        self._generacion += 1
+        self._tam_mostrado = None
+        self.label.config(image="")
+        self.label.image = None
+
+    def _programar(self, retardo):
+        if self._pendiente is not None:
+            self.root.after_cancel(self._pendiente)
+        self._pendiente = self.root.after(retardo, self._reescalar)
+
+    def _reescalar(self):
+        self._pendiente = None
+        if self.piramide is None:
+            return
+        caja = (self.label.winfo_width() - MARGEN_VISOR, self.label.winfo_height() - MARGEN_VISOR)
+        if caja[0] < 1 or caja[1] < 1:
+            return
+        tam = self.piramide.tam_ajustado(caja)
+        if tam == self._tam_mostrado:
+            return
+        self._generacion += 1
+        threading.Thread(
+            target=self._escalar_en_segundo_plano,
+            args=(self.piramide, tam, self._generacion),
+            daemon=True
+        ).start()
+
+    def _escalar_en_segundo_plano(self, piramide, tam, generacion):
+        imagen = piramide.escalar(tam)
+        self.root.after(0, lambda: self._aplicar(imagen, tam, generacion))
+
+    def _aplicar(self, imagen, tam, generacion):
+        if generacion != self._generacion:
+            return
+        tk_img = ImageTk.PhotoImage(imagen)
+        self.label.config(image=tk_img)
+        self.label.image = tk_img
+        self._tam_mostrado = tam
 
 # --------------------------------------------------
 #   Funciones de procesamiento en segundo plano
 # --------------------------------------------------
-def procesar_en_segundo_plano(ruta_archivo):
+def procesar_en_segundo_plano(ruta_archivo, ajustes=None):
     """
-    Lee los bytes, elimina el fondo con rembg, crea miniatura,
-    guarda la imagen y notifica al hilo principal.
+    Lee los bytes, elimina el fondo con rembg, prepara la pirámide de
+    vistas previas, guarda la imagen y notifica al hilo principal. Cada etapa
+    avisa a la barra de progreso al empezar y al terminar.
     """
-    global current_image_full
+    global current_image_full, ultima_entrada
+    medidor = MedidorEtapas(
+        ruta_archivo,
+        al_avanzar=lambda p, etapa: root.after(0, lambda: actualizar_etapa(p, etapa))
+    )
     try:
-        # 1) Leer bytes originales
-        with open(ruta_archivo, "rb") as f:
-            datos_originales = f.read()
+        # 1-4) Leer, decodificar, eliminar fondo (o tomarlo de la caché) y guardar
+        imagen_full, ruta_salida, desde_cache = eliminar_fondo_archivo(
+            ruta_archivo, gestor_sesion.obtener(), gestor_sesion.identidad, ajustes,
+            medidor=medidor
+        )
+        # En el modo por franjas solo llega una vista previa (o nada si vino de la caché)
+        current_image_full = imagen_full  # Guardamos la full-res
+        ultima_entrada = ruta_archivo
 
-        # 2) Eliminar fondo (puede tardar)
-        datos_sin_fondo = remove(datos_originales)
+        # 5) Crear la pirámide de vistas previas para el visor
+        piramide = None
+        if imagen_full is not None:
+            with medidor.etapa("miniatura"):
+                piramide = PiramideVistaPrevia(imagen_full, lado_pantalla)
+        medidor.terminar()
+        registro = medidor.registro()
+        anotar_tiempos(registro)
 
-        # 3) Convertir a PIL.Image (full-res)
-        imagen_full = Image.open(io.BytesIO(datos_sin_fondo)).convert("RGBA")
-        current_image_full = imagen_full  # Guardamos la full-res
+        # 6) Notificar al hilo principal
+        root.after(0, lambda: finalizar_proceso(piramide, ruta_salida, desde_cache, registro))
 
-        # 4) Crear miniatura (300×300) para que quepa en ventana inicial de 800×350
-        mini = imagen_full.copy()
-        try:
-            resample = Image.Resampling.LANCZOS
-        except AttributeError:
-            resample = Image.LANCZOS
-        mini.thumbnail((300, 300), resample)
+    except Exception as e:
+        root.after(0, lambda e=e: mostrar_error(e))
 
-        # 5) Guardar imagen full-res con nombre basado en fecha/hora
-        ahora = datetime.now().strftime("%Y%m%d_%H%M%S")
-        nombre_salida = f"{ahora}.png"
-        ruta_salida = os.path.join(OUTPUT_DIR, nombre_salida)
-        imagen_full.save(ruta_salida, format="PNG")
+def procesar_lote_en_segundo_plano(rutas, modelo, workers, ajustes=None):
+    """
+    Reparte las imágenes entre un pool de procesos (cada uno con su
+    propia sesión) e informa al hilo principal del avance y del
+    rendimiento por imagen y acumulado.
+    """
+    inicio = time.perf_counter()
 
-        # 6) Notificar al hilo principal
-        done_event.set()
-        root.after(0, lambda: finalizar_proceso(mini, ruta_salida))
+    def al_avanzar(hechas, total, ruta, registro, error):
+        segundos = registro["total"] if registro else None
+        transcurrido = time.perf_counter() - inicio
+        root.after(0, lambda: actualizar_lote(hechas, total, ruta, segundos, transcurrido))
 
+    try:
+        sesion = gestor_sesion.obtener() if workers <= 1 else None
+        registros, errores = procesar_lote(
+            rutas, modelo, workers, ajustes, al_avanzar=al_avanzar, sesion=sesion,
+            runtime=gestor_sesion.runtime
+        )
     except Exception as e:
-        done_event.set()
-        root.after(0, lambda: mostrar_error(e))
+        root.after(0, lambda e=e: mostrar_error(e))
+        return
+
+    transcurrido = time.perf_counter() - inicio
+    root.after(0, lambda: finalizar_lote(len(rutas), errores, transcurrido, registros))
 
-def update_progress():
+def componer_en_segundo_plano(ruta_archivo, fondos, ajustes=None):
     """
-    Simula el llenado de la barra de progreso. 
-    Avanza mientras done_event no esté seteado.
+    Recompone la imagen sobre los fondos pedidos con la máscara de la
+    caché; el modelo solo se usa si la máscara ya no está.
     """
-    if done_event.is_set():
-        progress_bar["value"] = 100
-        # Ocultamos la barra después de un breve retardo
-        root.after(300, lambda: progress_bar.pack_forget())
-    else:
-        nuevo = progress_bar["value"] + 2
-        progress_bar["value"] = min(nuevo, 99)
-        root.after(100, update_progress)
+    try:
+        inicio = time.perf_counter()
+        rutas, desde_cache = componer_fondos(ruta_archivo, fondos, gestor_sesion, ajustes)
+        transcurrido = time.perf_counter() - inicio
+        with Image.open(rutas[-1]) as ultima:
+            piramide = PiramideVistaPrevia(ultima, lado_pantalla)
+        root.after(0, lambda: finalizar_composicion(piramide, rutas, desde_cache, transcurrido))
+    except Exception as e:
+        root.after(0, lambda e=e: mostrar_error(e))
+
+NOMBRES_ETAPAS = {
+    "leer": "Leyendo archivo",
+    "decodificar": "Decodificando",
+    "inferencia": "Eliminando fondo",
+    "guardar": "Guardando",
+    "miniatura": "Preparando vista previa",
+    "listo": "Listo",
+}
+
+def actualizar_etapa(porcentaje, etapa):
+    """
+    Mueve la barra según los avisos reales de cada etapa.
+    """
+    progress_bar["value"] = porcentaje
+    label_info.config(text=f"{NOMBRES_ETAPAS.get(etapa, etapa)}…")
 
-def finalizar_proceso(imagen_miniatura, ruta_salida):
+def finalizar_proceso(piramide, ruta_salida, desde_cache=False, registro=None):
     """
-    Muestra la miniatura, actualiza el texto y oculta la barra.
+    Muestra el resultado en el visor, actualiza el texto y oculta la barra.
     """
-    # Convertimos la miniatura a PhotoImage
-    tk_img = ImageTk.PhotoImage(imagen_miniatura)
-    label_imagen.config(image=tk_img)
-    label_imagen.image = tk_img
+    if piramide is not None:
+        visor.mostrar(piramide)
 
-    label_info.config(text=f"Imagen guardada en:\n{ruta_salida}")
+    if desde_cache:
+        label_info.config(text=f"Resultado recuperado de la caché:\n{ruta_salida}")
+    else:
+        registro = registro or {}
+        tiempos = " · ".join(
+            f"{etapa} {registro[etapa]:.2f} s" for etapa in ETAPAS if registro.get(etapa) is not None
+        )
+        label_info.config(text=f"Imagen guardada en:\n{ruta_salida}\n{tiempos}")
     if progress_bar.winfo_ismapped():
         progress_bar.pack_forget()
 
+def finalizar_composicion(piramide, rutas, desde_cache, transcurrido):
+    visor.mostrar(piramide)
+    origen = "máscara de la caché" if desde_cache else "máscara recalculada"
+    label_info.config(
+        text=f"{len(rutas)} fondo(s) en {transcurrido:.2f} s ({origen}):\n" + "\n".join(rutas)
+    )
+
 def mostrar_error(error):
     """
     Oculta la barra si está visible y muestra un mensaje de error.
@@ -112,47 +299,263 @@ def mostrar_error(error):
         progress_bar.pack_forget()
     messagebox.showerror("Error", f"No se pudo procesar la imagen:\n{error}")
 
-def seleccionar_imagen():
+def actualizar_lote(hechas, total, ruta, segundos, transcurrido):
     """
-    1) Limpia info previa.
-    2) Abre diálogo para seleccionar imagen.
-    3) Configura y muestra la barra de progreso.
-    4) Lanza el thread que procesará la imagen.
+    Avanza la barra del lote y muestra el tiempo de la última imagen
+    junto al rendimiento acumulado.
     """
-    label_info.config(text="")
-    label_imagen.config(image="")
-    label_imagen.image = None
-
-    ruta = filedialog.askopenfilename(
-        title="Seleccionar imagen",
-        filetypes=[("Archivos de imagen", "*.png;*.jpg;*.jpeg;*.bmp")]
+    progress_bar["value"] = hechas
+    nombre = os.path.basename(ruta)
+    if segundos is None:
+        ultima = f"{nombre}: error"
+    else:
+        ultima = f"{nombre}: {segundos:.2f} s"
+    ritmo = hechas / transcurrido if transcurrido > 0 else 0.0
+    label_info.config(
+        text=f"{hechas}/{total} imágenes · {ritmo:.2f} img/s\nÚltima: {ultima}"
     )
-    if not ruta:
-        return
 
-    done_event.clear()
+def finalizar_lote(total, errores, transcurrido, registros=()):
+    """
+    Oculta la barra y muestra el resumen del lote con la media de
+    cada etapa, para ver si domina la E/S o el modelo.
+    """
+    if progress_bar.winfo_ismapped():
+        progress_bar.pack_forget()
+    correctas = total - len(errores)
+    ritmo = total / transcurrido if transcurrido > 0 else 0.0
+    medias = " · ".join(f"{etapa} {seg:.2f} s" for etapa, seg in medias_por_etapa(registros).items())
+    label_info.config(
+        text=(f"Lote terminado: {correctas}/{total} imágenes en {transcurrido:.1f} s "
+              f"({ritmo:.2f} img/s)\nMedia por imagen: {medias}\nGuardadas en:\n{OUTPUT_DIR}")
+    )
+    if errores:
+        detalle = "\n".join(f"{os.path.basename(r)}: {e}" for r, e in errores[:10])
+        messagebox.showerror(
+            "Error",
+            f"No se pudieron procesar {len(errores)} imágenes:\n{detalle}"
+        )
+
+def preparar_barra(maximo):
+    """
+    Reinicia la barra de progreso y la muestra si estaba oculta.
+    """
     progress_bar["mode"] = "determinate"
-    progress_bar["maximum"] = 100
+    progress_bar["maximum"] = maximo
     progress_bar["value"] = 0
 
     if not progress_bar.winfo_ismapped():
         # Mostramos la barra de progreso ocupando todo el ancho disponible
-        progress_bar.pack(fill="x", padx=20, pady=10)
+        progress_bar.pack(fill="x", padx=20, pady=10, before=label_imagen)
+
+def limpiar_resultado():
+    label_info.config(text="")
+    visor.limpiar()
 
-    root.after(100, update_progress)
+def ajustes_actuales():
+    """
+    Ajustes de procesamiento elegidos en la ventana.
+    """
+    ajustes = dict(OPCIONES_SALIDA[salida_var.get()])
+    if baja_res_var.get():
+        ajustes["lado_mascara"] = LADO_MASCARA_POR_DEFECTO
+    if franjas_var.get():
+        ajustes["memoria_max_mb"] = MEMORIA_MAXIMA_MB_POR_DEFECTO
+    return ajustes
+
+def obtener_workers():
+    try:
+        return max(1, int(workers_var.get()))
+    except (tk.TclError, ValueError):
+        return WORKERS_POR_DEFECTO
+
+# --------------------------------------------------
+#   Carga del modelo en segundo plano
+# --------------------------------------------------
+def al_mapear_ventana(event):
+    """
+    Primera vez que la ventana aparece: anota el tiempo y empieza a
+    cargar el modelo sin bloquear la interfaz.
+    """
+    if event.widget is not root or "primera_ventana" in metricas_arranque:
+        return
+    metricas_arranque["primera_ventana"] = time.perf_counter() - T_INICIO
+    cargar_modelo()
+
+def cargar_modelo():
+    """
+    Marca el modelo como no listo y lo precarga en un hilo aparte.
+    """
+    modelo_listo.clear()
+    label_estado.config(text=f"Cargando modelo {gestor_sesion.modelo}…")
+    gestor_sesion.precalentar_en_segundo_plano(
+        al_terminar=lambda error: root.after(0, lambda: al_cargar_modelo(error))
+    )
+
+def al_cargar_modelo(error):
+    """
+    Se ejecuta en el hilo principal cuando termina la carga: anota el
+    tiempo hasta listo y atiende las solicitudes encoladas.
+    """
+    if "modelo_listo" not in metricas_arranque:
+        metricas_arranque["modelo_listo"] = time.perf_counter() - T_INICIO
+    if error is None:
+        label_estado.config(
+            text=(f"Modelo {gestor_sesion.modelo} listo · ventana en "
+                  f"{metricas_arranque['primera_ventana']:.2f} s · listo en "
+                  f"{metricas_arranque['modelo_listo']:.2f} s")
+        )
+    else:
+        label_estado.config(text=f"No se pudo cargar el modelo: {error}")
+    modelo_listo.set()
+
+    # Si la carga falló, las solicitudes lo reintentarán y mostrarán el error
+    pendientes = list(solicitudes_pendientes)
+    solicitudes_pendientes.clear()
+    for accion in pendientes:
+        accion()
+
+def cuando_modelo_listo(accion):
+    """
+    Ejecuta la acción ya o la encola hasta que el modelo esté cargado.
+    """
+    if modelo_listo.is_set():
+        accion()
+        return
+    solicitudes_pendientes.append(accion)
+    label_info.config(
+        text=f"Esperando al modelo… ({len(solicitudes_pendientes)} solicitudes en cola)"
+    )
+
+# --------------------------------------------------
+#   Acciones de la ventana
+# --------------------------------------------------
+def iniciar_lote(rutas):
+    """
+    Lanza el hilo coordinador del pool de procesos para varias imágenes.
+    """
+    imagenes = listar_imagenes(rutas)
+    if not imagenes:
+        messagebox.showerror("Error", "No se encontraron imágenes para procesar.")
+        return
+
+    workers = min(obtener_workers(), len(imagenes))
+    preparar_barra(len(imagenes))
+    label_info.config(text=f"Procesando {len(imagenes)} imágenes con {workers} procesos…")
+
+    hilo = threading.Thread(
+        target=procesar_lote_en_segundo_plano,
+        args=(imagenes, gestor_sesion.modelo, workers, ajustes_actuales()),
+        daemon=True
+    )
+    hilo.start()
+
+def seleccionar_imagen():
+    """
+    1) Limpia info previa.
+    2) Abre diálogo para seleccionar una o varias imágenes.
+    3) Configura y muestra la barra de progreso.
+    4) Lanza el thread que procesará la imagen (o el lote si hay varias).
+    """
+    limpiar_resultado()
+
+    rutas = filedialog.askopenfilenames(
+        title="Seleccionar imágenes",
+        filetypes=[("Archivos de imagen", "*.png;*.jpg;*.jpeg;*.bmp")]
+    )
+    if not rutas:
+        return
+    if len(rutas) > 1:
+        cuando_modelo_listo(lambda: iniciar_lote(list(rutas)))
+        return
+    cuando_modelo_listo(lambda: iniciar_imagen(rutas[0]))
+
+def iniciar_imagen(ruta):
+    """
+    Muestra la barra y lanza el thread que procesará una imagen.
+    """
+    preparar_barra(100)
 
     hilo = threading.Thread(
         target=procesar_en_segundo_plano,
-        args=(ruta,),
+        args=(ruta, ajustes_actuales()),
         daemon=True
     )
     hilo.start()
 
+def seleccionar_carpeta():
+    """
+    Procesa todas las imágenes de una carpeta con el pool de procesos.
+    """
+    limpiar_resultado()
+
+    carpeta = filedialog.askdirectory(title="Seleccionar carpeta de imágenes")
+    if not carpeta:
+        return
+    cuando_modelo_listo(lambda: iniciar_lote([carpeta]))
+
+def seleccionar_modelo(modelo):
+    """
+    Cambia el modelo activo y lo precarga en segundo plano.
+    """
+    modelo_var.set(modelo)
+    gestor_sesion.cambiar_modelo(modelo)
+    cargar_modelo()
+
+def cambiar_fondo():
+    """
+    Pone la última imagen procesada sobre un color elegido, sin volver
+    a pasar por el modelo.
+    """
+    if not ultima_entrada:
+        messagebox.showinfo("Cambiar fondo", "Primero procesa una imagen.")
+        return
+    _, color = colorchooser.askcolor(title="Color de fondo")
+    if not color:
+        return
+    ajustes = {k: v for k, v in ajustes_actuales().items() if k != "memoria_max_mb"}
+    threading.Thread(
+        target=componer_en_segundo_plano,
+        args=(ultima_entrada, [color], ajustes),
+        daemon=True
+    ).start()
+
+def limpiar_cache():
+    """
+    Vacía la caché de resultados tras confirmarlo.
+    """
+    if not messagebox.askyesno("Limpiar caché", "¿Eliminar todos los resultados guardados en la caché?"):
+        return
+    liberados = cache_resultados.limpiar()
+    label_info.config(text=f"Caché vaciada ({liberados / 1024 ** 2:.1f} MB liberados)")
+
+def guardar_tiempos():
+    """
+    Exporta el registro de tiempos por imagen a CSV o JSON.
+    """
+    if not registro_tiempos:
+        messagebox.showinfo("Tiempos", "Aún no se ha procesado ninguna imagen.")
+        return
+    ruta = filedialog.asksaveasfilename(
+        title="Exportar tiempos",
+        defaultextension=".csv",
+        filetypes=[("CSV", "*.csv"), ("JSON", "*.json")]
+    )
+    if not ruta:
+        return
+    try:
+        n = exportar_tiempos(ruta, metricas_arranque)
+    except Exception as e:
+        messagebox.showerror("Error", f"No se pudieron exportar los tiempos:\n{e}")
+        return
+    label_info.config(text=f"{n} registros exportados a:\n{ruta}")
+
 def abrir_carpeta():
     """
     Abre la carpeta OUTPUT_DIR en el explorador (Windows).
     """
     try:
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
         os.startfile(OUTPUT_DIR)
     except Exception as e:
         messagebox.showerror("Error", f"No se pudo abrir la carpeta:\n{e}")
@@ -192,158 +595,372 @@ def on_move(event):
     root.geometry(f"+{x_new}+{y_new}")
 
 # --------------------------------------------------
-#   Configuración de la ventana principal
+#   Punto de entrada
 # --------------------------------------------------
-root = tk.Tk()
-root.title("Yuuruii’s Background Remover")
-root.overrideredirect(True)            # Oculta la barra nativa
-root.configure(bg="#202020")
-# Permitimos redimensionar la ventana
-root.resizable(True, True)
-
-# Tamaño inicial 800×350 y centrar en pantalla
-window_width = 800
-window_height = 350
-screen_w = root.winfo_screenwidth()
-screen_h = root.winfo_screenheight()
-pos_x = (screen_w // 2) - (window_width // 2)
-pos_y = (screen_h // 2) - (window_height // 2)
-root.geometry(f"{window_width}x{window_height}+{pos_x}+{pos_y}")
-
-# Cargar icono de ventana (opcional)
-try:
-    root.iconbitmap(resource_path("bg.png"))
-except Exception:
-    pass
-
-# --------------------------------------------------
-#  Barra de título personalizada
-# --------------------------------------------------
-title_bar = tk.Frame(root, bg="#181818", height=40)
-title_bar.pack(fill="x")
-
-lbl_title = tk.Label(
-    title_bar,
-    text="Yuuruii’s Background Remover",
-    bg="#181818",
-    fg="#FF00FF",
-    font=("Segoe UI", 12, "bold")
-)
-lbl_title.pack(side="left", padx=10, pady=6)
-
-btn_close = tk.Button(
-    title_bar,
-    text="✕",
-    bg="#181818",
-    fg="#FF00FF",
-    font=("Segoe UI", 12, "bold"),
-    bd=0,
-    activebackground="#FF5555",
-    activeforeground="#FFFFFF",
-    command=on_close
-)
-btn_close.pack(side="right", padx=(0, 10), pady=6)
-
-btn_maximize = tk.Button(
-    title_bar,
-    text="▢",
-    bg="#181818", 
-    fg="#FF00FF",
-    font=("Segoe UI", 12, "bold"),
-    bd=0,
-    activebackground="#FF5555",
-    activeforeground="#FFFFFF",
-    command=on_maximize_restore
-)
-btn_maximize.pack(side="right", padx=10, pady=6)
-
-title_bar.bind("<ButtonPress-1>", start_move)
-title_bar.bind("<B1-Motion>", on_move)
-lbl_title.bind("<ButtonPress-1>", start_move)
-lbl_title.bind("<B1-Motion>", on_move)
-
-# --------------------------------------------------
-#  Contenedor principal (ahora con pack para ser responsive)
-# --------------------------------------------------
-container = tk.Frame(root, bg="#202020")
-container.pack(fill="both", expand=True)
-
-# --------------------------------------------------
-#  Widgets del Background Remover
-# --------------------------------------------------
-
-# Etiqueta instructiva
-label_instruccion = tk.Label(
-    container,
-    text="Seleccione una imagen para eliminar su fondo",
-    bg="#202020",
-    fg="#FF00FF",
-    font=("Segoe UI", 14)
-)
-label_instruccion.pack(pady=(20, 10))
-
-# Botón "Cargar imagen…"
-btn_cargar = tk.Button(
-    container,
-    text="Cargar imagen…",
-    bg="#181818",
-    fg="#FF00FF",
-    font=("Segoe UI", 12, "bold"),
-    bd=0,
-    activebackground="#FF5555",
-    activeforeground="#FFFFFF",
-    command=seleccionar_imagen,
-    padx=20,
-    pady=10
-)
-btn_cargar.pack(pady=(0, 15))
+if __name__ == "__main__":
+    # Necesario para el pool de procesos en el ejecutable de PyInstaller
+    multiprocessing.freeze_support()
+
+    # --------------------------------------------------
+    #   Configuración de la ventana principal
+    # --------------------------------------------------
+    root = tk.Tk()
+    root.title("Yuuruii’s Background Remover")
+    root.overrideredirect(True)            # Oculta la barra nativa
+    root.configure(bg="#202020")
+    # Permitimos redimensionar la ventana
+    root.resizable(True, True)
+
+    # Tamaño inicial 800×540 y centrar en pantalla
+    window_width = 800
+    window_height = 540
+    screen_w = root.winfo_screenwidth()
+    screen_h = root.winfo_screenheight()
+    pos_x = (screen_w // 2) - (window_width // 2)
+    pos_y = (screen_h // 2) - (window_height // 2)
+    root.geometry(f"{window_width}x{window_height}+{pos_x}+{pos_y}")
+
+    # Cargar icono de ventana (opcional)
+    try:
+        root.iconbitmap(resource_path("bg.png"))
+    except Exception:
+        pass
+
+    # --------------------------------------------------
+    #  Barra de título personalizada
+    # --------------------------------------------------
+    title_bar = tk.Frame(root, bg="#181818", height=40)
+    title_bar.pack(fill="x")
+
+    lbl_title = tk.Label(
+        title_bar,
+        text="Yuuruii’s Background Remover",
+        bg="#181818",
+        fg="#FF00FF",
+        font=("Segoe UI", 12, "bold")
+    )
+    lbl_title.pack(side="left", padx=10, pady=6)
+
+    btn_close = tk.Button(
+        title_bar,
+        text="✕",
+        bg="#181818",
+        fg="#FF00FF",
+        font=("Segoe UI", 12, "bold"),
+        bd=0,
+        activebackground="#FF5555",
+        activeforeground="#FFFFFF",
+        command=on_close
+    )
+    btn_close.pack(side="right", padx=(0, 10), pady=6)
+
+    btn_maximize = tk.Button(
+        title_bar,
+        text="▢",
+        bg="#181818", 
+        fg="#FF00FF",
+        font=("Segoe UI", 12, "bold"),
+        bd=0,
+        activebackground="#FF5555",
+        activeforeground="#FFFFFF",
+        command=on_maximize_restore
+    )
+    btn_maximize.pack(side="right", padx=10, pady=6)
+
+    title_bar.bind("<ButtonPress-1>", start_move)
+    title_bar.bind("<B1-Motion>", on_move)
+    lbl_title.bind("<ButtonPress-1>", start_move)
+    lbl_title.bind("<B1-Motion>", on_move)
+
+    # --------------------------------------------------
+    #  Contenedor principal (ahora con pack para ser responsive)
+    # --------------------------------------------------
+    container = tk.Frame(root, bg="#202020")
+    container.pack(fill="both", expand=True)
+
+    # --------------------------------------------------
+    #  Widgets del Background Remover
+    # --------------------------------------------------
+
+    # Etiqueta instructiva
+    label_instruccion = tk.Label(
+        container,
+        text="Seleccione una imagen para eliminar su fondo",
+        bg="#202020",
+        fg="#FF00FF",
+        font=("Segoe UI", 14)
+    )
+    label_instruccion.pack(pady=(20, 5))
+
+    # Estado del modelo (cargando / listo) y métricas de arranque
+    label_estado = tk.Label(
+        container,
+        text="Cargando modelo…",
+        bg="#202020",
+        fg="gray",
+        font=("Segoe UI", 9)
+    )
+    label_estado.pack(pady=(0, 10))
+
+    # Botones "Cargar imagen…" y "Cargar carpeta…"
+    marco_botones = tk.Frame(container, bg="#202020")
+    marco_botones.pack(pady=(0, 15))
+
+    btn_cargar = tk.Button(
+        marco_botones,
+        text="Cargar imagen…",
+        bg="#181818",
+        fg="#FF00FF",
+        font=("Segoe UI", 12, "bold"),
+        bd=0,
+        activebackground="#FF5555",
+        activeforeground="#FFFFFF",
+        command=seleccionar_imagen,
+        padx=20,
+        pady=10
+    )
+    btn_cargar.pack(side="left", padx=(0, 10))
+
+    # Botón "Cargar carpeta…" (procesa todas las imágenes con el pool)
+    btn_carpeta = tk.Button(
+        marco_botones,
+        text="Cargar carpeta…",
+        bg="#181818",
+        fg="#FF00FF",
+        font=("Segoe UI", 12, "bold"),
+        bd=0,
+        activebackground="#FF5555",
+        activeforeground="#FFFFFF",
+        command=seleccionar_carpeta,
+        padx=20,
+        pady=10
+    )
+    btn_carpeta.pack(side="left")
+
+    # Selector de modelo de rembg
+    marco_modelo = tk.Frame(container, bg="#202020")
+    marco_modelo.pack(pady=(0, 10))
+
+    lbl_modelo = tk.Label(
+        marco_modelo,
+        text="Modelo:",
+        bg="#202020",
+        fg="#FF00FF",
+        font=("Segoe UI", 11)
+    )
+    lbl_modelo.pack(side="left", padx=(0, 10))
+
+    modelo_var = tk.StringVar(value=gestor_sesion.modelo)
+    optionmenu_modelo = tk.OptionMenu(
+        marco_modelo,
+        modelo_var,
+        *MODELOS_DISPONIBLES,
+        command=seleccionar_modelo
+    )
+    optionmenu_modelo.config(
+        bg="#181818", fg="#FF00FF", font=("Segoe UI", 11),
+        bd=0, activebackground="#FF5555", activeforeground="#FFFFFF",
+        highlightthickness=0
+    )
+    optionmenu_modelo["menu"].config(
+        bg="#181818", fg="#FF00FF", font=("Segoe UI", 10),
+        bd=0, activebackground="#FF5555", activeforeground="#FFFFFF"
+    )
+    optionmenu_modelo.pack(side="left")
+
+    # Número de procesos para los lotes
+    lbl_workers = tk.Label(
+        marco_modelo,
+        text="Procesos:",
+        bg="#202020",
+        fg="#FF00FF",
+        font=("Segoe UI", 11)
+    )
+    lbl_workers.pack(side="left", padx=(20, 10))
+
+    workers_var = tk.StringVar(value=str(WORKERS_POR_DEFECTO))
+    spin_workers = tk.Spinbox(
+        marco_modelo,
+        from_=1,
+        to=os.cpu_count() or 1,
+        textvariable=workers_var,
+        width=4,
+        bg="#181818",
+        fg="#FF00FF",
+        font=("Segoe UI", 11),
+        buttonbackground="#181818",
+        bd=0,
+        highlightthickness=0,
+        justify="center"
+    )
+    spin_workers.pack(side="left")
+
+    # Máscara a baja resolución (útil para fotos de 24 MP o más)
+    baja_res_var = tk.BooleanVar(value=False)
+    chk_baja_res = tk.Checkbutton(
+        marco_modelo,
+        text="Máscara rápida",
+        variable=baja_res_var,
+        bg="#202020",
+        fg="#FF00FF",
+        selectcolor="#181818",
+        activebackground="#202020",
+        activeforeground="#FF00FF",
+        font=("Segoe UI", 11),
+        bd=0,
+        highlightthickness=0
+    )
+    chk_baja_res.pack(side="left", padx=(20, 0))
+
+    # Formato de salida (compresión PNG, WebP sin pérdida o solo máscara)
+    marco_formato = tk.Frame(container, bg="#202020")
+    marco_formato.pack(pady=(0, 10))
+
+    lbl_salida = tk.Label(
+        marco_formato,
+        text="Salida:",
+        bg="#202020",
+        fg="#FF00FF",
+        font=("Segoe UI", 11)
+    )
+    lbl_salida.pack(side="left", padx=(0, 10))
 
-# Barra de progreso (oculta hasta iniciar un proceso)
-progress_bar = ttk.Progressbar(
-    container,
-    orient="horizontal",
-    mode="determinate"
-)
-# NOTA: la barra se empaquetará dinámicamente en seleccionar_imagen()
-
-# Label para mostrar la miniatura resultante
-label_imagen = tk.Label(container, bg="#202020")
-label_imagen.pack(pady=10)
-
-# Label para mostrar la ruta de guardado o estado
-label_info = tk.Label(
-    container,
-    text="",
-    bg="#202020",
-    fg="#FF00FF",
-    font=("Segoe UI", 10),
-    justify="center"
-)
-label_info.pack(pady=5)
-
-# Botón "Abrir carpeta de salida"
-btn_abrir = tk.Button(
-    container,
-    text="Abrir carpeta de salida",
-    bg="#181818",
-    fg="#FF00FF",
-    font=("Segoe UI", 12, "bold"),
-    bd=0,
-    activebackground="#FF5555",
-    activeforeground="#FFFFFF",
-    command=abrir_carpeta,
-    padx=20,
-    pady=10
-)
-btn_abrir.pack(pady=(15, 20))
+    salida_var = tk.StringVar(value="PNG")
+    optionmenu_salida = tk.OptionMenu(
+        marco_formato,
+        salida_var,
+        *OPCIONES_SALIDA
+    )
+    optionmenu_salida.config(
+        bg="#181818", fg="#FF00FF", font=("Segoe UI", 11),
+        bd=0, activebackground="#FF5555", activeforeground="#FFFFFF",
+        highlightthickness=0
+    )
+    optionmenu_salida["menu"].config(
+        bg="#181818", fg="#FF00FF", font=("Segoe UI", 10),
+        bd=0, activebackground="#FF5555", activeforeground="#FFFFFF"
+    )
+    optionmenu_salida.pack(side="left")
+
+    # Modo por franjas: memoria acotada para panorámicas muy grandes
+    franjas_var = tk.BooleanVar(value=False)
+    chk_franjas = tk.Checkbutton(
+        marco_formato,
+        text=f"Memoria acotada ({MEMORIA_MAXIMA_MB_POR_DEFECTO} MB)",
+        variable=franjas_var,
+        bg="#202020",
+        fg="#FF00FF",
+        selectcolor="#181818",
+        activebackground="#202020",
+        activeforeground="#FF00FF",
+        font=("Segoe UI", 11),
+        bd=0,
+        highlightthickness=0
+    )
+    chk_franjas.pack(side="left", padx=(20, 0))
 
-# --------------------------------------------------
-#  Estado para maximizar/restaurar
-# --------------------------------------------------
-is_maximized = False
-previous_geometry = root.geometry()
+    # Barra de progreso (oculta hasta iniciar un proceso)
+    progress_bar = ttk.Progressbar(
+        container,
+        orient="horizontal",
+        mode="determinate"
+    )
+    # NOTA: la barra se empaquetará dinámicamente en seleccionar_imagen()
+
+    # Label para mostrar la ruta de guardado o estado
+    label_info = tk.Label(
+        container,
+        text="",
+        bg="#202020",
+        fg="#FF00FF",
+        font=("Segoe UI", 10),
+        justify="center"
+    )
 
-# --------------------------------------------------
-#  Inicia el bucle principal de Tkinter
-# --------------------------------------------------
-root.mainloop()
+    # Botones "Abrir carpeta de salida", "Cambiar fondo…", "Limpiar caché" y "Exportar tiempos"
+    marco_salida = tk.Frame(container, bg="#202020")
+    marco_salida.pack(side="bottom", pady=(15, 20))
+    # La información va justo encima de los botones
+    label_info.pack(side="bottom", pady=5)
+
+    btn_abrir = tk.Button(
+        marco_salida,
+        text="Abrir carpeta de salida",
+        bg="#181818",
+        fg="#FF00FF",
+        font=("Segoe UI", 12, "bold"),
+        bd=0,
+        activebackground="#FF5555",
+        activeforeground="#FFFFFF",
+        command=abrir_carpeta,
+        padx=20,
+        pady=10
+    )
+    btn_abrir.pack(side="left", padx=(0, 10))
+
+    # Recompone la última imagen sobre otro color sin usar el modelo
+    btn_fondo = tk.Button(
+        marco_salida,
+        text="Cambiar fondo…",
+        bg="#181818",
+        fg="#FF00FF",
+        font=("Segoe UI", 12, "bold"),
+        bd=0,
+        activebackground="#FF5555",
+        activeforeground="#FFFFFF",
+        command=cambiar_fondo,
+        padx=20,
+        pady=10
+    )
+    btn_fondo.pack(side="left", padx=(0, 10))
+
+    btn_limpiar_cache = tk.Button(
+        marco_salida,
+        text="Limpiar caché",
+        bg="#181818",
+        fg="#FF00FF",
+        font=("Segoe UI", 12, "bold"),
+        bd=0,
+        activebackground="#FF5555",
+        activeforeground="#FFFFFF",
+        command=limpiar_cache,
+        padx=20,
+        pady=10
+    )
+    btn_limpiar_cache.pack(side="left", padx=(0, 10))
+
+    btn_tiempos = tk.Button(
+        marco_salida,
+        text="Exportar tiempos",
+        bg="#181818",
+        fg="#FF00FF",
+        font=("Segoe UI", 12, "bold"),
+        bd=0,
+        activebackground="#FF5555",
+        activeforeground="#FFFFFF",
+        command=guardar_tiempos,
+        padx=20,
+        pady=10
+    )
+    btn_tiempos.pack(side="left")
+
+    # Label con el resultado: ocupa el espacio libre entre los controles y
+    # los botones de abajo y el visor ajusta la imagen a su tamaño
+    label_imagen = tk.Label(container, bg="#202020", bd=0, highlightthickness=0)
+    label_imagen.pack(fill="both", expand=True, pady=10)
+    visor = VisorResultado(root, label_imagen)
+    lado_pantalla = max(screen_w, screen_h)
+
+    # --------------------------------------------------
+    #  Estado para maximizar/restaurar
+    # --------------------------------------------------
+    is_maximized = False
+    previous_geometry = root.geometry()
+
+    # Precargamos el modelo cuando la ventana ya está visible
+    root.bind("<Map>", al_mapear_ventana)
+
+    # --------------------------------------------------
+    #  Inicia el bucle principal de Tkinter
+    # --------------------------------------------------
+    root.mainloop()
@@ -0,0 +1,405 @@
+"""
+Servicio HTTP local del Background Remover: un único modelo caliente
+al que otras herramientas envían imágenes sin abrir la ventana.
+
+    python bgserver.py --port 8765
+
+Rutas:
+    POST /remove   cuerpo = bytes de la imagen; responde la imagen sin
+                   fondo. Parámetros opcionales en la URL:
+                   ?format=png|webp|mascara&fast_mask=1024&png_compression=1
+    GET  /metrics  latencias, ritmo, tamaño de tanda y estado de la cola (JSON)
+    GET  /health   200 cuando el modelo está cargado, 503 mientras no
+
+Ejemplo:
+    curl --data-binary @foto.jpg "http://127.0.0.1:8765/remove?format=webp" -o foto.webp
+"""
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from PIL import UnidentifiedImageError
+from bgcore import (
+    MODELOS_DISPONIBLES, MODELO_POR_DEFECTO, FORMATO_POR_DEFECTO, EXTENSIONES_SALIDA,
+    GestorSesion, cache_resultados, calcular_recorte, decodificar, guardar_resultado
+)
+
+# --------------------------------------------------
+#   Ajustes del servicio
+# --------------------------------------------------
+HOST_POR_DEFECTO = "127.0.0.1"
+PUERTO_POR_DEFECTO = 8765
+# Imágenes esperando inferencia; por encima se responde 429
+CAPACIDAD_COLA = 32
+# Máximo de imágenes que la inferencia toma de la cola de una vez
+TAMANO_LOTE = 8
+# Segundos que una petición espera su máscara antes de rendirse
+ESPERA_MAXIMA = 120.0
+TAMANO_MAXIMO_MB = 50
+# Tamaño de cada trozo de la respuesta en streaming
+TAMANO_TROZO = 64 * 1024
+# Latencias recientes usadas para los percentiles
+VENTANA_METRICAS = 1000
+
+TIPOS_CONTENIDO = {"png": "image/png", "webp": "image/webp", "mascara": "image/png"}
+
+# --------------------------------------------------
+#   Métricas
+# --------------------------------------------------
+def percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+class Metricas:
+    """
+    Contadores y latencias recientes del servicio, seguros entre hilos.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inicio = time.time()
+        self.contadores = {"peticiones": 0, "correctas": 0, "errores": 0, "rechazadas": 0,
+                           "aciertos_cache": 0, "lotes": 0, "imagenes_en_lotes": 0}
+        self._latencias = deque(maxlen=VENTANA_METRICAS)
+        self._inferencias = deque(maxlen=VENTANA_METRICAS)
+        self._terminadas = deque(maxlen=VENTANA_METRICAS)
+
+    def sumar(self, contador, n=1):
+        with self._lock:
+            self.contadores[contador] += n
+
+    def anotar_peticion(self, segundos):
+        with self._lock:
+            self.contadores["correctas"] += 1
+            self._latencias.append(segundos)
+            self._terminadas.append(time.time())
+
+    def anotar_lote(self, imagenes, segundos):
+        with self._lock:
+            self.contadores["lotes"] += 1
+            self.contadores["imagenes_en_lotes"] += imagenes
+            self._inferencias.append(segundos / imagenes)
+
+    def instantanea(self, en_cola, capacidad):
+        with self._lock:
+            ahora = time.time()
+            ultimo_minuto = sum(1 for t in self._terminadas if ahora - t <= 60)
+            latencias = list(self._latencias)
+            inferencias = list(self._inferencias)
+            lotes = self.contadores["lotes"]
+            return {
+                **self.contadores,
+                "en_cola": en_cola,
+                "capacidad_cola": capacidad,
+                "activo_s": round(ahora - self._inicio, 1),
+                "img_por_s_ultimo_minuto": round(ultimo_minuto / 60, 3),
+                "latencia_p50_s": percentil(latencias, 50),
+                "latencia_p95_s": percentil(latencias, 95),
+                "latencia_p99_s": percentil(latencias, 99),
+                "inferencia_media_s": sum(inferencias) / len(inferencias) if inferencias else None,
+                "tanda_media": self.contadores["imagenes_en_lotes"] / lotes if lotes else None,
+            }
+
+# --------------------------------------------------
+#   Inferencia por tandas
+# --------------------------------------------------
+class Trabajo:
+    """
+    Una imagen esperando su máscara. La petición que la creó espera a
+    que listo se active y lee mascara o error.
+    """
+    def __init__(self, original, clave_mascara, lado_mascara=None):
+        self.original = original
+        self.clave_mascara = clave_mascara
+        self.lado_mascara = lado_mascara
+        self.mascara = None
+        self.error = None
+        self.listo = threading.Event()
+
+class LoteadorInferencia:
+    """
+    Un solo hilo dueño de la sesión. Cada vuelta toma todo lo que haya
+    en la cola (hasta tamano_lote) y calcula las máscaras seguidas; las
+    imágenes repetidas dentro de una tanda se calculan una sola vez.
+    Los modelos de rembg se exportan con lote fijo de 1, así que la
+    tanda comparte la sesión caliente en lugar de apilar tensores. La
+    decodificación y la codificación quedan en los hilos de cada
+    petición, de modo que este hilo solo ejecuta el modelo.
+    """
+    def __init__(self, gestor, metricas, capacidad=CAPACIDAD_COLA, tamano_lote=TAMANO_LOTE):
+        self.gestor = gestor
+        self.metricas = metricas
+        self.tamano_lote = tamano_lote
+        self.cola = queue.Queue(maxsize=capacidad)
+        self._hilo = threading.Thread(target=self._bucle, daemon=True)
+        self._hilo.start()
+
+    def enviar(self, trabajo):
+        """
+        Encola el trabajo o lanza queue.Full si la cola está llena.
+        """
+        self.cola.put_nowait(trabajo)
+
+    def _tomar_lote(self):
+        lote = [self.cola.get()]
+        while len(lote) < self.tamano_lote:
+            try:
+                lote.append(self.cola.get_nowait())
+            except queue.Empty:
+                break
+        return lote
+
+    def _bucle(self):
+        while True:
+            lote = self._tomar_lote()
+            inicio = time.perf_counter()
+            grupos = {}
+            for trabajo in lote:
+                grupos.setdefault(trabajo.clave_mascara, []).append(trabajo)
+            for trabajos in grupos.values():
+                primero = trabajos[0]
+                try:
+                    ajustes = {"formato": "mascara", "lado_mascara": primero.lado_mascara}
+                    mascara = calcular_recorte(primero.original, self.gestor.obtener(), ajustes)
+                except Exception as e:
+                    mascara, error = None, e
+                else:
+                    error = None
+                for trabajo in trabajos:
+                    trabajo.mascara, trabajo.error = mascara, error
+                    trabajo.listo.set()
+            self.metricas.anotar_lote(len(lote), time.perf_counter() - inicio)
+
+# --------------------------------------------------
+#   Respuesta en streaming
+# --------------------------------------------------
+class SalidaPorTrozos:
+    """
+    Objeto de archivo que envía lo escrito con Transfer-Encoding:
+    chunked en trozos de TAMANO_TROZO, así el cliente recibe los
+    primeros bytes mientras el codificador aún trabaja.
+    """
+    def __init__(self, wfile):
+        self._wfile = wfile
+        self._bufer = bytearray()
+
+    def write(self, datos):
+        self._bufer += datos
+        while len(self._bufer) >= TAMANO_TROZO:
+            self._enviar(bytes(self._bufer[:TAMANO_TROZO]))
+            del self._bufer[:TAMANO_TROZO]
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def _enviar(self, trozo):
+        self._wfile.write(b"%X\r\n%s\r\n" % (len(trozo), trozo))
+
+    def cerrar(self):
+        if self._bufer:
+            self._enviar(bytes(self._bufer))
+            self._bufer.clear()
+        self._wfile.write(b"0\r\n\r\n")
+        self._wfile.flush()
+
+# --------------------------------------------------
+#   Servidor HTTP
+# --------------------------------------------------
+class ErrorPeticion(Exception):
+    def __init__(self, estado, mensaje):
+        super().__init__(mensaje)
+        self.estado = estado
+
+def ajustes_desde_consulta(consulta):
+    parametros = {k: v[-1] for k, v in parse_qs(consulta).items()}
+    ajustes = {"formato": parametros.get("format", FORMATO_POR_DEFECTO)}
+    if ajustes["formato"] not in EXTENSIONES_SALIDA:
+        raise ErrorPeticion(400, f"Formato no admitido: {ajustes['formato']}")
+    try:
+        if parametros.get("fast_mask"):
+            ajustes["lado_mascara"] = int(parametros["fast_mask"])
+            if ajustes["lado_mascara"] <= 0:
+                raise ErrorPeticion(400, "fast_mask debe ser un entero positivo")
+        if parametros.get("png_compression"):
+            ajustes["compresion_png"] = min(9, max(0, int(parametros["png_compression"])))
+    except ValueError as e:
+        raise ErrorPeticion(400, f"Parámetro no válido: {e}")
+    return ajustes
+
+class ManejadorBgRemover(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "YuuruiiBgRemover/1.0"
+
+    # Rellenados por crear_servidor()
+    gestor = None
+    loteador = None
+    metricas = None
+
+    def log_message(self, formato, *args):
+        pass
+
+    def _responder_json(self, estado, datos, cabeceras=None, cerrar=False):
+        """
+        cerrar=True cierra la conexión tras responder: hace falta si el
+        cuerpo de la petición no se leyó, porque con keep-alive la
+        siguiente petición se leería a partir de esos bytes.
+        """
+        cuerpo = json.dumps(datos, ensure_ascii=False).encode("utf-8")
+        self.send_response(estado)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        for nombre, valor in (cabeceras or {}).items():
+            self.send_header(nombre, valor)
+        if cerrar:
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def do_GET(self):
+        ruta = urlsplit(self.path).path
+        if ruta == "/metrics":
+            self._responder_json(200, self.metricas.instantanea(
+                self.loteador.cola.qsize(), self.loteador.cola.maxsize
+            ))
+        elif ruta == "/health":
+            if self.gestor.cargada:
+                self._responder_json(200, {"estado": "ok", "modelo": self.gestor.modelo})
+            else:
+                self._responder_json(503, {"estado": "cargando", "modelo": self.gestor.modelo},
+                                     {"Retry-After": "1"})
+        else:
+            self._responder_json(404, {"error": "Ruta no encontrada"})
+
+    def do_POST(self):
+        partes = urlsplit(self.path)
+        if partes.path != "/remove":
+            self._responder_json(404, {"error": "Ruta no encontrada"}, cerrar=True)
+            return
+        inicio = time.perf_counter()
+        self.metricas.sumar("peticiones")
+        self._cuerpo_leido = False
+        try:
+            ajustes = ajustes_desde_consulta(partes.query)
+            imagen = self._procesar(self._leer_cuerpo(), ajustes)
+        except ErrorPeticion as e:
+            self.metricas.sumar("rechazadas" if e.estado == 429 else "errores")
+            cabeceras = {"Retry-After": "1"} if e.estado == 429 else None
+            self._responder_json(e.estado, {"error": str(e)}, cabeceras, cerrar=not self._cuerpo_leido)
+            return
+        except Exception as e:
+            self.metricas.sumar("errores")
+            self._responder_json(500, {"error": str(e)}, cerrar=not self._cuerpo_leido)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", TIPOS_CONTENIDO[ajustes["formato"]])
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        salida = SalidaPorTrozos(self.wfile)
+        guardar_resultado(imagen, salida, ajustes)
+        salida.cerrar()
+        self.metricas.anotar_peticion(time.perf_counter() - inicio)
+
+    def _leer_cuerpo(self):
+        try:
+            longitud = int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            raise ErrorPeticion(411, "Falta Content-Length")
+        if longitud < 0:
+            raise ErrorPeticion(400, "Content-Length no válido")
+        if longitud > TAMANO_MAXIMO_MB * 1024 ** 2:
+            raise ErrorPeticion(413, f"La imagen supera {TAMANO_MAXIMO_MB} MB")
+        datos = self.rfile.read(longitud)
+        self._cuerpo_leido = len(datos) == longitud
+        return datos
+
+    def _procesar(self, datos, ajustes):
+        """
+        Decodifica, obtiene la máscara (caché o tanda de inferencia) y
+        devuelve la imagen de salida sin codificar.
+        """
+        _, clave_mascara = cache_resultados.claves(datos, self.gestor.identidad, ajustes)
+        try:
+            original = decodificar(datos)
+        except (UnidentifiedImageError, OSError) as e:
+            raise ErrorPeticion(400, f"No es una imagen válida: {e}")
+
+        mascara = cache_resultados.obtener_mascara(clave_mascara)
+        if mascara is not None:
+            self.metricas.sumar("aciertos_cache")
+        else:
+            trabajo = Trabajo(original, clave_mascara, ajustes.get("lado_mascara"))
+            try:
+                self.loteador.enviar(trabajo)
+            except queue.Full:
+                raise ErrorPeticion(429, "Cola llena, reintenta en unos segundos")
+            if not trabajo.listo.wait(ESPERA_MAXIMA):
+                raise ErrorPeticion(503, "La inferencia tardó demasiado")
+            if trabajo.error is not None:
+                raise trabajo.error
+            mascara = trabajo.mascara
+            cache_resultados.guardar_mascara(clave_mascara, mascara)
+        return calcular_recorte(original, None, ajustes, mascara)
+
+def crear_servidor(host=HOST_POR_DEFECTO, puerto=PUERTO_POR_DEFECTO, modelo=MODELO_POR_DEFECTO,
+                   capacidad=CAPACIDAD_COLA, tamano_lote=TAMANO_LOTE, gestor=None):
+    """
+    Crea el servidor con su propio gestor de sesión, métricas y hilo de
+    inferencia. No precalienta el modelo ni empieza a escuchar.
+    """
+    gestor = gestor or GestorSesion(modelo)
+    metricas = Metricas()
+    manejador = type("Manejador", (ManejadorBgRemover,), {
+        "gestor": gestor,
+        "metricas": metricas,
+        "loteador": LoteadorInferencia(gestor, metricas, capacidad, tamano_lote),
+    })
+    servidor = ThreadingHTTPServer((host, puerto), manejador)
+    servidor.daemon_threads = True
+    return servidor
+
+# --------------------------------------------------
+#   Línea de comandos
+# --------------------------------------------------
+def crear_parser():
+    parser = argparse.ArgumentParser(
+        prog="bgserver",
+        description="Servicio HTTP local que elimina el fondo con un modelo siempre cargado."
+    )
+    parser.add_argument("--host", default=HOST_POR_DEFECTO,
+                        help=f"Dirección en la que escuchar (por defecto: {HOST_POR_DEFECTO})")
+    parser.add_argument("--port", type=int, default=PUERTO_POR_DEFECTO,
+                        help=f"Puerto (por defecto: {PUERTO_POR_DEFECTO})")
+    parser.add_argument("--model", default=MODELO_POR_DEFECTO, choices=MODELOS_DISPONIBLES,
+                        help=f"Modelo de rembg (por defecto: {MODELO_POR_DEFECTO})")
+    parser.add_argument("--queue", type=int, default=CAPACIDAD_COLA,
+                        help=f"Imágenes en espera antes de responder 429 (por defecto: {CAPACIDAD_COLA})")
+    parser.add_argument("--batch", type=int, default=TAMANO_LOTE,
+                        help=f"Máximo de imágenes por tanda de inferencia (por defecto: {TAMANO_LOTE})")
+    return parser
+
+def main(argv=None):
+    args = crear_parser().parse_args(argv)
+    servidor = crear_servidor(args.host, args.port, args.model,
+                              max(1, args.queue), max(1, args.batch))
+    print(f"Cargando modelo {args.model}…", flush=True)
+    servidor.RequestHandlerClass.gestor.precalentar()
+    print(f"Escuchando en http://{args.host}:{servidor.server_address[1]}", flush=True)
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
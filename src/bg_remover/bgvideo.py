@@ -0,0 +1,437 @@
+"""
+Eliminación de fondo en vídeos cortos y secuencias de fotogramas. Los
+fotogramas llegan decodificados por una tubería de ffmpeg (o se leen
+de una carpeta de imágenes) y el modelo solo se ejecuta en fotogramas
+clave: el primero, cuando la imagen cambia de forma apreciable o cada
+cierto número de fotogramas. Entre dos claves la máscara se reutiliza
+o, con --interpolate, se funde de una clave a la siguiente. La
+segmentación es la misma de bgcore (calcular_recorte).
+
+Uso:
+    python bgvideo.py clip.mp4 -o clip_sin_fondo.webm        # VP9 con alfa
+    python bgvideo.py clip.mp4 -o clip_sin_fondo.mov         # ProRes 4444
+    python bgvideo.py clip.mp4 -o fotogramas/                # secuencia PNG
+    python bgvideo.py carpeta_fotogramas/ -o salida/ --interpolate
+"""
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+from PIL import Image
+from bgcore import (
+    OUTPUT_DIR, MODELOS_DISPONIBLES, MODELO_POR_DEFECTO, LADO_MASCARA_POR_DEFECTO,
+    ORIENTACION_EXIF, ORIENTACIONES_GIRADAS,
+    RESAMPLE_REDUCIR, ESCRITORES_POR_DEFECTO, PROFUNDIDAD_COLAS, GestorSesion,
+    calcular_recorte, guardar_resultado, listar_imagenes, orientar
+)
+
+FFMPEG = "ffmpeg"
+FFPROBE = "ffprobe"
+
+# --------------------------------------------------
+#   Ajustes de la reutilización temporal
+# --------------------------------------------------
+# Diferencia media (0-1) con el último fotograma clave a partir de la
+# cual se vuelve a segmentar
+UMBRAL_CAMBIO_POR_DEFECTO = 0.015
+# Fotogramas como máximo entre dos segmentaciones aunque no haya cambios
+INTERVALO_CLAVE_POR_DEFECTO = 10
+# Ancho de la copia en grises con la que se comparan los fotogramas
+ANCHO_FIRMA = 64
+FPS_POR_DEFECTO = 25.0
+
+# Códecs con canal alfa según la extensión del vídeo de salida
+CODECS_ALFA = {
+    ".webm": ["-c:v", "libvpx-vp9", "-pix_fmt", "yuva420p", "-b:v", "0", "-crf", "30",
+              "-row-mt", "1"],
+    ".mov": ["-c:v", "prores_ks", "-profile:v", "4444", "-pix_fmt", "yuva444p10le"],
+    ".mkv": ["-c:v", "ffv1", "-pix_fmt", "bgra"],
+}
+CODECS_AUDIO = {".webm": ["-c:a", "libopus"], ".mov": ["-c:a", "aac"], ".mkv": ["-c:a", "copy"]}
+
+# --------------------------------------------------
+#   Entrada: vídeo por tubería de ffmpeg o carpeta de fotogramas
+# --------------------------------------------------
+def giro_flujo(flujo):
+    """
+    Grados de giro de un flujo de ffprobe: la matriz de visualización
+    (side data) o, en archivos antiguos, la etiqueta rotate.
+    """
+    for datos in flujo.get("side_data_list") or []:
+        if "rotation" in datos:
+            return float(datos["rotation"])
+    try:
+        return float((flujo.get("tags") or {}).get("rotate", 0))
+    except ValueError:
+        return 0.0
+
+def sondear_video(ruta):
+    """
+    Ancho, alto y fotogramas por segundo del primer flujo de vídeo. El
+    tamaño es el de los fotogramas ya girados: ffmpeg aplica el giro al
+    decodificar, así que con ±90° ancho y alto se intercambian.
+    """
+    proceso = subprocess.run(
+        [FFPROBE, "-v", "error", "-select_streams", "v:0",
+         "-show_entries", "stream=width,height,r_frame_rate:stream_tags=rotate:stream_side_data=rotation",
+         "-of", "json", ruta],
+        capture_output=True, text=True
+    )
+    if proceso.returncode != 0:
+        raise RuntimeError(f"ffprobe no pudo leer {ruta}: {proceso.stderr.strip()}")
+    flujos = json.loads(proceso.stdout).get("streams") or []
+    if not flujos:
+        raise RuntimeError(f"{ruta} no tiene pista de vídeo")
+    flujo = flujos[0]
+    numerador, _, denominador = flujo.get("r_frame_rate", "0/1").partition("/")
+    fps = float(numerador) / float(denominador or 1) if float(denominador or 1) else 0.0
+    ancho, alto = int(flujo["width"]), int(flujo["height"])
+    if round(giro_flujo(flujo)) % 180 == 90:
+        ancho, alto = alto, ancho
+    return ancho, alto, fps or FPS_POR_DEFECTO
+
+def fotogramas_video(ruta, ancho, alto):
+    """
+    Genera los fotogramas (PIL RGB) leyendo RGB crudo de la salida de
+    ffmpeg, sin archivos intermedios.
+    """
+    tam = ancho * alto * 3
+    with tempfile.TemporaryFile() as errores:
+        proceso = subprocess.Popen(
+            [FFMPEG, "-v", "error", "-i", ruta, "-map", "0:v:0",
+             "-f", "rawvideo", "-pix_fmt", "rgb24", "-"],
+            stdout=subprocess.PIPE, stderr=errores, bufsize=tam
+        )
+        completo = False
+        try:
+            while True:
+                datos = proceso.stdout.read(tam)
+                if len(datos) < tam:
+                    break
+                yield Image.frombuffer("RGB", (ancho, alto), datos, "raw", "RGB", 0, 1)
+            completo = True
+        finally:
+            proceso.stdout.close()
+            # Si se deja de leer antes del final, ffmpeg ya no hace falta
+            if not completo:
+                proceso.kill()
+            codigo = proceso.wait()
+        if codigo != 0:
+            errores.seek(0)
+            raise RuntimeError(f"ffmpeg falló al decodificar: {errores.read().decode(errors='replace').strip()}")
+
+def fotogramas_carpeta(rutas):
+    for ruta in rutas:
+        with Image.open(ruta) as imagen:
+            yield orientar(imagen.convert("RGB"))
+
+def abrir_fuente(entrada, fps=None):
+    """
+    Devuelve (fotogramas, tamaño, fps, es_video).
+    """
+    if os.path.isdir(entrada):
+        rutas = listar_imagenes([entrada])
+        if not rutas:
+            raise RuntimeError(f"No hay fotogramas en {entrada}")
+        with Image.open(rutas[0]) as primera:
+            tam = primera.size
+            if primera.getexif().get(ORIENTACION_EXIF, 1) in ORIENTACIONES_GIRADAS:
+                tam = tam[::-1]
+        return fotogramas_carpeta(rutas), tam, fps or FPS_POR_DEFECTO, False
+    ancho, alto, fps_video = sondear_video(entrada)
+    return fotogramas_video(entrada, ancho, alto), (ancho, alto), fps or fps_video, True
+
+# --------------------------------------------------
+#   Reutilización temporal de máscaras
+# --------------------------------------------------
+def firma_fotograma(fotograma):
+    """
+    Copia pequeña en grises para comparar fotogramas sin coste.
+    """
+    import numpy as np
+    alto = max(1, round(fotograma.height * ANCHO_FIRMA / fotograma.width))
+    return np.asarray(fotograma.convert("L").resize((ANCHO_FIRMA, alto), RESAMPLE_REDUCIR),
+                      dtype=np.float32)
+
+def diferencia(firma_a, firma_b):
+    """
+    Diferencia media absoluta entre dos firmas, de 0 a 1.
+    """
+    if firma_a is None or firma_b is None or firma_a.shape != firma_b.shape:
+        return 1.0
+    return float(abs(firma_a - firma_b).mean()) / 255.0
+
+class SegmentadorTemporal:
+    """
+    Decide qué fotogramas pasan por el modelo. Un fotograma es clave si
+    no hay máscara previa, si difiere de la última clave más que umbral
+    o si ya pasaron intervalo fotogramas. Entre claves la máscara se
+    reutiliza; con interpolar, los fotogramas intermedios esperan a la
+    siguiente clave y reciben una mezcla lineal de las dos máscaras
+    (salvo tras un cambio brusco, donde se mantiene la anterior para
+    no fundir a través de un corte).
+    """
+    def __init__(self, sesion, ajustes=None, umbral=UMBRAL_CAMBIO_POR_DEFECTO,
+                 intervalo=INTERVALO_CLAVE_POR_DEFECTO, interpolar=False):
+        self.sesion = sesion
+        self.ajustes = {"formato": "mascara", "lado_mascara": (ajustes or {}).get("lado_mascara")}
+        self.umbral = umbral
+        self.intervalo = max(1, intervalo)
+        self.interpolar = interpolar
+        self.estadisticas = {"fotogramas": 0, "inferencias": 0, "reutilizadas": 0,
+                             "interpoladas": 0}
+        self._mascara = None
+        self._firma_clave = None
+        self._desde_clave = 0
+        self._en_espera = []
+
+    def procesar(self, indice, fotograma):
+        """
+        Devuelve la lista de (índice, fotograma, máscara) que ya se
+        pueden escribir, en orden.
+        """
+        self.estadisticas["fotogramas"] += 1
+        firma = firma_fotograma(fotograma)
+        cambio = diferencia(firma, self._firma_clave)
+        if self._mascara is not None and cambio <= self.umbral and self._desde_clave < self.intervalo:
+            self._desde_clave += 1
+            if self.interpolar:
+                self._en_espera.append((indice, fotograma))
+                return []
+            self.estadisticas["reutilizadas"] += 1
+            return [(indice, fotograma, self._mascara)]
+
+        mascara = calcular_recorte(fotograma, self.sesion, self.ajustes)
+        self.estadisticas["inferencias"] += 1
+        listos = self._vaciar_espera(mascara if cambio <= self.umbral else None)
+        listos.append((indice, fotograma, mascara))
+        self._mascara, self._firma_clave, self._desde_clave = mascara, firma, 0
+        return listos
+
+    def terminar(self):
+        """
+        Entrega los fotogramas que aún esperaban una clave siguiente.
+        """
+        return self._vaciar_espera(None)
+
+    def _vaciar_espera(self, siguiente):
+        listos = []
+        total = len(self._en_espera) + 1
+        for k, (indice, fotograma) in enumerate(self._en_espera, 1):
+            if siguiente is None:
+                mascara = self._mascara
+                self.estadisticas["reutilizadas"] += 1
+            else:
+                mascara = Image.blend(self._mascara, siguiente, k / total)
+                self.estadisticas["interpoladas"] += 1
+            listos.append((indice, fotograma, mascara))
+        self._en_espera.clear()
+        return listos
+
+# --------------------------------------------------
+#   Salida: secuencia PNG o vídeo con alfa
+# --------------------------------------------------
+class SalidaSecuencia:
+    """
+    Escribe fotograma_000000.png... con varios hilos codificando a la
+    vez; la cola acotada frena la lectura si la escritura se atrasa.
+    """
+    def __init__(self, carpeta, ajustes=None, escritores=ESCRITORES_POR_DEFECTO):
+        self.carpeta = carpeta
+        os.makedirs(carpeta, exist_ok=True)
+        self.ajustes = {"formato": "png", "compresion_png": (ajustes or {}).get("compresion_png", 1)}
+        self._cola = queue.Queue(maxsize=PROFUNDIDAD_COLAS * escritores)
+        self._errores = []
+        self._hilos = [threading.Thread(target=self._escritor, daemon=True) for _ in range(escritores)]
+        for hilo in self._hilos:
+            hilo.start()
+
+    def _escritor(self):
+        while True:
+            item = self._cola.get()
+            if item is None:
+                return
+            indice, imagen = item
+            try:
+                ruta = os.path.join(self.carpeta, f"fotograma_{indice:06d}.png")
+                guardar_resultado(imagen, ruta, self.ajustes)
+            except Exception as e:
+                self._errores.append(e)
+
+    def escribir(self, indice, imagen):
+        if self._errores:
+            raise self._errores[0]
+        self._cola.put((indice, imagen))
+
+    def cerrar(self):
+        for _ in self._hilos:
+            self._cola.put(None)
+        for hilo in self._hilos:
+            hilo.join()
+        if self._errores:
+            raise self._errores[0]
+
+class SalidaVideo:
+    """
+    Envía RGBA crudo a un ffmpeg que codifica con alfa según la
+    extensión (CODECS_ALFA). Si la entrada es un vídeo, copia su audio.
+    """
+    def __init__(self, ruta, tam, fps, ruta_audio=None):
+        extension = os.path.splitext(ruta)[1].lower()
+        comando = [FFMPEG, "-v", "error", "-y",
+                   "-f", "rawvideo", "-pix_fmt", "rgba", "-s", f"{tam[0]}x{tam[1]}",
+                   "-r", f"{fps:g}", "-i", "-"]
+        if ruta_audio:
+            comando += ["-i", ruta_audio, "-map", "0:v:0", "-map", "1:a?", *CODECS_AUDIO[extension],
+                        "-shortest"]
+        comando += [*CODECS_ALFA[extension], ruta]
+        self.tam = tam
+        self._cerrado = False
+        self._errores = tempfile.TemporaryFile()
+        self._proceso = subprocess.Popen(comando, stdin=subprocess.PIPE, stderr=self._errores)
+
+    def escribir(self, indice, imagen):
+        if imagen.size != self.tam:
+            raise ValueError(f"El fotograma {indice} mide {imagen.size}, se esperaba {self.tam}")
+        try:
+            self._proceso.stdin.write(imagen.convert("RGBA").tobytes())
+        except BrokenPipeError:
+            self.cerrar()
+
+    def cerrar(self):
+        if self._cerrado:
+            return
+        self._cerrado = True
+        try:
+            self._proceso.stdin.close()
+        except BrokenPipeError:
+            pass
+        codigo = self._proceso.wait()
+        self._errores.seek(0)
+        mensaje = self._errores.read().decode(errors="replace").strip()
+        self._errores.close()
+        if codigo != 0:
+            raise RuntimeError(f"ffmpeg falló al codificar: {mensaje}")
+
+def es_salida_video(ruta):
+    return os.path.splitext(ruta)[1].lower() in CODECS_ALFA
+
+# --------------------------------------------------
+#   Proceso completo
+# --------------------------------------------------
+def eliminar_fondo_video(entrada, salida=None, gestor=None, ajustes=None,
+                         umbral=UMBRAL_CAMBIO_POR_DEFECTO, intervalo=INTERVALO_CLAVE_POR_DEFECTO,
+                         interpolar=False, fps=None, audio=True, al_avanzar=None):
+    """
+    Quita el fondo de un vídeo o de una carpeta de fotogramas y escribe
+    una secuencia PNG (salida es una carpeta) o un vídeo con alfa
+    (.webm, .mov o .mkv). al_avanzar(fotogramas, estadisticas) se llama
+    tras cada fotograma escrito. Devuelve (ruta de salida, estadísticas).
+    """
+    gestor = gestor or GestorSesion()
+    fotogramas, tam, fps, es_video = abrir_fuente(entrada, fps)
+    if salida is None:
+        nombre = os.path.splitext(os.path.basename(os.path.normpath(entrada)))[0]
+        salida = os.path.join(OUTPUT_DIR, f"{datetime.now():%Y%m%d_%H%M%S}_{nombre}")
+
+    if es_salida_video(salida):
+        destino = SalidaVideo(salida, tam, fps, entrada if es_video and audio else None)
+    else:
+        destino = SalidaSecuencia(salida, ajustes)
+    segmentador = SegmentadorTemporal(gestor.obtener(), ajustes, umbral, intervalo, interpolar)
+
+    inicio = time.perf_counter()
+    escritos = 0
+    try:
+        for indice, fotograma in enumerate(fotogramas):
+            listos = segmentador.procesar(indice, fotograma)
+            if not listos:
+                continue
+            for i, f, mascara in listos:
+                f = f.convert("RGBA")
+                f.putalpha(mascara)
+                destino.escribir(i, f)
+                escritos += 1
+            if al_avanzar:
+                al_avanzar(escritos, segmentador.estadisticas)
+        for i, f, mascara in segmentador.terminar():
+            f = f.convert("RGBA")
+            f.putalpha(mascara)
+            destino.escribir(i, f)
+            escritos += 1
+    finally:
+        destino.cerrar()
+
+    estadisticas = dict(segmentador.estadisticas)
+    estadisticas["segundos"] = time.perf_counter() - inicio
+    estadisticas["fps_proceso"] = escritos / estadisticas["segundos"] if estadisticas["segundos"] else 0.0
+    return salida, estadisticas
+
+# --------------------------------------------------
+#   Línea de comandos
+# --------------------------------------------------
+def crear_parser():
+    parser = argparse.ArgumentParser(
+        prog="bgvideo",
+        description="Elimina el fondo de vídeos y secuencias reutilizando máscaras entre fotogramas."
+    )
+    parser.add_argument("input", help="Vídeo o carpeta de fotogramas")
+    parser.add_argument("-o", "--output", default=None,
+                        help="Carpeta para la secuencia PNG o vídeo .webm/.mov/.mkv con alfa "
+                             f"(por defecto: una carpeta nueva en {OUTPUT_DIR})")
+    parser.add_argument("--model", default=MODELO_POR_DEFECTO, choices=MODELOS_DISPONIBLES,
+                        help=f"Modelo de rembg (por defecto: {MODELO_POR_DEFECTO})")
+    parser.add_argument("--threshold", type=float, default=UMBRAL_CAMBIO_POR_DEFECTO,
+                        help="Diferencia media (0-1) que obliga a segmentar de nuevo "
+                             f"(por defecto: {UMBRAL_CAMBIO_POR_DEFECTO})")
+    parser.add_argument("--keyframe-interval", type=int, default=INTERVALO_CLAVE_POR_DEFECTO,
+                        metavar="N", help="Segmenta al menos cada N fotogramas "
+                                          f"(por defecto: {INTERVALO_CLAVE_POR_DEFECTO})")
+    parser.add_argument("--interpolate", action="store_true",
+                        help="Funde las máscaras entre claves en vez de repetir la anterior")
+    parser.add_argument("--fps", type=float, default=None,
+                        help=f"Fotogramas por segundo de una secuencia de entrada (por defecto: {FPS_POR_DEFECTO:g})")
+    parser.add_argument("--fast-mask", nargs="?", type=int, const=LADO_MASCARA_POR_DEFECTO,
+                        default=None, metavar="LADO",
+                        help="Calcula la máscara a baja resolución (lado mayor en px)")
+    parser.add_argument("--png-compression", type=int, default=1, choices=range(10),
+                        metavar="0-9", help="Compresión de la secuencia PNG (por defecto: 1)")
+    parser.add_argument("--no-audio", action="store_true",
+                        help="No copia el audio del vídeo de entrada")
+    return parser
+
+def main(argv=None):
+    args = crear_parser().parse_args(argv)
+    ajustes = {"compresion_png": args.png_compression}
+    if args.fast_mask:
+        ajustes["lado_mascara"] = args.fast_mask
+
+    def al_avanzar(escritos, estadisticas):
+        if escritos % 25 == 0:
+            print(f"{escritos} fotogramas · {estadisticas['inferencias']} inferencias", flush=True)
+
+    try:
+        salida, estadisticas = eliminar_fondo_video(
+            args.input, args.output, GestorSesion(args.model), ajustes, args.threshold,
+            args.keyframe_interval, args.interpolate, args.fps, not args.no_audio, al_avanzar
+        )
+    except (OSError, RuntimeError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    total = estadisticas["fotogramas"] or 1
+    print(f"{estadisticas['fotogramas']} fotogramas en {estadisticas['segundos']:.1f} s "
+          f"({estadisticas['fps_proceso']:.1f} fps): {estadisticas['inferencias']} inferencias "
+          f"({estadisticas['inferencias'] / total:.0%}), {estadisticas['reutilizadas']} reutilizadas, "
+          f"{estadisticas['interpoladas']} interpoladas")
+    print(f"Guardado en {salida}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
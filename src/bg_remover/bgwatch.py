@@ -0,0 +1,394 @@
+"""
+Modo servicio del Background Remover: vigila una o varias carpetas y
+pasa cada imagen nueva por el pipeline de bgcore. El estado de la cola
+vive en un diario SQLite, así que tras un cierre o un fallo retoma lo
+pendiente y nunca vuelve a procesar un archivo ya terminado (salvo que
+cambie su tamaño o su fecha).
+
+Uso:
+    python bgwatch.py carpeta_entrada/ -o salida --interval 2
+    python bgwatch.py carpeta_entrada/ --inotify      # Linux, sin sondeo
+    python bgwatch.py carpeta_entrada/ --once         # un solo barrido
+"""
+import os
+import sys
+import time
+import errno
+import signal
+import struct
+import sqlite3
+import argparse
+import threading
+import multiprocessing
+from bgcore import (
+    OUTPUT_DIR, SCRIPT_DIR, MODELOS_DISPONIBLES, MODELO_POR_DEFECTO, FORMATO_POR_DEFECTO,
+    EXTENSIONES_SALIDA, LADO_MASCARA_POR_DEFECTO, EXTENSIONES_IMAGEN, GestorSesion,
+    procesar_lote, ajustes_desde_args
+)
+
+# --------------------------------------------------
+#   Diario SQLite de la cola
+# --------------------------------------------------
+DIARIO_POR_DEFECTO = os.path.join(SCRIPT_DIR, "bgwatch.db")
+
+# Estados de cada archivo en el diario
+PENDIENTE = "pendiente"
+PROCESANDO = "procesando"
+HECHO = "hecho"
+ERROR = "error"
+
+class DiarioCola:
+    """
+    Tabla con una fila por archivo de entrada: tamaño y fecha vistos,
+    estado, intentos y último error. Los archivos que quedaron
+    "procesando" al cortarse el servicio vuelven a "pendiente" al abrir.
+    """
+    def __init__(self, ruta=DIARIO_POR_DEFECTO):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(ruta, check_same_thread=False)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.execute("PRAGMA synchronous=NORMAL")
+        with self._con:
+            self._con.execute(
+                """CREATE TABLE IF NOT EXISTS archivos (
+                       ruta TEXT PRIMARY KEY,
+                       tamano INTEGER NOT NULL,
+                       mtime REAL NOT NULL,
+                       estado TEXT NOT NULL,
+                       intentos INTEGER NOT NULL DEFAULT 0,
+                       error TEXT,
+                       segundos REAL,
+                       actualizado REAL NOT NULL
+                   )"""
+            )
+            self._con.execute("CREATE INDEX IF NOT EXISTS idx_estado ON archivos (estado)")
+            self._con.execute(
+                "UPDATE archivos SET estado = ? WHERE estado = ?", (PENDIENTE, PROCESANDO)
+            )
+
+    def conocidos(self):
+        """
+        {ruta: (tamaño, mtime)} de todos los archivos registrados, para
+        que los barridos solo escriban lo que ha cambiado.
+        """
+        with self._lock:
+            filas = self._con.execute("SELECT ruta, tamano, mtime FROM archivos").fetchall()
+        return {ruta: (tamano, mtime) for ruta, tamano, mtime in filas}
+
+    def registrar(self, archivos):
+        """
+        Encola [(ruta, tamaño, mtime), ...] en una sola transacción. Un
+        archivo ya registrado solo vuelve a "pendiente" si ha cambiado.
+        """
+        ahora = time.time()
+        with self._lock, self._con:
+            self._con.executemany(
+                """INSERT INTO archivos (ruta, tamano, mtime, estado, actualizado)
+                   VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT (ruta) DO UPDATE SET
+                       tamano = excluded.tamano, mtime = excluded.mtime,
+                       estado = excluded.estado, intentos = 0, error = NULL,
+                       actualizado = excluded.actualizado
+                   WHERE tamano != excluded.tamano OR mtime != excluded.mtime""",
+                [(ruta, tamano, mtime, PENDIENTE, ahora) for ruta, tamano, mtime in archivos]
+            )
+
+    def tomar_pendientes(self, limite):
+        """
+        Marca como "procesando" hasta limite archivos pendientes, por
+        orden de llegada, y devuelve sus rutas.
+        """
+        with self._lock, self._con:
+            rutas = [fila[0] for fila in self._con.execute(
+                "SELECT ruta FROM archivos WHERE estado = ? ORDER BY actualizado, ruta LIMIT ?",
+                (PENDIENTE, limite)
+            )]
+            self._con.executemany(
+                "UPDATE archivos SET estado = ?, intentos = intentos + 1, actualizado = ? WHERE ruta = ?",
+                [(PROCESANDO, time.time(), ruta) for ruta in rutas]
+            )
+        return rutas
+
+    def terminar(self, ruta, segundos=None, error=None):
+        with self._lock, self._con:
+            self._con.execute(
+                "UPDATE archivos SET estado = ?, segundos = ?, error = ?, actualizado = ? WHERE ruta = ?",
+                (HECHO if error is None else ERROR, segundos,
+                 None if error is None else str(error), time.time(), ruta)
+            )
+
+    def resumen(self):
+        """
+        Número de archivos en cada estado.
+        """
+        with self._lock:
+            filas = self._con.execute("SELECT estado, COUNT(*) FROM archivos GROUP BY estado")
+            return dict(filas.fetchall())
+
+    def cerrar(self):
+        with self._lock:
+            self._con.close()
+
+# --------------------------------------------------
+#   Avisos de inotify (solo Linux)
+# --------------------------------------------------
+# Constantes de <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_NONBLOCK = 0x00000800
+_CABECERA_EVENTO = struct.Struct("iIII")
+
+class AvisosInotify:
+    """
+    Espera a que se termine de escribir o se mueva un archivo a alguna
+    de las carpetas. Con recursos compartidos por red (SMB/NFS) los
+    cambios hechos desde otra máquina no generan avisos; ahí hay que
+    usar el sondeo.
+    """
+    def __init__(self, carpetas):
+        import ctypes
+        import ctypes.util
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 falló")
+        self._carpetas = {}
+        for carpeta in carpetas:
+            wd = self._libc.inotify_add_watch(
+                self._fd, os.fsencode(carpeta), IN_CLOSE_WRITE | IN_MOVED_TO
+            )
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), f"No se puede vigilar {carpeta}")
+            self._carpetas[wd] = carpeta
+
+    def esperar(self, timeout):
+        """
+        Devuelve las rutas avisadas en timeout segundos (puede ser []).
+        """
+        import select
+        listos, _, _ = select.select([self._fd], [], [], timeout)
+        if not listos:
+            return []
+        try:
+            datos = os.read(self._fd, 64 * 1024)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return []
+            raise
+        rutas = []
+        pos = 0
+        while pos + _CABECERA_EVENTO.size <= len(datos):
+            wd, _, _, longitud = _CABECERA_EVENTO.unpack_from(datos, pos)
+            pos += _CABECERA_EVENTO.size
+            nombre = datos[pos:pos + longitud].rstrip(b"\0")
+            pos += longitud
+            if wd in self._carpetas and nombre:
+                rutas.append(os.path.join(self._carpetas[wd], os.fsdecode(nombre)))
+        return rutas
+
+    def cerrar(self):
+        os.close(self._fd)
+
+# --------------------------------------------------
+#   Servicio de vigilancia
+# --------------------------------------------------
+INTERVALO_POR_DEFECTO = 2.0
+# Segundos sin cambios antes de dar por copiado un archivo (sondeo)
+ESTABILIDAD_POR_DEFECTO = 2.0
+# Archivos que se toman del diario en cada vuelta
+LOTE_MAXIMO = 32
+
+class VigilanteCarpetas:
+    """
+    Une el barrido de las carpetas, el diario y procesar_lote(). Cada
+    vuelta registra los archivos nuevos o cambiados, procesa los
+    pendientes en tandas de LOTE_MAXIMO y anota el resultado de cada
+    uno en cuanto termina.
+    """
+    def __init__(self, carpetas, carpeta_salida=None, modelo=MODELO_POR_DEFECTO, ajustes=None,
+                 workers=1, diario=None, intervalo=INTERVALO_POR_DEFECTO,
+                 estabilidad=ESTABILIDAD_POR_DEFECTO, usar_inotify=False, al_procesar=None):
+        self.carpetas = [os.path.abspath(c) for c in carpetas]
+        self.carpeta_salida = carpeta_salida or OUTPUT_DIR
+        self.gestor = GestorSesion(modelo)
+        self.ajustes = ajustes or {}
+        self.workers = workers
+        self.diario = diario or DiarioCola()
+        self.intervalo = intervalo
+        self.estabilidad = estabilidad
+        self.al_procesar = al_procesar
+        self._conocidos = self.diario.conocidos()
+        # Última observación (tamaño, mtime) de archivos aún no estables
+        self._observados = {}
+        self._avisos = AvisosInotify(self.carpetas) if usar_inotify else None
+        self._detenido = threading.Event()
+
+    def detener(self):
+        self._detenido.set()
+
+    def _candidatos(self, rutas=None):
+        """
+        (ruta, tamaño, mtime) de las imágenes de las carpetas, o solo
+        de las rutas indicadas si vienen de inotify.
+        """
+        if rutas is not None:
+            for ruta in rutas:
+                if ruta.lower().endswith(EXTENSIONES_IMAGEN):
+                    try:
+                        st = os.stat(ruta)
+                    except OSError:
+                        continue
+                    yield ruta, st.st_size, st.st_mtime
+            return
+        for carpeta in self.carpetas:
+            try:
+                with os.scandir(carpeta) as it:
+                    for entrada in it:
+                        if entrada.name.lower().endswith(EXTENSIONES_IMAGEN) and entrada.is_file():
+                            st = entrada.stat()
+                            yield entrada.path, st.st_size, st.st_mtime
+            except FileNotFoundError:
+                continue
+
+    def escanear(self, rutas=None, estables=False):
+        """
+        Registra en el diario los archivos nuevos o cambiados. Con
+        sondeo, un archivo solo entra cuando su tamaño y fecha no han
+        cambiado desde el barrido anterior y lleva estabilidad segundos
+        quieto; con estables=True (avisos de inotify, que llegan al
+        cerrar el archivo) entra directamente. Devuelve cuántos entraron.
+        """
+        ahora = time.time()
+        nuevos = []
+        for ruta, tamano, mtime in self._candidatos(rutas):
+            firma = (tamano, mtime)
+            if self._conocidos.get(ruta) == firma:
+                continue
+            if not estables:
+                previa = self._observados.get(ruta)
+                self._observados[ruta] = firma
+                if previa != firma or ahora - mtime < self.estabilidad:
+                    continue
+            self._observados.pop(ruta, None)
+            self._conocidos[ruta] = firma
+            nuevos.append((ruta, tamano, mtime))
+        if nuevos:
+            self.diario.registrar(nuevos)
+        return len(nuevos)
+
+    def procesar_pendientes(self):
+        """
+        Procesa lo pendiente del diario hasta vaciarlo o hasta que se
+        pida detener. Devuelve cuántos archivos se procesaron.
+        """
+        procesados = 0
+        while not self._detenido.is_set():
+            rutas = self.diario.tomar_pendientes(LOTE_MAXIMO)
+            if not rutas:
+                break
+
+            def al_avanzar(hechas, total, ruta, registro, error):
+                self.diario.terminar(ruta, registro["total"] if registro else None, error)
+                if self.al_procesar:
+                    self.al_procesar(ruta, registro, error)
+
+            workers = max(1, min(self.workers, len(rutas)))
+            procesar_lote(
+                rutas, self.gestor.modelo, workers, self.ajustes, self.carpeta_salida,
+                al_avanzar=al_avanzar, sesion=self.gestor.obtener() if workers <= 1 else None,
+                runtime=self.gestor.runtime
+            )
+            procesados += len(rutas)
+        return procesados
+
+    def ejecutar(self, una_vez=False):
+        """
+        Bucle del servicio: barrido inicial completo y después avisos
+        de inotify o sondeo cada intervalo segundos.
+        """
+        try:
+            # El primer barrido recoge lo que llegó con el servicio parado
+            self.escanear(estables=True)
+            self.procesar_pendientes()
+            while not una_vez and not self._detenido.is_set():
+                if self._avisos:
+                    rutas = self._avisos.esperar(self.intervalo)
+                    if rutas:
+                        self.escanear(rutas, estables=True)
+                else:
+                    self._detenido.wait(self.intervalo)
+                    self.escanear()
+                self.procesar_pendientes()
+        finally:
+            if self._avisos:
+                self._avisos.cerrar()
+            self.diario.cerrar()
+
+# --------------------------------------------------
+#   Línea de comandos
+# --------------------------------------------------
+def crear_parser():
+    parser = argparse.ArgumentParser(
+        prog="bgwatch",
+        description="Vigila carpetas y elimina el fondo de cada imagen nueva."
+    )
+    parser.add_argument("input", nargs="+", help="Carpetas a vigilar")
+    parser.add_argument("-o", "--output", default=None,
+                        help=f"Carpeta de salida (por defecto: {OUTPUT_DIR})")
+    parser.add_argument("--journal", default=DIARIO_POR_DEFECTO, metavar="DB",
+                        help="Diario SQLite de la cola")
+    parser.add_argument("--interval", type=float, default=INTERVALO_POR_DEFECTO, metavar="S",
+                        help="Segundos entre barridos (o espera máxima con --inotify)")
+    parser.add_argument("--settle", type=float, default=ESTABILIDAD_POR_DEFECTO, metavar="S",
+                        help="Segundos sin cambios para dar un archivo por copiado")
+    parser.add_argument("--inotify", action="store_true",
+                        help="Usa inotify en vez de sondeo (Linux, carpetas locales)")
+    parser.add_argument("--once", action="store_true",
+                        help="Procesa lo que haya y termina")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Procesos en paralelo por tanda (por defecto: 1)")
+    parser.add_argument("--model", default=MODELO_POR_DEFECTO, choices=MODELOS_DISPONIBLES,
+                        help=f"Modelo de rembg (por defecto: {MODELO_POR_DEFECTO})")
+    parser.add_argument("--format", default=FORMATO_POR_DEFECTO, choices=list(EXTENSIONES_SALIDA),
+                        help="Formato de salida")
+    parser.add_argument("--png-compression", type=int, default=None, choices=range(10),
+                        metavar="0-9", help="Nivel de compresión PNG")
+    parser.add_argument("--fast-mask", nargs="?", type=int, const=LADO_MASCARA_POR_DEFECTO,
+                        default=None, metavar="LADO",
+                        help="Calcula la máscara a baja resolución (lado mayor en px)")
+    parser.add_argument("--max-memory", type=int, default=None, metavar="MB",
+                        help="Modo por franjas: procesa con un techo de memoria (PNG y máscara)")
+    return parser
+
+def main(argv=None):
+    args = crear_parser().parse_args(argv)
+    for carpeta in args.input:
+        if not os.path.isdir(carpeta):
+            print(f"No es una carpeta: {carpeta}", file=sys.stderr)
+            return 1
+
+    def al_procesar(ruta, registro, error):
+        nombre = os.path.basename(ruta)
+        if error is None:
+            print(f"{nombre}: {registro['total']:.2f} s", flush=True)
+        else:
+            print(f"{nombre}: error: {error}", file=sys.stderr, flush=True)
+
+    vigilante = VigilanteCarpetas(
+        args.input, args.output, args.model, ajustes_desde_args(args), max(1, args.workers),
+        DiarioCola(args.journal), args.interval, args.settle, args.inotify, al_procesar
+    )
+    # Ctrl+C o una parada del sistema terminan la tanda en curso y salen;
+    # lo que quede pendiente sigue en el diario para el próximo arranque
+    for senal in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(senal, lambda *_: vigilante.detener())
+
+    print(f"Vigilando {', '.join(vigilante.carpetas)} → {vigilante.carpeta_salida}", flush=True)
+    print(f"Diario {args.journal}: {vigilante.diario.resumen() or 'vacío'}", flush=True)
+    vigilante.ejecutar(una_vez=args.once)
+    return 0
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
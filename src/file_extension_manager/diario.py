@@ -0,0 +1,289 @@
+"""
+Diario de conversiones para el File Extension Manager. Cada salida
+queda registrada en SQLite con su archivo de origen, los parámetros con
+los que se generó, la huella del origen y su estado. Así un lote
+interrumpido (cancelado, cerrado o caído) se reanuda donde se quedó, y
+una salida cuyo origen y parámetros no han cambiado se salta sin
+decodificar nada.
+
+Uso:
+    python diario.py                # lotes registrados
+    python diario.py --lote 3       # salidas pendientes o con error del lote 3
+"""
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import argparse
+from inventario import SCRIPT_DIR
+
+# --------------------------------------------------
+#   Huella del archivo de origen
+# --------------------------------------------------
+BLOQUE_HUELLA = 1 << 20
+
+def firma_origen(ruta):
+    """
+    (tamaño, mtime_ns, huella) de ruta. La huella es un BLAKE2b de todo
+    el contenido; tamaño y mtime se toman antes de leerlo.
+    """
+    info = os.stat(ruta)
+    resumen = hashlib.blake2b(digest_size=16)
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(BLOQUE_HUELLA), b""):
+            resumen.update(bloque)
+    return info.st_size, info.st_mtime_ns, resumen.hexdigest()
+
+# --------------------------------------------------
+#   Diario SQLite
+# --------------------------------------------------
+DIARIO_POR_DEFECTO = os.path.join(SCRIPT_DIR, "Archive converter", "diario.db")
+# Máximo de parámetros por consulta IN (...) de SQLite
+LOTE_CONSULTA = 500
+
+def texto_parametros(parametros):
+    return json.dumps(parametros, sort_keys=True, ensure_ascii=False)
+
+class DiarioTrabajos:
+    """
+    Dos tablas: lotes (carpeta, parámetros, carpeta de salida y estado
+    de cada conversión por lotes) y trabajos (una fila por salida:
+    origen, parámetros, tamaño/mtime/huella del origen con el que se
+    generó y estado "pendiente", "hecho" o "error"). Una salida está al
+    día si está "hecho", existe y su origen tiene la misma huella; si
+    tamaño y mtime no han cambiado ni siquiera se vuelve a leer el
+    origen.
+    """
+    def __init__(self, ruta=DIARIO_POR_DEFECTO):
+        self.ruta = ruta
+        os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+        self._con = sqlite3.connect(ruta)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.execute("PRAGMA synchronous=NORMAL")
+        with self._con:
+            self._con.execute(
+                """CREATE TABLE IF NOT EXISTS lotes (
+                       id INTEGER PRIMARY KEY,
+                       carpeta TEXT NOT NULL,
+                       parametros TEXT NOT NULL,
+                       carpeta_salida TEXT NOT NULL,
+                       estado TEXT NOT NULL,
+                       creado REAL NOT NULL,
+                       actualizado REAL NOT NULL
+                   )"""
+            )
+            self._con.execute(
+                """CREATE TABLE IF NOT EXISTS trabajos (
+                       salida TEXT PRIMARY KEY,
+                       lote INTEGER,
+                       entrada TEXT NOT NULL,
+                       parametros TEXT NOT NULL,
+                       tamano INTEGER,
+                       mtime_ns INTEGER,
+                       huella TEXT,
+                       estado TEXT NOT NULL,
+                       error TEXT,
+                       actualizado REAL NOT NULL
+                   )"""
+            )
+            self._con.execute("CREATE INDEX IF NOT EXISTS idx_lote ON trabajos (lote)")
+
+    # ---------- Lotes ----------
+    def abrir_lote(self, carpeta, parametros, carpeta_salida):
+        """
+        (lote, carpeta_salida, reanudado). Si la misma carpeta ya se
+        convirtió con los mismos parámetros y su carpeta de salida sigue
+        ahí, se vuelve a usar ese lote y esa carpeta (aunque sea de otro
+        día): así lo ya convertido se salta. reanudado es True si aquel
+        lote no llegó a terminar.
+        """
+        carpeta = os.path.abspath(carpeta)
+        parametros = texto_parametros(parametros)
+        fila = self._con.execute(
+            """SELECT id, carpeta_salida, estado FROM lotes
+               WHERE carpeta = ? AND parametros = ?
+               ORDER BY id DESC LIMIT 1""",
+            (carpeta, parametros)
+        ).fetchone()
+        ahora = time.time()
+        with self._con:
+            if fila and os.path.isdir(fila[1]):
+                self._con.execute(
+                    "UPDATE lotes SET estado = 'en_curso', actualizado = ? WHERE id = ?", (ahora, fila[0])
+                )
+                return fila[0], fila[1], fila[2] == "en_curso"
+            cursor = self._con.execute(
+                "INSERT INTO lotes (carpeta, parametros, carpeta_salida, estado, creado, actualizado) "
+                "VALUES (?, ?, ?, 'en_curso', ?, ?)",
+                (carpeta, parametros, carpeta_salida, ahora, ahora)
+            )
+        return cursor.lastrowid, carpeta_salida, False
+
+    def terminar_lote(self, lote):
+        with self._con:
+            self._con.execute(
+                "UPDATE lotes SET estado = 'terminado', actualizado = ? WHERE id = ?", (time.time(), lote)
+            )
+
+    # ---------- Trabajos ----------
+    def _filas(self, salidas):
+        """
+        {salida: (entrada, parametros, tamaño, mtime_ns, huella, estado)}.
+        """
+        filas = {}
+        for i in range(0, len(salidas), LOTE_CONSULTA):
+            trozo = salidas[i:i + LOTE_CONSULTA]
+            for fila in self._con.execute(
+                "SELECT salida, entrada, parametros, tamano, mtime_ns, huella, estado FROM trabajos "
+                f"WHERE salida IN ({', '.join('?' * len(trozo))})",
+                trozo
+            ):
+                filas[fila[0]] = fila[1:]
+        return filas
+
+    def filtrar(self, trabajos, parametros_de, lote=None):
+        """
+        comprobar y, a continuación, apuntar_pendientes con lo que quede.
+        """
+        pendientes, al_dia = self.comprobar(trabajos, parametros_de)
+        self.apuntar_pendientes(pendientes, parametros_de, lote)
+        return pendientes, al_dia
+
+    def comprobar(self, trabajos, parametros_de):
+        """
+        Quita de trabajos [(entrada, [(salida, formato)], categoría)] las
+        salidas que están al día para los parámetros parametros_de(formato).
+        No apunta nada como pendiente (solo refresca tamaño y mtime de las
+        que siguen al día con otra fecha). Puede leer orígenes enteros
+        para calcular su huella: mejor fuera del hilo de la ventana.
+        Devuelve (trabajos que quedan, salidas al día).
+        """
+        salidas = [os.path.abspath(salida) for _, destinos, _ in trabajos for salida, _ in destinos]
+        filas = self._filas(salidas)
+        huellas = {}
+        pendientes, al_dia = [], 0
+        actualizar = []
+        ahora = time.time()
+        for entrada, destinos, categoria in trabajos:
+            try:
+                info = os.stat(entrada)
+                estado_origen = (info.st_size, info.st_mtime_ns)
+            except OSError:
+                estado_origen = None
+            quedan = []
+            for salida, formato in destinos:
+                clave = os.path.abspath(salida)
+                parametros = texto_parametros(parametros_de(formato))
+                fila = filas.get(clave)
+                if (estado_origen and fila and fila[5] == "hecho" and fila[0] == os.path.abspath(entrada)
+                        and fila[1] == parametros and os.path.exists(salida)):
+                    if fila[2:4] == estado_origen:
+                        al_dia += 1
+                        continue
+                    # Cambió la fecha o el tamaño: manda el contenido
+                    if entrada not in huellas:
+                        try:
+                            huellas[entrada] = firma_origen(entrada)
+                        except OSError:
+                            huellas[entrada] = None
+                    firma = huellas[entrada]
+                    if firma and firma[2] == fila[4]:
+                        actualizar.append((firma[0], firma[1], ahora, clave))
+                        al_dia += 1
+                        continue
+                quedan.append((salida, formato))
+            if quedan:
+                pendientes.append((entrada, quedan, categoria))
+        if actualizar:
+            with self._con:
+                self._con.executemany(
+                    "UPDATE trabajos SET tamano = ?, mtime_ns = ?, actualizado = ? WHERE salida = ?", actualizar
+                )
+        return pendientes, al_dia
+
+    def apuntar_pendientes(self, trabajos, parametros_de, lote=None):
+        """
+        Apunta todas las salidas de trabajos como pendientes del lote.
+        """
+        ahora = time.time()
+        with self._con:
+            self._con.executemany(
+                "INSERT OR REPLACE INTO trabajos (salida, lote, entrada, parametros, estado, actualizado) "
+                "VALUES (?, ?, ?, ?, 'pendiente', ?)",
+                [
+                    (os.path.abspath(salida), lote, os.path.abspath(entrada),
+                     texto_parametros(parametros_de(formato)), ahora)
+                    for entrada, destinos, _ in trabajos for salida, formato in destinos
+                ]
+            )
+
+    def terminar(self, salidas, firma=None, error=None):
+        """
+        Marca salidas como "hecho" con la firma (tamaño, mtime_ns,
+        huella) del origen, o como "error" si hay error.
+        """
+        tamano, mtime_ns, huella = firma or (None, None, None)
+        with self._con:
+            self._con.executemany(
+                "UPDATE trabajos SET estado = ?, tamano = ?, mtime_ns = ?, huella = ?, error = ?, actualizado = ? "
+                "WHERE salida = ?",
+                [
+                    ("error" if error else "hecho", tamano, mtime_ns, huella, error, time.time(),
+                     os.path.abspath(salida))
+                    for salida in salidas
+                ]
+            )
+
+    def lotes(self):
+        """
+        Genera (lote, carpeta, estado, creado) por orden de creación.
+        """
+        yield from self._con.execute("SELECT id, carpeta, estado, creado FROM lotes ORDER BY id")
+
+    def sin_terminar(self, lote):
+        """
+        Genera (salida, estado, error) de las salidas del lote que no están hechas.
+        """
+        yield from self._con.execute(
+            "SELECT salida, estado, error FROM trabajos WHERE lote = ? AND estado != 'hecho' ORDER BY salida",
+            (lote,)
+        )
+
+    def resumen(self, lote):
+        """
+        {estado: salidas} del lote.
+        """
+        return dict(self._con.execute(
+            "SELECT estado, COUNT(*) FROM trabajos WHERE lote = ? GROUP BY estado", (lote,)
+        ))
+
+    def cerrar(self):
+        self._con.close()
+
+# --------------------------------------------------
+#   CLI
+# --------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Consulta el diario de conversiones del File Extension Manager.")
+    parser.add_argument("--db", default=DIARIO_POR_DEFECTO, help="Ruta del diario SQLite")
+    parser.add_argument("--lote", type=int, help="Listar las salidas pendientes o con error de este lote")
+    args = parser.parse_args()
+
+    diario = DiarioTrabajos(args.db)
+    try:
+        if args.lote is None:
+            for lote, carpeta, estado, creado in diario.lotes():
+                cuentas = " · ".join(f"{n} {e}" for e, n in sorted(diario.resumen(lote).items()))
+                print(f"{lote:>4}  {time.strftime('%Y-%m-%d %H:%M', time.localtime(creado))}  "
+                      f"{estado:<10} {carpeta}  ({cuentas or 'vacío'})")
+            return
+        for salida, estado, error in diario.sin_terminar(args.lote):
+            print(f"{estado:<10} {salida}")
+            if error:
+                print(f"           {error.strip().splitlines()[-1]}")
+    finally:
+        diario.cerrar()
+
+if __name__ == "__main__":
+    main()
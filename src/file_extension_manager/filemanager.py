@@ -1,10 +1,23 @@
 import os
 import sys
+import time
+import shutil
+import tempfile
+import threading
 import subprocess
+import multiprocessing
 import tkinter as tk
-from tkinter import filedialog, messagebox
+from tkinter import filedialog, messagebox, ttk
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from PIL import Image, ImageTk
 from datetime import datetime
+from inventario import (
+    IMAGE_FORMATS, VIDEO_FORMATS, AUDIO_FORMATS, Inventario, obtener_extension,
+    determinar_categoria, recorrer
+)
+from sondeos import CacheSondeos, sondear_medio
+from diario import DiarioTrabajos, firma_origen
 
 # --------------------------------------------------
 #   Función para obtener la ruta de recursos 
@@ -19,57 +32,871 @@ def resource_path(filename):
     return os.path.join(base_path, filename)
 
 # --------------------------------------------------
-#   Listas de extensiones admitidas
+#   Escritura atómica de las salidas
 # --------------------------------------------------
-IMAGE_FORMATS = {
-    "jpeg", "jpg", "png", "bmp", "gif", "tiff", "heif", "raw", "psd",
-    "ico", "webp"
-}
-VIDEO_FORMATS = {
-    "mp4", "avi", "mkv", "flv", "mov", "wmv", "divx", "h264", "xvid", "rm", "webm"
-}
-AUDIO_FORMATS = {
-    "wav", "aiff", "au", "flac", "m4a", "shn", "tta", "atrc", "alac",
-    "mp3", "vorbis", "mpc", "aac", "wma", "opus", "ogg", "dsd", "mqa"
-}
+# Súbelo si cambian los ajustes de conversión: lo convertido antes deja
+# de estar al día en el diario
+VERSION_CONVERSION = 1
 
-def obtener_extension(ruta):
-    return os.path.splitext(ruta)[1].lower().lstrip(".")
+def parametros_destino(formato):
+    """
+    Parámetros con los que el diario decide si una salida está al día.
+    """
+    return {"formato": formato.lower(), "version": VERSION_CONVERSION}
 
-def determinar_categoria(ext):
-    if ext in IMAGE_FORMATS:
-        return "imagen"
-    elif ext in VIDEO_FORMATS:
-        return "video"
-    elif ext in AUDIO_FORMATS:
-        return "audio"
-    else:
-        return None
+def ruta_temporal(ruta):
+    """
+    "video.mkv" -> "video.parcial.mkv": misma carpeta (el rename es
+    atómico) y misma extensión (ffmpeg elige el contenedor por ella).
+    """
+    raiz, ext = os.path.splitext(ruta)
+    return f"{raiz}.parcial{ext}"
+
+def publicar_salidas(temporales, destinos, exito, error_msg):
+    """
+    Si todo fue bien, renombra cada temporal a su destino; si no, borra
+    los temporales. Una salida a medias nunca ocupa el nombre final.
+    """
+    if exito:
+        try:
+            for (temporal, _), (ruta, _) in zip(temporales, destinos):
+                os.replace(temporal, ruta)
+            return True, None
+        except OSError as e:
+            exito, error_msg = False, f"No se pudo mover la salida a su sitio: {e}"
+    for temporal, _ in temporales:
+        try:
+            os.remove(temporal)
+        except OSError:
+            pass
+    return exito, error_msg
+
+def formato_pillow(formato):
+    """
+    Nombre del formato para Pillow: "jpg" -> "JPEG" ("JPG" no existe).
+    """
+    return Image.registered_extensions().get(f".{formato.lower()}", formato.upper())
 
 def convertir_imagen(ruta_entrada, ruta_salida, formato_salida):
+    return convertir_imagen_varios(ruta_entrada, [(ruta_salida, formato_salida)])
+
+def convertir_imagen_varios(ruta_entrada, destinos):
+    """
+    Decodifica la imagen una sola vez y la guarda en cada (ruta, formato)
+    de destinos (a través de ruta_temporal). Devuelve (exito, error);
+    el error junta los formatos que fallaron.
+    """
     try:
         img = Image.open(ruta_entrada)
-        if formato_salida.lower() in {"jpeg", "jpg"}:
-            img = img.convert("RGB")
-        img.save(ruta_salida, formato_salida.upper())
-        return True, None
+        img.load()
     except Exception as e:
         return False, str(e)
 
-def convertir_con_ffmpeg(ruta_entrada, ruta_salida):
+    rgb = None
+    errores = []
+    for ruta_salida, formato_salida in destinos:
+        temporal = [(ruta_temporal(ruta_salida), formato_salida)]
+        try:
+            if formato_salida.lower() in {"jpeg", "jpg"}:
+                # La conversión a RGB se comparte entre JPG y JPEG
+                if rgb is None:
+                    rgb = img.convert("RGB")
+                rgb.save(temporal[0][0], formato_pillow(formato_salida))
+            else:
+                img.save(temporal[0][0], formato_pillow(formato_salida))
+            exito, error_msg = publicar_salidas(temporal, [(ruta_salida, formato_salida)], True, None)
+        except Exception as e:
+            exito, error_msg = publicar_salidas(temporal, [(ruta_salida, formato_salida)], False, str(e))
+        if not exito:
+            errores.append(f"{formato_salida.upper()}: {error_msg}")
+    if errores:
+        return False, "\n".join(errores)
+    return True, None
+
+# --------------------------------------------------
+#   Remux: copiar los streams si el contenedor los admite
+# --------------------------------------------------
+# Códecs que cada contenedor acepta tal cual, por tipo de stream.
+# None = acepta cualquiera (Matroska); un tipo ausente se descarta.
+SUBS_TEXTO = {"subrip", "ass", "ssa", "webvtt", "mov_text", "text"}
+CODECS_CONTENEDOR = {
+    "mp4":  {"video": {"h264", "hevc", "mpeg4", "av1", "vp9", "mpeg2video"},
+             "audio": {"aac", "mp3", "ac3", "eac3", "alac", "opus", "flac"},
+             "subtitle": {"mov_text"}},
+    "mov":  {"video": {"h264", "hevc", "mpeg4", "prores", "mjpeg", "mpeg2video"},
+             "audio": {"aac", "mp3", "ac3", "eac3", "alac", "pcm_s16le", "pcm_s24le"},
+             "subtitle": {"mov_text"}},
+    "mkv":  {"video": None, "audio": None, "subtitle": None, "attachment": None},
+    "webm": {"video": {"vp8", "vp9", "av1"}, "audio": {"vorbis", "opus"},
+             "subtitle": {"webvtt"}},
+    "avi":  {"video": {"mpeg4", "h264", "mjpeg", "msmpeg4v3"},
+             "audio": {"mp3", "ac3", "pcm_s16le"}},
+    "flv":  {"video": {"h264", "flv1"}, "audio": {"aac", "mp3"}},
+    "mp3":  {"audio": {"mp3"}},
+    "m4a":  {"audio": {"aac", "alac"}},
+    "aac":  {"audio": {"aac"}},
+    "ogg":  {"audio": {"vorbis", "opus", "flac"}},
+    "opus": {"audio": {"opus"}},
+    "flac": {"audio": {"flac"}},
+    "wav":  {"audio": {"pcm_s16le", "pcm_s24le", "pcm_s32le", "pcm_f32le", "pcm_u8"}},
+    "aiff": {"audio": {"pcm_s16be", "pcm_s24be", "pcm_s32be"}},
+    "wma":  {"audio": {"wmav2"}},
+}
+# Codificador que se usa para un stream que el contenedor no admite
+CODIFICADOR_CONTENEDOR = {
+    "mp4":  {"video": "libx264", "audio": "aac", "subtitle": "mov_text"},
+    "mov":  {"video": "libx264", "audio": "aac", "subtitle": "mov_text"},
+    "webm": {"video": "libvpx-vp9", "audio": "libopus", "subtitle": "webvtt"},
+    "avi":  {"video": "mpeg4", "audio": "libmp3lame"},
+    "flv":  {"video": "libx264", "audio": "aac"},
+    "mp3":  {"audio": "libmp3lame"},
+    "m4a":  {"audio": "aac"},
+    "aac":  {"audio": "aac"},
+    "ogg":  {"audio": "libvorbis"},
+    "opus": {"audio": "libopus"},
+    "flac": {"audio": "flac"},
+    "wav":  {"audio": "pcm_s16le"},
+    "aiff": {"audio": "pcm_s16be"},
+    "wma":  {"audio": "wmav2"},
+}
+DESCRIPCION_MODO = {
+    "remux": "Remux: se copian los streams sin recodificar",
+    "parcial": "Recodificación parcial",
+    "transcodificar": "Recodificación completa",
+}
+
+def planificar_conversion(info, formato_salida):
+    """
+    Decide cómo convertir a formato_salida a partir de sondear_medio:
+    copia los streams que el contenedor admite, recodifica solo los que
+    no y descarta los que no tienen cabida (datos, portadas en audio,
+    subtítulos de imagen en MP4...). Devuelve un dict con "modo"
+    ("remux", "parcial" o "transcodificar"), "argumentos" para ffmpeg,
+    "descripcion", "duracion" y, si se conocen los streams, "mapas"
+    (índices de entrada), "codecs" (uno por mapa), "audiovisuales"
+    (índices de todo el audio y vídeo de la entrada, sin portadas) y
+    "videos" (solo los de vídeo).
+    """
+    completo = {
+        "modo": "transcodificar", "argumentos": [],
+        "descripcion": DESCRIPCION_MODO["transcodificar"],
+        "duracion": info.get("duracion") if info else None,
+        "mapas": None, "codecs": None, "audiovisuales": None, "videos": None,
+    }
+    admitidos = CODECS_CONTENEDOR.get(formato_salida)
+    codificadores = CODIFICADOR_CONTENEDOR.get(formato_salida, {})
+    if not info or admitidos is None:
+        return completo
+
+    mapas, tipos, codecs, recodificados = [], [], [], []
+    for flujo in info["streams"]:
+        tipo, codec = flujo["tipo"], flujo["codec"]
+        if tipo not in admitidos or (flujo["portada"] and "video" not in admitidos):
+            continue
+        if admitidos[tipo] is None or codec in admitidos[tipo]:
+            codecs.append("copy")
+        elif tipo in codificadores and (tipo != "subtitle" or codec in SUBS_TEXTO):
+            codecs.append(codificadores[tipo])
+            recodificados.append(f"{tipo} {codec} → {codificadores[tipo]}")
+        else:
+            continue
+        mapas.append(flujo["indice"])
+        tipos.append(tipo)
+
+    if "video" not in tipos and "audio" not in tipos:
+        return completo
+
+    argumentos = []
+    for indice in mapas:
+        argumentos += ["-map", f"0:{indice}"]
+    for salida, codec in enumerate(codecs):
+        argumentos += [f"-c:{salida}", codec]
+
+    if recodificados and "copy" not in codecs:
+        modo = "transcodificar"
+        descripcion = f"{DESCRIPCION_MODO[modo]} ({', '.join(recodificados)})"
+    elif recodificados:
+        modo = "parcial"
+        descripcion = f"{DESCRIPCION_MODO[modo]} ({', '.join(recodificados)}; el resto se copia)"
+    else:
+        modo = "remux"
+        descripcion = DESCRIPCION_MODO[modo]
+    return {"modo": modo, "argumentos": argumentos, "descripcion": descripcion,
+            "duracion": info.get("duracion"), "mapas": mapas, "codecs": codecs,
+            "audiovisuales": [
+                flujo["indice"] for flujo in info["streams"]
+                if flujo["tipo"] in ("video", "audio") and not flujo["portada"]
+            ],
+            "videos": [
+                flujo["indice"] for flujo in info["streams"]
+                if flujo["tipo"] == "video" and not flujo["portada"]
+            ]}
+
+def plan_para_archivo(ruta_entrada, formato_salida):
+    return planes_para_archivo(ruta_entrada, [formato_salida])[0]
+
+def planes_para_archivo(ruta_entrada, formatos_salida, cache=None):
+    """
+    planificar_conversion para cada formato con un solo ffprobe (o
+    ninguno si el archivo está en la CacheSondeos); si ffprobe no está
+    o falla, se recodifica todo como antes.
+    """
     try:
-        cmd = ["ffmpeg", "-y", "-i", ruta_entrada, ruta_salida]
-        proceso = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        if proceso.returncode == 0:
-            return True, None
+        info = cache.obtener(ruta_entrada) if cache else sondear_medio(ruta_entrada)
+    except (OSError, RuntimeError, ValueError):
+        info = None
+    return planes_desde_info(info, formatos_salida)
+
+def planes_desde_info(info, formatos_salida):
+    planes = []
+    for formato_salida in formatos_salida:
+        plan = planificar_conversion(info, formato_salida)
+        if info is None:
+            plan["descripcion"] += " (ffprobe no disponible)"
+        planes.append(plan)
+    return planes
+
+# --------------------------------------------------
+#   Ejecución de ffmpeg en segundo plano
+# --------------------------------------------------
+# Líneas de stderr que se guardan para el mensaje de error
+LINEAS_STDERR = 200
+LARGO_LINEA_STDERR = 2000
+
+def segundos_desde_tiempo(texto):
+    """
+    "01:02:03.50" -> 3723.5; None si no se puede leer.
+    """
+    try:
+        h, m, s = texto.strip().split(":")
+        return int(h) * 3600 + int(m) * 60 + float(s)
+    except ValueError:
+        return None
+
+class TrabajoFFmpeg:
+    """
+    Lanza ffmpeg con -progress pipe:1 y lee el progreso línea a línea en
+    un hilo propio. salidas es una lista de (ruta, argumentos): todas
+    salen de la misma decodificación de la entrada. stderr va a un
+    buffer circular de LINEAS_STDERR líneas. al_progreso(fraccion,
+    eta_segundos) se llama desde el hilo lector; fraccion y eta son None
+    mientras no se conozca la duración.
+    """
+    def __init__(self, ruta_entrada, salidas, al_progreso=None, duracion=None, argumentos_entrada=()):
+        self.ruta_entrada = ruta_entrada
+        self.argumentos_entrada = list(argumentos_entrada)
+        self.salidas = [(ruta, list(argumentos)) for ruta, argumentos in salidas]
+        self.al_progreso = al_progreso
+        self.duracion = duracion
+        self.stderr = deque(maxlen=LINEAS_STDERR)
+        self.fraccion = 0.0
+        self.eta = None
+        self.cancelado = False
+        self._proceso = None
+        self._hilos = []
+        self._inicio = None
+
+    def comando(self):
+        comando = (["ffmpeg", "-y", "-hide_banner", "-nostats", "-progress", "pipe:1"]
+                   + self.argumentos_entrada + ["-i", self.ruta_entrada])
+        for ruta, argumentos in self.salidas:
+            comando += argumentos + [ruta]
+        return comando
+
+    def iniciar(self):
+        self._inicio = time.monotonic()
+        self._proceso = subprocess.Popen(
+            self.comando(), stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        self._hilos = [
+            threading.Thread(target=self._leer_progreso, daemon=True),
+            threading.Thread(target=self._leer_stderr, daemon=True),
+        ]
+        for hilo in self._hilos:
+            hilo.start()
+        return self
+
+    def _leer_stderr(self):
+        for linea in self._proceso.stderr:
+            texto = linea.decode("utf-8", errors="ignore").rstrip()[:LARGO_LINEA_STDERR]
+            if self.duracion is None and texto.lstrip().startswith("Duration:"):
+                # "  Duration: 00:01:23.45, start: 0.000000, bitrate: ..."
+                self.duracion = segundos_desde_tiempo(texto.split("Duration:", 1)[1].split(",", 1)[0])
+            self.stderr.append(texto)
+
+    def _leer_progreso(self):
+        bloque = {}
+        for linea in self._proceso.stdout:
+            clave, _, valor = linea.decode("ascii", errors="ignore").strip().partition("=")
+            bloque[clave] = valor
+            # Cada bloque de -progress termina en progress=continue|end
+            if clave == "progress":
+                self._actualizar(bloque, terminado=valor == "end")
+                bloque = {}
+
+    def _actualizar(self, bloque, terminado=False):
+        if terminado:
+            self.fraccion, self.eta = 1.0, 0.0
         else:
-            error_msg = proceso.stderr.decode("utf-8", errors="ignore")
-            return False, error_msg
+            try:
+                # out_time_us y out_time_ms vienen ambos en microsegundos
+                hecho = int(bloque.get("out_time_us") or bloque.get("out_time_ms")) / 1_000_000
+            except (TypeError, ValueError):
+                hecho = None
+            if not self.duracion or hecho is None or hecho < 0:
+                if self.al_progreso:
+                    self.al_progreso(None, None)
+                return
+            self.fraccion = min(hecho / self.duracion, 1.0)
+            transcurrido = time.monotonic() - self._inicio
+            self.eta = transcurrido * (1 - self.fraccion) / self.fraccion if self.fraccion > 0 else None
+        if self.al_progreso:
+            self.al_progreso(self.fraccion, self.eta)
+
+    def cancelar(self):
+        self.cancelado = True
+        if self._proceso and self._proceso.poll() is None:
+            self._proceso.terminate()
+
+    def esperar(self, cancelacion=None):
+        """
+        Espera a que ffmpeg termine y devuelve (exito, error). Si el evento
+        cancelacion se activa, termina ffmpeg y borra las salidas a medias.
+        """
+        while True:
+            try:
+                self._proceso.wait(timeout=0.2)
+                break
+            except subprocess.TimeoutExpired:
+                if cancelacion is not None and cancelacion.is_set() and not self.cancelado:
+                    self.cancelar()
+                if self.cancelado:
+                    try:
+                        self._proceso.wait(timeout=5)
+                    except subprocess.TimeoutExpired:
+                        self._proceso.kill()
+                        self._proceso.wait()
+                    break
+        for hilo in self._hilos:
+            hilo.join()
+
+        if self.cancelado:
+            for ruta, _ in self.salidas:
+                try:
+                    os.remove(ruta)
+                except OSError:
+                    pass
+            return False, "Conversión cancelada."
+        if self._proceso.returncode == 0:
+            return True, None
+        return False, "\n".join(self.stderr)
+
+def convertir_con_ffmpeg(ruta_entrada, ruta_salida, hilos=None, al_progreso=None, cancelacion=None,
+                         plan=None, al_plan=None):
+    """
+    Convierte con el plan dado o con plan_para_archivo. al_plan(plan)
+    avisa de la vía elegida. Si la copia de streams falla se reintenta
+    recodificando todo.
+    """
+    return convertir_con_ffmpeg_varios(
+        ruta_entrada, [(ruta_salida, obtener_extension(ruta_salida))], hilos, al_progreso, cancelacion,
+        planes=[plan] if plan else None,
+        al_plan=(lambda planes: al_plan(planes[0])) if al_plan else None
+    )
+
+def convertir_con_ffmpeg_varios(ruta_entrada, destinos, hilos=None, al_progreso=None, cancelacion=None,
+                                planes=None, al_plan=None, segmento=0, workers_segmentos=None):
+    """
+    ejecutar_ffmpeg_varios escribiendo en nombres temporales que solo
+    pasan a su nombre final si la conversión termina bien.
+    """
+    temporales = [(ruta_temporal(ruta), formato) for ruta, formato in destinos]
+    exito, error_msg = ejecutar_ffmpeg_varios(
+        ruta_entrada, temporales, hilos, al_progreso, cancelacion, planes, al_plan, segmento, workers_segmentos
+    )
+    return publicar_salidas(temporales, destinos, exito, error_msg)
+
+def ejecutar_ffmpeg_varios(ruta_entrada, destinos, hilos=None, al_progreso=None, cancelacion=None,
+                           planes=None, al_plan=None, segmento=0, workers_segmentos=None):
+    """
+    Un solo ffmpeg con una salida por cada (ruta, formato) de destinos:
+    la entrada se lee y decodifica una vez. Cada salida lleva su propio
+    plan (copia o recodificación); al_plan(planes) avisa de ellos. Si
+    alguna copia de streams falla, se repite todo recodificando.
+    Con segmento > 0 los archivos largos que hay que recodificar se
+    trocean y se convierten en paralelo (convertir_por_segmentos); si
+    eso falla se convierten de una pieza.
+    """
+    try:
+        if planes is None:
+            planes = planes_para_archivo(ruta_entrada, [formato for _, formato in destinos])
+        hilos_arg = ["-threads", str(hilos)] if hilos else []
+
+        if segmento and se_puede_segmentar(planes, segmento):
+            if al_plan:
+                al_plan([
+                    dict(plan, descripcion=f"{plan['descripcion']} · en segmentos de {segmento} s en paralelo")
+                    for plan in planes
+                ])
+            try:
+                exito, error_msg = convertir_por_segmentos(
+                    ruta_entrada, destinos, planes, segmento, workers_segmentos, al_progreso, cancelacion
+                )
+            except Exception as e:
+                # p. ej. ffprobe no puede leer la salida unida: se prueba de una pieza
+                exito, error_msg = False, str(e)
+            if exito or (cancelacion is not None and cancelacion.is_set()):
+                return exito, error_msg
+            planes = [
+                dict(plan, descripcion=f"{plan['descripcion']} (falló por segmentos: {resumir_error(error_msg)})")
+                for plan in planes
+            ]
+
+        while True:
+            if al_plan:
+                al_plan(planes)
+            trabajo = TrabajoFFmpeg(
+                ruta_entrada,
+                [(ruta, plan["argumentos"] + hilos_arg) for (ruta, _), plan in zip(destinos, planes)],
+                al_progreso, planes[0]["duracion"]
+            ).iniciar()
+            exito, error_msg = trabajo.esperar(cancelacion)
+            if exito or trabajo.cancelado or all(plan["modo"] == "transcodificar" for plan in planes):
+                return exito, error_msg
+            completo = dict(planificar_conversion(None, None), duracion=planes[0]["duracion"])
+            completo["descripcion"] += " (la copia de streams falló)"
+            planes = [dict(completo) for _ in destinos]
     except FileNotFoundError:
         return False, "No se encontró FFmpeg. Verifica que esté instalado y en tu PATH."
     except Exception as e:
         return False, str(e)
 
+# --------------------------------------------------
+#   Conversión por segmentos en paralelo
+# --------------------------------------------------
+NUCLEOS = os.cpu_count() or 1
+# Largo de cada trozo en segundos; 0 = convertir de una pieza
+SEGMENTO_POR_DEFECTO = 0
+# Por debajo de tantos trozos no compensa dividir
+SEGMENTOS_MINIMOS = 3
+# Cada ffmpeg de un trozo usa pocos hilos: el paralelismo viene de los trozos
+WORKERS_SEGMENTOS = max(1, NUCLEOS // 2)
+# Diferencia de duración admitida entre entrada y salida unida (el audio
+# va entero, así que solo cabe el redondeo del último fotograma)
+TOLERANCIA_DURACION = 0.001
+TOLERANCIA_DURACION_MINIMA = 0.2
+
+class EventoCompuesto:
+    """
+    Se considera activo si lo está cualquiera de los eventos (los None
+    se ignoran). Sirve como cancelacion para TrabajoFFmpeg.esperar.
+    """
+    def __init__(self, *eventos):
+        self.eventos = [e for e in eventos if e is not None]
+
+    def is_set(self):
+        return any(e.is_set() for e in self.eventos)
+
+def se_puede_segmentar(planes, segmento):
+    """
+    Solo se trocean entradas largas, con streams conocidos de audio y
+    vídeo (los subtítulos y adjuntos no se dejan cortar), y cuando hay
+    vídeo que recodificar: el audio va siempre de una pieza y un remux
+    ya es rápido.
+    """
+    duracion = planes[0]["duracion"]
+    if not duracion or duracion < segmento * SEGMENTOS_MINIMOS:
+        return False
+    for plan in planes:
+        if plan["mapas"] is None or not set(plan["mapas"]) <= set(plan["audiovisuales"]):
+            return False
+    return any(video_recodificado(plan, plan["videos"]) for plan in planes)
+
+def leer_lista_segmentos(ruta_lista, carpeta):
+    """
+    Lee la lista csv del muxer segment: "archivo,inicio,fin" por línea.
+    Devuelve [(ruta, duración)].
+    """
+    segmentos = []
+    with open(ruta_lista, encoding="utf-8") as f:
+        for linea in f:
+            campos = linea.strip().rsplit(",", 2)
+            if len(campos) != 3:
+                continue
+            archivo, inicio, fin = campos
+            segmentos.append((os.path.join(carpeta, archivo), float(fin) - float(inicio)))
+    return segmentos
+
+def escribir_lista_concat(ruta_lista, partes):
+    with open(ruta_lista, "w", encoding="utf-8") as f:
+        for parte in partes:
+            # El demuxer concat usa comillas simples; una comilla se escribe '\''
+            f.write("file '" + os.path.abspath(parte).replace("'", "'\\''") + "'\n")
+
+def video_recodificado(plan, videos):
+    """
+    Índices de entrada de los streams de vídeo que plan recodifica.
+    """
+    return [
+        indice for indice, codec in zip(plan["mapas"], plan["codecs"])
+        if indice in videos and codec != "copy"
+    ]
+
+def convertir_por_segmentos(ruta_entrada, destinos, planes, segmento, workers=None, al_progreso=None,
+                            cancelacion=None):
+    """
+    Solo se trocea el vídeo: el audio no admite cortes sin que el
+    priming y el relleno del codificador (AAC, Opus...) dejen huecos o
+    chasquidos en cada unión, así que se copia o codifica una sola vez
+    sobre el archivo entero.
+    1. Divide el vídeo copiando streams (-f segment): los cortes caen
+       en fotogramas clave, así que no se pierde nada.
+    2. Codifica los trozos a la vez en un pool, cada uno con una salida
+       por destino que recodifica vídeo.
+    3. Un último ffmpeg une los trozos de cada destino (demuxer concat,
+       sin recodificar) y toma el resto de streams de la entrada con el
+       códec de su plan.
+    4. Comprueba que cada salida dura lo mismo que la entrada.
+    Devuelve (exito, error). Los archivos temporales van en una carpeta
+    oculta junto a la salida y se borran siempre.
+    """
+    duracion = planes[0]["duracion"]
+    videos = planes[0]["videos"]
+    recodificado = [video_recodificado(plan, videos) for plan in planes]
+    workers = workers or WORKERS_SEGMENTOS
+    hilos = max(1, NUCLEOS // workers)
+    parar = threading.Event()
+    detener = EventoCompuesto(cancelacion, parar)
+    carpeta = tempfile.mkdtemp(prefix=".segmentos_", dir=os.path.dirname(os.path.abspath(destinos[0][0])))
+    try:
+        # 1. División del vídeo en trozos (mkv admite cualquier códec)
+        lista = os.path.join(carpeta, "segmentos.csv")
+        mapas_entrada = []
+        for indice in videos:
+            mapas_entrada += ["-map", f"0:{indice}"]
+        exito, error_msg = TrabajoFFmpeg(
+            ruta_entrada,
+            [(os.path.join(carpeta, "entrada_%05d.mkv"),
+              mapas_entrada + ["-c", "copy", "-f", "segment", "-segment_time", str(segmento),
+                               "-reset_timestamps", "1", "-segment_list", lista,
+                               "-segment_list_type", "csv"])],
+            duracion=duracion
+        ).iniciar().esperar(detener)
+        if not exito:
+            return False, error_msg
+        segmentos = leer_lista_segmentos(lista, carpeta)
+        if not segmentos:
+            return False, "ffmpeg no generó ningún segmento."
+
+        # 2. Codificación en paralelo; en el trozo el stream n es videos[n]
+        posicion = {indice: n for n, indice in enumerate(videos)}
+        con_trozos = [d for d in range(len(destinos)) if recodificado[d]]
+        partes = {
+            d: [os.path.join(carpeta, f"salida{d}_{k:05d}.mkv") for k in range(len(segmentos))]
+            for d in con_trozos
+        }
+        hecho = [0.0] * len(segmentos)
+        cerrojo = threading.Lock()
+        inicio = time.monotonic()
+        total = sum(d for _, d in segmentos) or 1.0
+
+        def avisar(global_):
+            transcurrido = time.monotonic() - inicio
+            al_progreso(global_, transcurrido * (1 - global_) / global_ if global_ > 0 else None)
+
+        def avanzar(k, fraccion):
+            if fraccion is None or not al_progreso:
+                return
+            with cerrojo:
+                hecho[k] = fraccion * segmentos[k][1]
+                global_ = min(sum(hecho) / total, 1.0) * 0.9
+            avisar(global_)
+
+        def convertir_trozo(k):
+            ruta_trozo, duracion_trozo = segmentos[k]
+            salidas = []
+            for d in con_trozos:
+                plan = planes[d]
+                argumentos = []
+                for indice in recodificado[d]:
+                    argumentos += ["-map", f"0:{posicion[indice]}"]
+                for n, indice in enumerate(recodificado[d]):
+                    argumentos += [f"-c:{n}", plan["codecs"][plan["mapas"].index(indice)]]
+                salidas.append((partes[d][k], argumentos + ["-threads", str(hilos)]))
+            return TrabajoFFmpeg(
+                ruta_trozo, salidas, lambda fraccion, eta: avanzar(k, fraccion), duracion_trozo
+            ).iniciar().esperar(detener)
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futuros = {pool.submit(convertir_trozo, k): k for k in range(len(segmentos))}
+            for futuro in as_completed(futuros):
+                exito, error_msg = futuro.result()
+                if not exito:
+                    # El primer fallo detiene el resto de trozos
+                    parar.set()
+                    return False, f"Segmento {futuros[futuro] + 1}: {error_msg}"
+
+        # 3. Unión sin recodificar + el resto de streams de la entrada
+        #    (entradas 0..n-1: una lista concat por destino; n: el original)
+        argumentos_entrada = []
+        for n, d in enumerate(con_trozos):
+            lista_concat = os.path.join(carpeta, f"concat{d}.txt")
+            escribir_lista_concat(lista_concat, partes[d])
+            argumentos_entrada += ["-f", "concat", "-safe", "0", "-i", lista_concat]
+        original = len(con_trozos)
+        salidas = []
+        for d, ((ruta_salida, _), plan) in enumerate(zip(destinos, planes)):
+            mapas, codecs = [], []
+            for indice, codec in zip(plan["mapas"], plan["codecs"]):
+                if indice in recodificado[d]:
+                    mapas += ["-map", f"{con_trozos.index(d)}:{recodificado[d].index(indice)}"]
+                    codecs.append("copy")
+                else:
+                    mapas += ["-map", f"{original}:{indice}"]
+                    codecs.append(codec)
+            for n, codec in enumerate(codecs):
+                mapas += [f"-c:{n}", codec]
+            salidas.append((ruta_salida, mapas))
+        exito, error_msg = TrabajoFFmpeg(
+            ruta_entrada, salidas,
+            (lambda fraccion, eta: avisar(0.9 + 0.1 * fraccion)) if al_progreso else None,
+            duracion, argumentos_entrada
+        ).iniciar().esperar(detener)
+        if not exito:
+            return False, error_msg
+
+        # 4. Comprobación de duración
+        tolerancia = max(TOLERANCIA_DURACION_MINIMA, duracion * TOLERANCIA_DURACION)
+        for ruta_salida, _ in destinos:
+            obtenida = sondear_medio(ruta_salida)["duracion"]
+            if obtenida is None or abs(obtenida - duracion) > tolerancia:
+                return False, (
+                    f"La duración de {os.path.basename(ruta_salida)} "
+                    f"({obtenida or 0:.2f} s) no coincide con la de la entrada ({duracion:.2f} s)."
+                )
+        if al_progreso:
+            al_progreso(1.0, 0.0)
+        return True, None
+    finally:
+        parar.set()
+        shutil.rmtree(carpeta, ignore_errors=True)
+
+def formatear_eta(segundos):
+    if segundos is None:
+        return "calculando…"
+    segundos = int(round(segundos))
+    if segundos >= 3600:
+        return f"{segundos // 3600}h {segundos % 3600 // 60:02d}m"
+    return f"{segundos // 60}:{segundos % 60:02d}"
+
+# --------------------------------------------------
+#   Conversión por lotes de una carpeta
+# --------------------------------------------------
+# Las imágenes se convierten en un pool de procesos del tamaño de la máquina
+WORKERS_IMAGEN = NUCLEOS
+# ffmpeg ya usa varios hilos: pocos procesos a la vez y los hilos repartidos
+FFMPEG_SIMULTANEOS = max(1, NUCLEOS // 4)
+# Huellas del diario: casi todo es leer disco
+WORKERS_HUELLA = 2
+
+def interpretar_patrones(texto):
+    """
+    Convierte "*.png; fotos/*" en ["*.png", "fotos/*"].
+    """
+    return [p.strip() for p in texto.replace(",", ";").split(";") if p.strip()]
+
+def recorrer_carpeta(carpeta, incluir=None, excluir=None, recursivo=True, inventario=None,
+                     al_indexar=None):
+    """
+    Genera (ruta, ruta relativa, categoría) de los archivos de la carpeta
+    que encajan con algún patrón de incluir (todos si no hay) y con
+    ninguno de excluir. Sin inventario la categoría sale de la
+    extensión; con él, el índice se pone al día y la categoría sale de
+    la firma del archivo; al_indexar(vistos) informa del barrido.
+    """
+    if inventario is None:
+        for ruta, relativa, _, _ in recorrer(carpeta, incluir, excluir, recursivo):
+            yield ruta, relativa, determinar_categoria(obtener_extension(ruta))
+        return
+    inventario.escanear(carpeta, incluir, excluir, recursivo, al_indexar)
+    prefijo = len(os.path.abspath(carpeta).rstrip(os.sep)) + 1
+    for ruta, _, _, _, categoria in inventario.archivos(carpeta):
+        yield ruta, ruta[prefijo:], categoria
+
+def preparar_trabajos(carpeta, formatos_salida, carpeta_salida, incluir=None, excluir=None,
+                      recursivo=True, inventario=None, al_indexar=None):
+    """
+    Lista (entrada, destinos, categoría) de los archivos cuya categoría
+    tiene algún formato en formatos_salida; destinos son los (salida,
+    formato) de esa categoría distintos de su extensión. Las salidas
+    conservan las subcarpetas; si dos archivos darían el mismo nombre,
+    el segundo lleva su extensión original. Con inventario la categoría
+    sale de la firma de cada archivo (ver recorrer_carpeta). Devuelve
+    también cuántos archivos se omitieron.
+    """
+    if isinstance(formatos_salida, str):
+        formatos_salida = [formatos_salida]
+    trabajos = []
+    usadas = set()
+    omitidos = 0
+    for ruta, relativa, categoria in recorrer_carpeta(
+        carpeta, incluir, excluir, recursivo, inventario, al_indexar
+    ):
+        ext = obtener_extension(ruta)
+        formatos = [f for f in formatos_salida if f != ext and determinar_categoria(f) == categoria]
+        if categoria is None or not formatos:
+            omitidos += 1
+            continue
+        base = os.path.splitext(relativa)[0]
+        destinos = []
+        for formato in formatos:
+            salida = os.path.join(carpeta_salida, f"{base}.{formato}")
+            if salida.lower() in usadas:
+                salida = os.path.join(carpeta_salida, f"{base}_{ext}.{formato}")
+            usadas.add(salida.lower())
+            destinos.append((salida, formato))
+        trabajos.append((ruta, destinos, categoria))
+    return trabajos, omitidos
+
+def convertir_lote(trabajos, al_avanzar=None, workers=WORKERS_IMAGEN,
+                   ffmpeg_simultaneos=FFMPEG_SIMULTANEOS, cancelacion=None, al_plan=None,
+                   segmento=0, cache=None, diario=None):
+    """
+    Convierte las imágenes en un pool de procesos y lanza ffmpeg para
+    audio y vídeo con un máximo de ffmpeg_simultaneos a la vez. Cada
+    archivo se decodifica una vez para todos sus destinos. Con segmento
+    > 0 los archivos largos se trocean (ver convertir_por_segmentos),
+    repartiendo WORKERS_SEGMENTOS entre los ffmpeg simultáneos. Con una
+    CacheSondeos, todo el audio y vídeo se sondea de una vez antes de
+    empezar (en paralelo y solo lo que no esté ya en la caché). Con un
+    DiarioTrabajos, cada archivo terminado se apunta en él junto con la
+    huella de su origen, que se calcula en paralelo a la conversión.
+    al_avanzar(hechas, total, ruta, error) se llama tras cada archivo.
+    Si el evento cancelacion se activa, se descartan los pendientes y se
+    detienen los ffmpeg en marcha; lo que aún termine se apunta en el
+    diario, pero no cuenta como hecho ni como error. al_plan(ruta, planes) dice si cada
+    salida de audio o vídeo se copió o se recodificó. Devuelve la lista
+    de (ruta, error) de los que fallaron (los cancelados no cuentan
+    como error).
+    """
+    total = len(trabajos)
+    errores = []
+    imagenes = [t for t in trabajos if t[2] == "imagen"]
+    medios = [t for t in trabajos if t[2] != "imagen"]
+    hilos = max(1, NUCLEOS // max(1, ffmpeg_simultaneos))
+    workers_segmentos = max(1, WORKERS_SEGMENTOS // max(1, ffmpeg_simultaneos))
+
+    for _, destinos, _ in trabajos:
+        for salida, _ in destinos:
+            os.makedirs(os.path.dirname(salida), exist_ok=True)
+
+    infos = {}
+    if cache is not None and medios:
+        try:
+            infos = cache.obtener_varios([entrada for entrada, _, _ in medios])
+        except OSError:
+            # Sin ffprobe: cada archivo se recodifica entero
+            infos = {}
+
+    pool_imagenes = ProcessPoolExecutor(max_workers=max(1, min(workers, len(imagenes)))) if imagenes else None
+    pool_ffmpeg = ThreadPoolExecutor(max_workers=ffmpeg_simultaneos) if medios else None
+    pool_huellas = ThreadPoolExecutor(max_workers=WORKERS_HUELLA) if diario is not None and trabajos else None
+    try:
+        # Las huellas se leen del origen antes de que acabe su conversión
+        huellas = {
+            entrada: pool_huellas.submit(firma_origen, entrada) for entrada, _, _ in trabajos
+        } if pool_huellas else {}
+        destinos_de = {entrada: destinos for entrada, destinos, _ in trabajos}
+        futuros = {}
+        for entrada, destinos, _ in imagenes:
+            futuros[pool_imagenes.submit(convertir_imagen_varios, entrada, destinos)] = entrada
+        for entrada, destinos, _ in medios:
+            aviso = (lambda planes, ruta=entrada: al_plan(ruta, planes)) if al_plan else None
+            planes = planes_desde_info(infos.get(entrada), [f for _, f in destinos]) if cache is not None else None
+            futuros[pool_ffmpeg.submit(
+                convertir_con_ffmpeg_varios, entrada, destinos, hilos,
+                cancelacion=cancelacion, planes=planes, al_plan=aviso,
+                segmento=segmento, workers_segmentos=workers_segmentos
+            )] = entrada
+
+        hechas = 0
+        cancelado = False
+        for futuro in as_completed(futuros):
+            if futuro.cancelled():
+                continue
+            if not cancelado and cancelacion is not None and cancelacion.is_set():
+                cancelado = True
+                for pendiente in futuros:
+                    pendiente.cancel()
+            entrada = futuros[futuro]
+            try:
+                exito, error_msg = futuro.result()
+            except Exception as e:
+                exito, error_msg = False, str(e)
+            # Lo que termina después de cancelar también queda en el diario
+            if diario is not None:
+                registrar_en_diario(diario, destinos_de[entrada], huellas[entrada].result, exito, error_msg)
+            if cancelado:
+                continue
+            hechas += 1
+            if not exito:
+                errores.append((entrada, error_msg))
+            if al_avanzar:
+                al_avanzar(hechas, total, entrada, None if exito else error_msg)
+    finally:
+        for pool in (pool_imagenes, pool_ffmpeg):
+            if pool:
+                pool.shutdown()
+        if pool_huellas:
+            pool_huellas.shutdown(cancel_futures=True)
+    return errores
+
+def registrar_en_diario(diario, destinos, huella, exito, error_msg):
+    """
+    Apunta en el diario las salidas de un archivo. huella() devuelve la
+    firma_origen de la entrada y solo se llama si todo fue bien. Si algo
+    falla, todos los destinos del archivo quedan con error y se repiten
+    en el siguiente lote.
+    """
+    rutas = [ruta for ruta, _ in destinos]
+    if not exito:
+        diario.terminar(rutas, error=error_msg or "Error desconocido")
+        return
+    try:
+        firma = huella()
+    except OSError:
+        firma = None
+    diario.terminar(rutas, firma)
+
+def resumir_error(error_msg):
+    """
+    Última línea no vacía del error (ffmpeg deja la causa al final).
+    """
+    lineas = [l.strip() for l in (error_msg or "").splitlines() if l.strip()]
+    return lineas[-1] if lineas else "Error desconocido"
+
+def guardar_resumen_errores(carpeta, errores):
+    """
+    Escribe todos los errores del lote en errores.txt y devuelve su ruta.
+    """
+    ruta = os.path.join(carpeta, "errores.txt")
+    with open(ruta, "w", encoding="utf-8") as f:
+        for entrada, error_msg in errores:
+            f.write(f"{entrada}\n    {resumir_error(error_msg)}\n")
+    return ruta
+
+def carpeta_salida_del_dia():
+    """
+    <carpeta del programa>/Archive converter/<AAAA-MM-DD>, creada si no existe.
+    """
+    raiz = os.path.dirname(os.path.abspath(sys.argv[0])) if not getattr(sys, "frozen", False) else os.path.dirname(sys.executable)
+    carpeta_base = os.path.join(raiz, "Archive converter")
+    fecha_hoy = datetime.now().strftime("%Y-%m-%d")
+    carpeta_fecha = os.path.join(carpeta_base, fecha_hoy)
+    os.makedirs(carpeta_fecha, exist_ok=True)
+    return carpeta_fecha
+
 def abrir_en_explorador(ruta_carpeta):
     if sys.platform.startswith("win"):
         os.startfile(ruta_carpeta)
@@ -85,8 +912,13 @@ class FileExtensionChanger(tk.Tk):
     def __init__(self):
         super().__init__()
         self._ruta_seleccionada = None
+        self._carpeta_seleccionada = None
         self._categoria = None
         self._ultima_carpeta_salida = None
+        self._conversion_en_curso = False
+        self._cancelacion = threading.Event()
+        self._planes_archivo = None
+        self._formatos_archivo = []
 
         # --------- Configuración de ventana ----------
         self.title("Yuuruii's File Extension Manager")
@@ -94,9 +926,9 @@ class FileExtensionChanger(tk.Tk):
         self.configure(bg="#202020")
         self.resizable(False, False)
 
-        # Tamaño 800×350, centrado
+        # Tamaño 800×470, centrado
         window_width = 800
-        window_height = 350
+        window_height = 470
         screen_w = self.winfo_screenwidth()
         screen_h = self.winfo_screenheight()
         pos_x = (screen_w // 2) - (window_width // 2)
@@ -160,7 +992,7 @@ class FileExtensionChanger(tk.Tk):
 
         # --------- Contenedor principal ----------
         container = tk.Frame(self, bg="#202020")
-        container.place(x=0, y=40, width=800, height=310)
+        container.place(x=0, y=40, width=800, height=430)
 
         # Encabezado dentro del contenedor
         lbl_encabezado = tk.Label(
@@ -172,9 +1004,12 @@ class FileExtensionChanger(tk.Tk):
         )
         lbl_encabezado.pack(pady=(20, 10))
 
-        # Botón “Seleccionar archivo…”
+        # Botones “Seleccionar archivo…” y “Seleccionar carpeta…”
+        marco_seleccion = tk.Frame(container, bg="#202020")
+        marco_seleccion.pack(pady=(0, 15))
+
         btn_seleccionar = tk.Button(
-            container,
+            marco_seleccion,
             text="Seleccionar archivo…",
             bg="#181818",
             fg="#FF00FF",
@@ -186,7 +1021,24 @@ class FileExtensionChanger(tk.Tk):
             padx=20,
             pady=8
         )
-        btn_seleccionar.pack(pady=(0, 15))
+        btn_seleccionar.pack(side="left", padx=(0, 10))
+        self.btn_seleccionar = btn_seleccionar
+
+        btn_seleccionar_carpeta = tk.Button(
+            marco_seleccion,
+            text="Seleccionar carpeta…",
+            bg="#181818",
+            fg="#FF00FF",
+            font=("Segoe UI", 12, "bold"),
+            bd=0,
+            activebackground="#FF5555",
+            activeforeground="#FFFFFF",
+            command=self._seleccionar_carpeta,
+            padx=20,
+            pady=8
+        )
+        btn_seleccionar_carpeta.pack(side="left", padx=(10, 0))
+        self.btn_seleccionar_carpeta = btn_seleccionar_carpeta
 
         # Etiqueta que muestra la ruta del archivo seleccionado
         self.lbl_ruta = tk.Label(
@@ -198,7 +1050,41 @@ class FileExtensionChanger(tk.Tk):
             wraplength=760,
             justify="center"
         )
-        self.lbl_ruta.pack(pady=(0, 15))
+        self.lbl_ruta.pack(pady=(0, 10))
+
+        # Filtros del lote (solo se usan al convertir una carpeta)
+        marco_filtros = tk.Frame(container, bg="#202020")
+        marco_filtros.pack(pady=(0, 10), padx=20)
+
+        self._incluir_var = tk.StringVar(value="*")
+        self._excluir_var = tk.StringVar(value="")
+        self._recursivo_var = tk.BooleanVar(value=True)
+        for columna, (texto, variable) in enumerate((("Incluir:", self._incluir_var),
+                                                     ("Excluir:", self._excluir_var))):
+            tk.Label(
+                marco_filtros, text=texto, bg="#202020", fg="#FF00FF", font=("Segoe UI", 10)
+            ).grid(row=0, column=columna * 2, sticky="e", padx=(10 if columna else 0, 5))
+            tk.Entry(
+                marco_filtros, textvariable=variable, width=16,
+                bg="#181818", fg="#FF00FF", insertbackground="#FF00FF",
+                font=("Segoe UI", 10), bd=0, highlightthickness=0
+            ).grid(row=0, column=columna * 2 + 1, ipady=3)
+        tk.Checkbutton(
+            marco_filtros, text="Subcarpetas", variable=self._recursivo_var,
+            bg="#202020", fg="#FF00FF", selectcolor="#181818", font=("Segoe UI", 10),
+            activebackground="#202020", activeforeground="#FF00FF", bd=0, highlightthickness=0
+        ).grid(row=0, column=4, padx=(15, 0))
+
+        # Largo de los segmentos para convertir audio/vídeo largo en paralelo (0 = no)
+        self._segmento_var = tk.StringVar(value=str(SEGMENTO_POR_DEFECTO))
+        tk.Label(
+            marco_filtros, text="Segmentos (s):", bg="#202020", fg="#FF00FF", font=("Segoe UI", 10)
+        ).grid(row=0, column=5, sticky="e", padx=(15, 5))
+        tk.Spinbox(
+            marco_filtros, from_=0, to=3600, increment=30, textvariable=self._segmento_var, width=5,
+            bg="#181818", fg="#FF00FF", insertbackground="#FF00FF", buttonbackground="#181818",
+            font=("Segoe UI", 10), bd=0, highlightthickness=0
+        ).grid(row=0, column=6, ipady=3)
 
         # Marco para combobox y botón “Convertir”
         marco_conv = tk.Frame(container, bg="#202020")
@@ -213,23 +1099,27 @@ class FileExtensionChanger(tk.Tk):
         )
         lbl_formato.grid(row=0, column=0, sticky="e")
 
-        # Combobox manual (sin ttk) usando OptionMenu
-        self._formatos_var = tk.StringVar()
-        self.optionmenu = tk.OptionMenu(
+        # Menú con casillas (sin ttk): se pueden marcar varios formatos
+        self._formatos_vars = {}
+        self.menu_formatos = tk.Menubutton(
             marco_conv,
-            self._formatos_var,
-            ()
+            text="Ninguno",
+            relief="flat",
+            indicatoron=True,
+            width=24
         )
-        self.optionmenu.config(
+        self.menu_formatos.config(
             bg="#181818", fg="#FF00FF", font=("Segoe UI", 11),
             bd=0, activebackground="#FF5555", activeforeground="#FFFFFF",
             highlightthickness=0
         )
-        self.optionmenu["menu"].config(
-            bg="#181818", fg="#FF00FF", font=("Segoe UI", 10),
+        menu = tk.Menu(self.menu_formatos, tearoff=0)
+        menu.config(
+            bg="#181818", fg="#FF00FF", font=("Segoe UI", 10), selectcolor="#FF00FF",
             bd=0, activebackground="#FF5555", activeforeground="#FFFFFF"
         )
-        self.optionmenu.grid(row=0, column=1, padx=(10, 10), sticky="ew")
+        self.menu_formatos["menu"] = menu
+        self.menu_formatos.grid(row=0, column=1, padx=(10, 10), sticky="ew")
 
         btn_convertir = tk.Button(
             marco_conv,
@@ -247,11 +1137,28 @@ class FileExtensionChanger(tk.Tk):
         btn_convertir.grid(row=0, column=2, padx=(10, 0))
 
         # Deshabilitar al inicio
-        self._formatos_var.set("")
-        self.optionmenu.config(state="disabled")
+        self.menu_formatos.config(state="disabled")
         btn_convertir.config(state="disabled")
         self.btn_convertir = btn_convertir
 
+        # Progreso agregado del lote
+        estilo = ttk.Style(self)
+        estilo.theme_use("default")
+        estilo.configure(
+            "Yuuruii.Horizontal.TProgressbar",
+            troughcolor="#181818", background="#FF00FF", bordercolor="#202020",
+            lightcolor="#FF00FF", darkcolor="#FF00FF"
+        )
+        self.barra_lote = ttk.Progressbar(
+            container, style="Yuuruii.Horizontal.TProgressbar", mode="determinate", length=760
+        )
+        self.barra_lote.pack(pady=(0, 5))
+        self.lbl_progreso = tk.Label(
+            container, text="", bg="#202020", fg="gray", font=("Segoe UI", 10),
+            wraplength=760, justify="center"
+        )
+        self.lbl_progreso.pack(pady=(0, 10))
+
         # Botón “Abrir carpeta” (deshabilitado al inicio)
         btn_abrir = tk.Button(
             container,
@@ -274,6 +1181,13 @@ class FileExtensionChanger(tk.Tk):
     #   Métodos de barra de título (mover, minimizar...)
     # -------------------------------------------------
     def on_close(self):
+        if self._conversion_en_curso:
+            if not messagebox.askyesno(
+                "Conversión en curso", "Hay una conversión en curso.\n¿Cancelarla y cerrar?"
+            ):
+                return
+            # Sin esto ffmpeg seguiría vivo tras cerrar la ventana
+            self._cancelacion.set()
         self.destroy()
 
     def on_maximize_restore(self):
@@ -315,13 +1229,13 @@ class FileExtensionChanger(tk.Tk):
             self._ruta_seleccionada = None
             self._categoria = None
             self.lbl_ruta.config(text="No hay archivo seleccionado", fg="gray")
-            self.optionmenu.config(state="disabled")
-            self._formatos_var.set("")
+            self._poblar_formatos([])
             self.btn_convertir.config(state="disabled")
             self.btn_abrir.config(state="disabled")
             return
 
         self._ruta_seleccionada = ruta
+        self._carpeta_seleccionada = None
         self._categoria = categoria
         nombre_archivo = os.path.basename(ruta)
         self.lbl_ruta.config(text=f"Archivo seleccionado: {nombre_archivo}", fg="#FF00FF")
@@ -334,71 +1248,442 @@ class FileExtensionChanger(tk.Tk):
         elif categoria == "audio":
             formatos_disp = sorted(list(AUDIO_FORMATS - {ext}))
 
-        formatos_mostrar = [f.upper() for f in formatos_disp]
-        # Reconstruir OptionMenu
-        menu = self.optionmenu["menu"]
+        self._poblar_formatos([formatos_disp], formatos_disp[:1])
+        self.btn_convertir.config(state="normal" if formatos_disp else "disabled")
+
+        self.btn_abrir.config(state="disabled")
+
+    # -------------------------------------------------
+    #   Menú de formatos de salida (varios a la vez)
+    # -------------------------------------------------
+    def _poblar_formatos(self, grupos, marcados=()):
+        """
+        grupos es una lista de listas de formatos; entre grupo y grupo va
+        un separador.
+        """
+        menu = self.menu_formatos["menu"]
         menu.delete(0, "end")
-        for fmt in formatos_mostrar:
-            menu.add_command(
-                label=fmt,
-                command=lambda value=fmt: self._formatos_var.set(value)
-            )
-        if formatos_mostrar:
-            self._formatos_var.set(formatos_mostrar[0])
-            self.optionmenu.config(state="normal")
-            self.btn_convertir.config(state="normal")
-        else:
-            self._formatos_var.set("")
-            self.optionmenu.config(state="disabled")
-            self.btn_convertir.config(state="disabled")
+        self._formatos_vars = {}
+        for n, grupo in enumerate(g for g in grupos if g):
+            if n:
+                menu.add_separator()
+            for fmt in grupo:
+                variable = tk.BooleanVar(value=fmt in marcados)
+                self._formatos_vars[fmt] = variable
+                menu.add_checkbutton(
+                    label=fmt.upper(), variable=variable, command=self._actualizar_texto_formatos
+                )
+        self.menu_formatos.config(state="normal" if self._formatos_vars else "disabled")
+        self._actualizar_texto_formatos()
+
+    def _segmento_elegido(self):
+        try:
+            return max(0, int(float(self._segmento_var.get())))
+        except ValueError:
+            return 0
+
+    def _formatos_elegidos(self):
+        return [fmt for fmt, variable in self._formatos_vars.items() if variable.get()]
+
+    def _actualizar_texto_formatos(self):
+        elegidos = [fmt.upper() for fmt in self._formatos_elegidos()]
+        texto = ", ".join(elegidos[:4]) + (f" +{len(elegidos) - 4}" if len(elegidos) > 4 else "")
+        self.menu_formatos.config(text=texto or "Ninguno")
+
+    # -------------------------------------------------
+    #   Seleccionar carpeta para convertir por lotes
+    # -------------------------------------------------
+    def _seleccionar_carpeta(self):
+        carpeta = filedialog.askdirectory(title="Seleccionar carpeta")
+        if not carpeta:
+            return
+
+        self._carpeta_seleccionada = carpeta
+        self._ruta_seleccionada = None
+        self._categoria = None
+        self.lbl_ruta.config(text=f"Carpeta seleccionada: {carpeta}", fg="#FF00FF")
 
+        # Cualquier formato vale: cada archivo va a los marcados de su categoría
+        self._poblar_formatos(
+            [sorted(formatos) for formatos in (IMAGE_FORMATS, VIDEO_FORMATS, AUDIO_FORMATS)],
+            ["png"]
+        )
+        self.btn_convertir.config(state="normal")
         self.btn_abrir.config(state="disabled")
 
+    # -------------------------------------------------
+    #   Convertir una carpeta en segundo plano
+    # -------------------------------------------------
+    def _convertir_carpeta(self, formatos_salida):
+        carpeta = self._carpeta_seleccionada
+        carpeta_salida = os.path.join(carpeta_salida_del_dia(), os.path.basename(os.path.normpath(carpeta)))
+        incluir = interpretar_patrones(self._incluir_var.get())
+        excluir = interpretar_patrones(self._excluir_var.get())
+        recursivo = self._recursivo_var.get()
+        segmento = self._segmento_elegido()
+        # Lo que hace que dos lotes de la misma carpeta sean "el mismo"
+        parametros_lote = {
+            "formatos": sorted(f.lower() for f in formatos_salida), "incluir": incluir,
+            "excluir": excluir, "recursivo": recursivo, "version": VERSION_CONVERSION,
+        }
+
+        self._bloquear_controles(True)
+        self.barra_lote.config(value=0, maximum=1)
+        self.lbl_progreso.config(text="Buscando archivos…", fg="gray")
+        self._hechas_lote = self._errores_lote = 0
+        cancelacion = self._cancelacion
+        # Vía elegida para cada audio/vídeo (la escriben los hilos de ffmpeg)
+        modos = {}
+
+        def al_indexar(vistos, ultimo=[0.0]):
+            # Un aviso cada 0.2 s como mucho: un árbol grande tiene miles de directorios
+            if time.monotonic() - ultimo[0] >= 0.2:
+                ultimo[0] = time.monotonic()
+                self.after(0, lambda: self.lbl_progreso.config(text=f"Indexando… {vistos} archivos"))
+
+        def tarea():
+            # El índice hace que repasar la carpeta la próxima vez sea casi inmediato
+            try:
+                inventario = Inventario()
+            except Exception:
+                inventario = None
+            # Sin caché de sondeos cada ffmpeg hace su propio ffprobe
+            try:
+                cache = CacheSondeos()
+            except Exception:
+                cache = None
+            # Sin diario se convierte todo, como antes
+            try:
+                diario = DiarioTrabajos()
+            except Exception:
+                diario = None
+            salida = carpeta_salida
+            try:
+                lote, reanudado, al_dia = None, False, 0
+                if diario is not None:
+                    lote, salida, reanudado = diario.abrir_lote(carpeta, parametros_lote, carpeta_salida)
+                trabajos, omitidos = preparar_trabajos(
+                    carpeta, formatos_salida, salida, incluir, excluir, recursivo,
+                    inventario, al_indexar
+                )
+                if inventario is not None:
+                    inventario.cerrar()
+                    inventario = None
+                if diario is not None:
+                    trabajos, al_dia = diario.filtrar(trabajos, parametros_destino, lote)
+                self.after(0, self._iniciar_progreso, len(trabajos))
+                errores = convertir_lote(
+                    trabajos,
+                    al_avanzar=lambda *args: self.after(0, self._actualizar_progreso, *args),
+                    cancelacion=cancelacion,
+                    al_plan=lambda ruta, planes: modos.__setitem__(ruta, [plan["modo"] for plan in planes]),
+                    segmento=segmento,
+                    cache=cache,
+                    diario=diario
+                )
+                # Un lote cancelado sigue abierto y se reanuda la próxima vez
+                if diario is not None and not cancelacion.is_set():
+                    diario.terminar_lote(lote)
+                self.after(0, self._finalizar_lote, salida, len(trabajos), omitidos, errores, modos,
+                           al_dia, reanudado)
+            except Exception as e:
+                self.after(0, self._finalizar_lote, salida, 0, 0, [(carpeta, str(e))])
+            finally:
+                for abierto in (inventario, cache, diario):
+                    if abierto is not None:
+                        abierto.cerrar()
+
+        threading.Thread(target=tarea, daemon=True).start()
+
+    def _bloquear_controles(self, bloquear):
+        """
+        Mientras hay una conversión el botón “Convertir” pasa a “Cancelar”.
+        """
+        self._conversion_en_curso = bloquear
+        estado = "disabled" if bloquear else "normal"
+        for boton in (self.btn_seleccionar, self.btn_seleccionar_carpeta):
+            boton.config(state=estado)
+        self.menu_formatos.config(state=estado)
+        if bloquear:
+            self._cancelacion = threading.Event()
+            self.btn_convertir.config(text="Cancelar", command=self._cancelar_conversion)
+            self.btn_abrir.config(state="disabled")
+        else:
+            self.btn_convertir.config(text="Convertir", command=self._convertir_archivo, state="normal")
+
+    def _cancelar_conversion(self):
+        self._cancelacion.set()
+        self.btn_convertir.config(state="disabled")
+        self.lbl_progreso.config(text="Cancelando…", fg="#FF5555")
+
+    def _iniciar_progreso(self, total):
+        self.barra_lote.config(value=0, maximum=max(total, 1))
+        self._errores_lote = 0
+        self._hechas_lote = 0
+        self.lbl_progreso.config(text=f"0/{total}", fg="gray")
+
+    def _actualizar_progreso(self, hechas, total, ruta, error):
+        if error:
+            self._errores_lote += 1
+        self._hechas_lote = hechas
+        self.barra_lote.config(value=hechas)
+        texto = f"{hechas}/{total} · {os.path.basename(ruta)}"
+        if self._errores_lote:
+            texto += f" · {self._errores_lote} errores"
+        self.lbl_progreso.config(text=texto, fg="#FF5555" if self._errores_lote else "gray")
+
+    def _finalizar_lote(self, carpeta_salida, total, omitidos, errores, modos=None, al_dia=0,
+                        reanudado=False):
+        cancelado = self._cancelacion.is_set()
+        self._bloquear_controles(False)
+        convertidos = (self._hechas_lote if cancelado else total) - len(errores)
+        resumen = f"Convertidos: {convertidos} de {total}"
+        if cancelado:
+            resumen += " (cancelado; se reanudará la próxima vez)"
+        elif reanudado:
+            resumen += " (lote reanudado)"
+        if al_dia:
+            resumen += f"\nYa al día (sin cambios desde la última vez): {al_dia}"
+        if omitidos:
+            resumen += f"\nOmitidos (otra categoría o mismo formato): {omitidos}"
+        if modos:
+            # Se cuentan salidas, no archivos: un vídeo puede ir a MP4 por remux y a WEBM recodificado
+            cuentas = [
+                (modo, sum(lista.count(modo) for lista in modos.values())) for modo in DESCRIPCION_MODO
+            ]
+            resumen += "\n" + " · ".join(
+                f"{'Remux' if modo == 'remux' else DESCRIPCION_MODO[modo]}: {n}" for modo, n in cuentas if n
+            )
+        self.lbl_progreso.config(text=resumen.replace("\n", " · "), fg="#FF5555" if errores else "#FF00FF")
+
+        if os.path.isdir(carpeta_salida) and (convertidos or al_dia):
+            self._ultima_carpeta_salida = carpeta_salida
+            self.btn_abrir.config(state="normal")
+
+        if cancelado and not errores:
+            return
+        if not errores:
+            messagebox.showinfo("Conversión por lotes", f"{resumen}\n\nen:\n{carpeta_salida}")
+            return
+        detalle = "\n".join(
+            f"• {os.path.basename(entrada)}: {resumir_error(error_msg)}" for entrada, error_msg in errores[:8]
+        )
+        if len(errores) > 8:
+            detalle += f"\n… y {len(errores) - 8} más"
+        if os.path.isdir(carpeta_salida):
+            detalle += f"\n\nLista completa en:\n{guardar_resumen_errores(carpeta_salida, errores)}"
+        messagebox.showerror("Conversión por lotes", f"{resumen}\nCon errores: {len(errores)}\n\n{detalle}")
+
     # -------------------------------------------------
     #   Convertir el archivo según categoría
     # -------------------------------------------------
     def _convertir_archivo(self):
-        formato_salida = self._formatos_var.get().lower()
+        formatos_salida = self._formatos_elegidos()
+        if self._carpeta_seleccionada and formatos_salida:
+            self._convertir_carpeta(formatos_salida)
+            return
         ruta_entrada = self._ruta_seleccionada
-        if not ruta_entrada or not formato_salida:
+        if not ruta_entrada or not formatos_salida:
             messagebox.showerror("Error", "No se especificó el archivo o el formato de salida.")
             return
 
-        raiz = os.path.dirname(os.path.abspath(sys.argv[0])) if not getattr(sys, "frozen", False) else os.path.dirname(sys.executable)
-        carpeta_base = os.path.join(raiz, "Archive converter")
-        fecha_hoy = datetime.now().strftime("%Y-%m-%d")
-        carpeta_fecha = os.path.join(carpeta_base, fecha_hoy)
-        os.makedirs(carpeta_fecha, exist_ok=True)
+        carpeta_fecha = carpeta_salida_del_dia()
 
         nombre_sin_ext = os.path.splitext(os.path.basename(ruta_entrada))[0]
-        ruta_salida = os.path.join(carpeta_fecha, f"{nombre_sin_ext}.{formato_salida}")
+        destinos = [
+            (os.path.join(carpeta_fecha, f"{nombre_sin_ext}.{formato}"), formato)
+            for formato in formatos_salida
+        ]
 
-        if os.path.exists(ruta_salida):
+        # El diario se consulta en un hilo: si el original cambió de fecha
+        # hay que leerlo entero para comparar su huella
+        self._bloquear_controles(True)
+        self.barra_lote.config(value=0, maximum=100, mode="indeterminate")
+        self.barra_lote.start(15)
+        self.lbl_progreso.config(text="Comprobando si ya está convertido…", fg="gray")
+        trabajo = (ruta_entrada, destinos, self._categoria)
+
+        def comprobar():
+            pendientes = [trabajo]
+            diario = self._abrir_diario()
+            if diario is not None:
+                try:
+                    pendientes, _ = diario.comprobar([trabajo], parametros_destino)
+                except Exception:
+                    pass
+                finally:
+                    diario.cerrar()
+            self.after(0, self._confirmar_archivo, trabajo, carpeta_fecha, pendientes)
+
+        threading.Thread(target=comprobar, daemon=True).start()
+
+    def _confirmar_archivo(self, trabajo, carpeta_fecha, pendientes):
+        """
+        Con el resultado del diario: avisa si todo está al día, pregunta
+        antes de sobrescribir lo que exista y lanza la conversión de lo
+        que quede.
+        """
+        ruta_entrada, destinos, _ = trabajo
+        cancelado = self._cancelacion.is_set()
+        self._bloquear_controles(False)
+        self.barra_lote.stop()
+        self.barra_lote.config(mode="determinate", value=0)
+        self.lbl_progreso.config(text="Cancelado" if cancelado else "", fg="gray")
+        if cancelado:
+            return
+        if not pendientes:
+            self._ultima_carpeta_salida = carpeta_fecha
+            self.btn_abrir.config(state="normal")
+            messagebox.showinfo(
+                "Sin cambios",
+                "Ya está convertido y el original no ha cambiado:\n\n"
+                + "\n".join(os.path.basename(ruta) for ruta, _ in destinos) + f"\nen:\n{carpeta_fecha}"
+            )
+            return
+        destinos = pendientes[0][1]
+
+        existentes = [os.path.basename(ruta) for ruta, _ in destinos if os.path.exists(ruta)]
+        if existentes:
             resp = messagebox.askyesno(
                 "Sobrescribir",
-                f"El archivo '{os.path.basename(ruta_salida)}' ya existe en:\n{carpeta_fecha}\n¿Deseas sobrescribirlo?"
+                f"Ya existe{'n' if len(existentes) > 1 else ''} en:\n{carpeta_fecha}\n\n"
+                + "\n".join(existentes) + "\n\n¿Deseas sobrescribir?"
             )
             if not resp:
                 return
 
-        if self._categoria == "imagen":
-            exito, error_msg = convertir_imagen(ruta_entrada, ruta_salida, formato_salida)
+        # La conversión (y la huella para el diario) va en un hilo para no congelar la ventana
+        rutas_salida = [ruta for ruta, _ in destinos]
+        self._bloquear_controles(True)
+        self.barra_lote.config(value=0, maximum=100, mode="indeterminate")
+        self.barra_lote.start(15)
+        self.lbl_progreso.config(text=f"Convirtiendo {os.path.basename(ruta_entrada)}…", fg="gray")
+        cancelacion = self._cancelacion
+        categoria = self._categoria
+
+        self._planes_archivo = None
+        # Los que de verdad se convierten (el diario puede haber quitado alguno)
+        self._formatos_archivo = [formato for _, formato in destinos]
+        segmento = self._segmento_elegido()
+
+        def tarea():
+            # Solo ahora, con la conversión confirmada, queda apuntada como pendiente
+            diario = self._abrir_diario()
+            if diario is not None:
+                try:
+                    diario.apuntar_pendientes([(ruta_entrada, destinos, categoria)], parametros_destino)
+                finally:
+                    diario.cerrar()
+            if categoria == "imagen":
+                exito, error_msg = convertir_imagen_varios(ruta_entrada, destinos)
+            else:
+                # Reconvertir el mismo archivo a otro formato no vuelve a lanzar ffprobe
+                try:
+                    cache = CacheSondeos()
+                except Exception:
+                    cache = None
+                try:
+                    planes = planes_para_archivo(ruta_entrada, [formato for _, formato in destinos], cache)
+                finally:
+                    if cache is not None:
+                        cache.cerrar()
+                # Una sola ejecución de ffmpeg con una salida por formato
+                exito, error_msg = convertir_con_ffmpeg_varios(
+                    ruta_entrada, destinos,
+                    al_progreso=lambda fraccion, eta: self.after(0, self._progreso_archivo, fraccion, eta),
+                    cancelacion=cancelacion,
+                    planes=planes,
+                    al_plan=lambda planes: self.after(0, self._mostrar_plan, planes),
+                    segmento=segmento
+                )
+            if not cancelacion.is_set():
+                self._registrar_archivo(ruta_entrada, destinos, exito, error_msg)
+            self.after(0, self._finalizar_archivo, rutas_salida, exito, error_msg)
+
+        threading.Thread(target=tarea, daemon=True).start()
+
+    def _abrir_diario(self):
+        try:
+            return DiarioTrabajos()
+        except Exception:
+            return None
+
+    def _registrar_archivo(self, ruta_entrada, destinos, exito, error_msg):
+        """
+        Apunta la conversión de un archivo suelto en el diario. Abre su
+        propia conexión: puede llamarse desde el hilo de ffmpeg.
+        """
+        diario = self._abrir_diario()
+        if diario is None:
+            return
+        try:
+            registrar_en_diario(diario, destinos, lambda: firma_origen(ruta_entrada), exito, error_msg)
+        finally:
+            diario.cerrar()
+
+    def _descripcion_planes(self):
+        planes = self._planes_archivo or []
+        if len(planes) == 1:
+            return planes[0]["descripcion"]
+        formatos = self._formatos_archivo
+        return "\n".join(f"{fmt.upper()}: {plan['descripcion']}" for fmt, plan in zip(formatos, planes))
+
+    def _mostrar_plan(self, planes):
+        self._planes_archivo = planes
+        if self._conversion_en_curso and not self._cancelacion.is_set():
+            self.lbl_progreso.config(text=self._descripcion_planes(), fg="gray")
+
+    def _progreso_archivo(self, fraccion, eta):
+        if not self._conversion_en_curso or self._cancelacion.is_set():
+            return
+        if fraccion is None:
+            return
+        if str(self.barra_lote.cget("mode")) == "indeterminate":
+            self.barra_lote.stop()
+            self.barra_lote.config(mode="determinate")
+        self.barra_lote.config(value=fraccion * 100)
+        texto = f"{fraccion:.0%} · quedan {formatear_eta(eta)}"
+        if self._planes_archivo:
+            texto = f"{self._descripcion_planes()}\n{texto}"
+        self.lbl_progreso.config(text=texto, fg="gray")
+
+    def _finalizar_archivo(self, rutas_salida, exito, error_msg):
+        carpeta_fecha = os.path.dirname(rutas_salida[0])
+        cancelado = self._conversion_en_curso and self._cancelacion.is_set()
+        # Solo las conversiones con ffmpeg tienen plan (remux o recodificación)
+        descripcion = self._descripcion_planes() if self._conversion_en_curso and self._planes_archivo else None
+        if self._conversion_en_curso:
+            self._bloquear_controles(False)
+            self.barra_lote.stop()
+            self.barra_lote.config(mode="determinate", value=100 if exito else 0)
+            self.lbl_progreso.config(
+                text="Cancelado" if cancelado else ("Completado" if exito else "Error"),
+                fg="#FF00FF" if exito else "#FF5555"
+            )
+        if cancelado:
+            self.btn_abrir.config(state="disabled")
+            return
+
+        creados = [ruta for ruta in rutas_salida if os.path.exists(ruta)]
+        if creados:
+            self._ultima_carpeta_salida = carpeta_fecha
+            self.btn_abrir.config(state="normal")
         else:
-            exito, error_msg = convertir_con_ffmpeg(ruta_entrada, ruta_salida)
+            self.btn_abrir.config(state="disabled")
 
         if exito:
             messagebox.showinfo(
                 "Conversión exitosa",
-                f"Se ha creado:\n\n{os.path.basename(ruta_salida)}\nen:\n{carpeta_fecha}"
+                "Se ha creado:\n\n" + "\n".join(os.path.basename(ruta) for ruta in rutas_salida)
+                + f"\nen:\n{carpeta_fecha}"
+                + (f"\n\n{descripcion}" if descripcion else "")
             )
-            self._ultima_carpeta_salida = carpeta_fecha
-            self.btn_abrir.config(state="normal")
         else:
             messagebox.showerror(
                 "Error en la conversión",
-                f"No se pudo convertir el archivo.\n\nDetalles:\n{error_msg}"
+                # El buffer de stderr puede ser largo: bastan las últimas líneas
+                "No se pudo convertir el archivo.\n\nDetalles:\n" + "\n".join((error_msg or "").splitlines()[-15:])
             )
-            self.btn_abrir.config(state="disabled")
 
     # -------------------------------------------------
     #   Abrir carpeta de salida en el explorador
@@ -414,6 +1699,9 @@ class FileExtensionChanger(tk.Tk):
 #   Punto de entrada
 # --------------------------------------------------
 if __name__ == "__main__":
+    # Necesario para el pool de procesos en el .exe de PyInstaller
+    multiprocessing.freeze_support()
+
     # Verificar que Pillow esté instalado
     try:
         _ = Image
@@ -0,0 +1,393 @@
+"""
+Inventario de archivos para el File Extension Manager: recorre un árbol
+con os.scandir, clasifica los archivos con extensión de imagen, audio
+o vídeo por sus primeros bytes (y por la extensión si la firma no
+basta) y guarda ruta, tamaño, fecha y
+categoría en un índice SQLite. Los barridos siguientes solo vuelven a
+leer y escribir lo que ha cambiado, así que un árbol grande ya
+indexado se repasa en segundos.
+
+Uso:
+    python inventario.py carpeta/
+    python inventario.py carpeta/ --db inventario.db --exclude "*.tmp; .git"
+"""
+import os
+import sys
+import time
+import fnmatch
+import sqlite3
+import argparse
+
+# --------------------------------------------------
+#   Listas de extensiones admitidas
+# --------------------------------------------------
+IMAGE_FORMATS = {
+    "jpeg", "jpg", "png", "bmp", "gif", "tiff", "heif", "raw", "psd",
+    "ico", "webp"
+}
+VIDEO_FORMATS = {
+    "mp4", "avi", "mkv", "flv", "mov", "wmv", "divx", "h264", "xvid", "rm", "webm"
+}
+AUDIO_FORMATS = {
+    "wav", "aiff", "au", "flac", "m4a", "shn", "tta", "atrc", "alac",
+    "mp3", "vorbis", "mpc", "aac", "wma", "opus", "ogg", "dsd", "mqa"
+}
+
+def obtener_extension(ruta):
+    return os.path.splitext(ruta)[1].lower().lstrip(".")
+
+def determinar_categoria(ext):
+    if ext in IMAGE_FORMATS:
+        return "imagen"
+    elif ext in VIDEO_FORMATS:
+        return "video"
+    elif ext in AUDIO_FORMATS:
+        return "audio"
+    else:
+        return None
+
+# --------------------------------------------------
+#   Clasificación por firma (magic bytes)
+# --------------------------------------------------
+BYTES_FIRMA = 64
+
+# (desplazamiento, firma, formato, categoría). Categoría None = el
+# contenedor admite audio o vídeo y decide la extensión.
+FIRMAS = [
+    (0, b"\x89PNG\r\n\x1a\n", "png", "imagen"),
+    (0, b"\xff\xd8\xff", "jpeg", "imagen"),
+    (0, b"GIF87a", "gif", "imagen"),
+    (0, b"GIF89a", "gif", "imagen"),
+    (0, b"II*\x00", "tiff", "imagen"),
+    (0, b"MM\x00*", "tiff", "imagen"),
+    (0, b"8BPS", "psd", "imagen"),
+    (0, b"\x00\x00\x01\x00", "ico", "imagen"),
+    (0, b"\x1a\x45\xdf\xa3", "mkv", None),
+    (0, b"FLV", "flv", "video"),
+    (0, b".RMF", "rm", "video"),
+    (0, b"\x30\x26\xb2\x75\x8e\x66\xcf\x11", "asf", None),
+    (0, b"fLaC", "flac", "audio"),
+    (0, b"OggS", "ogg", "audio"),
+    (0, b"ID3", "mp3", "audio"),
+    (0, b".snd", "au", "audio"),
+    (0, b"TTA1", "tta", "audio"),
+    (0, b"ajkg", "shn", "audio"),
+    (0, b"MPCK", "mpc", "audio"),
+    (0, b"MP+", "mpc", "audio"),
+    (0, b"DSD ", "dsd", "audio"),
+    (0, b"FRM8", "dsd", "audio"),
+]
+# Subtipos RIFF / FORM (bytes 8-12)
+SUBTIPOS_RIFF = {
+    b"WEBP": ("webp", "imagen"),
+    b"AVI ": ("avi", "video"),
+    b"WAVE": ("wav", "audio"),
+    b"AIFF": ("aiff", "audio"),
+    b"AIFC": ("aiff", "audio"),
+}
+# Tamaños válidos de la cabecera DIB de un BMP (core, info, v2-v5)
+CABECERAS_DIB = {12, 40, 52, 56, 64, 108, 124}
+# Marcas ISO BMFF (bytes 8-12 tras "ftyp")
+MARCAS_FTYP = {
+    b"heic": ("heif", "imagen"), b"heix": ("heif", "imagen"), b"mif1": ("heif", "imagen"),
+    b"msf1": ("heif", "imagen"), b"avif": ("heif", "imagen"),
+    b"qt  ": ("mov", "video"),
+    b"M4A ": ("m4a", "audio"), b"M4B ": ("m4a", "audio"),
+}
+
+def identificar_firma(cabecera):
+    """
+    (formato, categoría) a partir de los primeros bytes, o (None, None)
+    si no se reconoce. La categoría es None en contenedores que pueden
+    ser solo audio (Matroska, ASF, MP4 genérico).
+    """
+    if cabecera[:4] in (b"RIFF", b"FORM") and cabecera[8:12] in SUBTIPOS_RIFF:
+        return SUBTIPOS_RIFF[cabecera[8:12]]
+    if cabecera[4:8] == b"ftyp":
+        return MARCAS_FTYP.get(cabecera[8:12], ("mp4", None))
+    for desplazamiento, firma, formato, categoria in FIRMAS:
+        if cabecera[desplazamiento:desplazamiento + len(firma)] == firma:
+            return formato, categoria
+    if es_cabecera_bmp(cabecera):
+        return "bmp", "imagen"
+    return identificar_trama_mpeg(cabecera)
+
+def es_cabecera_bmp(cabecera):
+    """
+    "BM" solo no basta (cualquier texto puede empezar así): también el
+    tamaño del archivo, los bytes reservados a cero y un tamaño de
+    cabecera DIB conocido.
+    """
+    if len(cabecera) < 18 or cabecera[:2] != b"BM":
+        return False
+    tamano = int.from_bytes(cabecera[2:6], "little")
+    dib = int.from_bytes(cabecera[14:18], "little")
+    return tamano >= 26 and cabecera[6:10] == b"\x00" * 4 and dib in CABECERAS_DIB
+
+def identificar_trama_mpeg(cabecera):
+    """
+    Audio MPEG sin etiqueta ID3: una cabecera de trama completa, no solo
+    los 11 bits de sincronía. ADTS (AAC) lleva layer 00 y una frecuencia
+    válida; MP1/2/3, versión y layer no reservados, bitrate distinto de
+    1111 y frecuencia distinta de 11.
+    """
+    if len(cabecera) < 4 or cabecera[0] != 0xFF or cabecera[1] & 0xE0 != 0xE0:
+        return None, None
+    version = (cabecera[1] >> 3) & 0x03
+    layer = (cabecera[1] >> 1) & 0x03
+    if layer == 0:
+        # ADTS: sincronía de 12 bits y frecuencia 0-12
+        if cabecera[1] & 0xF0 == 0xF0 and (cabecera[2] >> 2) & 0x0F <= 12:
+            return "aac", "audio"
+        return None, None
+    if version == 1 or cabecera[2] >> 4 == 0x0F or (cabecera[2] >> 2) & 0x03 == 0x03:
+        return None, None
+    return "mp3", "audio"
+
+def clasificar(ruta):
+    """
+    (formato, categoría) de un archivo. Solo los que ya tienen una
+    extensión de imagen, audio o vídeo se miran por dentro: la firma
+    confirma o corrige la categoría (un PNG llamado .jpg sigue siendo
+    imagen) y la extensión decide en contenedores ambiguos o si la firma
+    no se reconoce. El resto no es un medio, diga lo que diga la firma.
+    """
+    ext = obtener_extension(ruta)
+    categoria_ext = determinar_categoria(ext)
+    if categoria_ext is None:
+        return (ext or None), None
+    try:
+        with open(ruta, "rb") as f:
+            cabecera = f.read(BYTES_FIRMA)
+    except OSError:
+        cabecera = b""
+    formato, categoria = identificar_firma(cabecera)
+    if formato is None:
+        return (ext or None), categoria_ext
+    if categoria is None:
+        categoria = categoria_ext if categoria_ext in ("video", "audio") else "video"
+    return formato, categoria
+
+# --------------------------------------------------
+#   Recorrido con os.scandir
+# --------------------------------------------------
+def coincide_patrones(ruta_relativa, patrones):
+    """
+    True si el nombre o la ruta relativa (con "/") encaja con algún glob.
+    """
+    ruta_relativa = ruta_relativa.replace(os.sep, "/")
+    nombre = ruta_relativa.rsplit("/", 1)[-1]
+    return any(
+        fnmatch.fnmatch(nombre.lower(), p.lower()) or fnmatch.fnmatch(ruta_relativa.lower(), p.lower())
+        for p in patrones
+    )
+
+def recorrer_directorios(carpeta, incluir=None, excluir=None, recursivo=True):
+    """
+    Genera (directorio, archivos) por cada directorio visitado, donde
+    archivos es [(ruta, ruta relativa, tamaño, mtime_ns)] ordenado por
+    nombre. Los archivos deben encajar con algún patrón de incluir
+    (todos si no hay) y con ninguno de excluir; las carpetas excluidas
+    no se recorren. Los directorios ilegibles se saltan.
+    """
+    pendientes = [(carpeta, "")]
+    while pendientes:
+        actual, prefijo = pendientes.pop()
+        try:
+            with os.scandir(actual) as it:
+                entradas = sorted(it, key=lambda e: e.name)
+        except OSError:
+            continue
+        archivos = []
+        for entrada in entradas:
+            relativa = prefijo + entrada.name
+            if excluir and coincide_patrones(relativa, excluir):
+                continue
+            try:
+                if entrada.is_dir(follow_symlinks=False):
+                    if recursivo:
+                        pendientes.append((entrada.path, relativa + os.sep))
+                    continue
+                if not entrada.is_file() or (incluir and not coincide_patrones(relativa, incluir)):
+                    continue
+                info = entrada.stat()
+            except OSError:
+                continue
+            archivos.append((entrada.path, relativa, info.st_size, info.st_mtime_ns))
+        yield actual, archivos
+
+def recorrer(carpeta, incluir=None, excluir=None, recursivo=True):
+    """
+    Igual que recorrer_directorios pero archivo a archivo.
+    """
+    for _, archivos in recorrer_directorios(carpeta, incluir, excluir, recursivo):
+        yield from archivos
+
+# --------------------------------------------------
+#   Índice SQLite
+# --------------------------------------------------
+SCRIPT_DIR = os.path.dirname(os.path.abspath(sys.argv[0])) if not getattr(sys, "frozen", False) else os.path.dirname(sys.executable)
+INVENTARIO_POR_DEFECTO = os.path.join(SCRIPT_DIR, "Archive converter", "inventario.db")
+# Cambios por transacción durante un barrido
+LOTE_ESCRITURA = 5000
+
+class Inventario:
+    """
+    Tabla con una fila por archivo: directorio, tamaño, mtime (ns),
+    formato y categoría. Cada barrido compara directorio a directorio
+    con lo guardado; solo se leen las firmas de los archivos nuevos o
+    cambiados y solo se escriben las filas que difieren.
+    """
+    def __init__(self, ruta=INVENTARIO_POR_DEFECTO):
+        self.ruta = ruta
+        os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+        # Sin transacciones implícitas: escanear las abre y cierra a mano
+        self._con = sqlite3.connect(ruta, isolation_level=None)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.execute("PRAGMA synchronous=NORMAL")
+        self._con.execute(
+            """CREATE TABLE IF NOT EXISTS archivos (
+                   ruta TEXT PRIMARY KEY,
+                   directorio TEXT NOT NULL,
+                   tamano INTEGER NOT NULL,
+                   mtime_ns INTEGER NOT NULL,
+                   formato TEXT,
+                   categoria TEXT
+               )"""
+        )
+        self._con.execute("CREATE INDEX IF NOT EXISTS idx_directorio ON archivos (directorio)")
+        self._con.execute("CREATE INDEX IF NOT EXISTS idx_categoria ON archivos (categoria)")
+
+    @staticmethod
+    def _rango(carpeta):
+        """
+        Límites para buscar con el índice todo lo que cuelga de carpeta:
+        ruta >= "carpeta/" y ruta < "carpeta0" ("0" va justo después de "/").
+        """
+        carpeta = os.path.abspath(carpeta)
+        return carpeta, carpeta.rstrip(os.sep) + os.sep, carpeta.rstrip(os.sep) + chr(ord(os.sep) + 1)
+
+    def escanear(self, carpeta, incluir=None, excluir=None, recursivo=True, al_avanzar=None):
+        """
+        Sincroniza el índice con el árbol de carpeta. al_avanzar(vistos)
+        se llama tras cada directorio. Devuelve un dict con vistos,
+        nuevos, cambiados, borrados y segundos.
+        """
+        inicio = time.perf_counter()
+        carpeta = os.path.abspath(carpeta)
+        cuentas = {"vistos": 0, "nuevos": 0, "cambiados": 0, "borrados": 0}
+        pendientes_escritura = 0
+        visitados = set()
+        self._con.execute("BEGIN")
+        try:
+            for directorio, archivos in recorrer_directorios(carpeta, incluir, excluir, recursivo):
+                visitados.add(directorio)
+                guardados = {
+                    ruta: (tamano, mtime_ns) for ruta, tamano, mtime_ns in self._con.execute(
+                        "SELECT ruta, tamano, mtime_ns FROM archivos WHERE directorio = ?", (directorio,)
+                    )
+                }
+                escribir = []
+                for ruta, _, tamano, mtime_ns in archivos:
+                    anterior = guardados.pop(ruta, None)
+                    if anterior == (tamano, mtime_ns):
+                        continue
+                    cuentas["nuevos" if anterior is None else "cambiados"] += 1
+                    formato, categoria = clasificar(ruta)
+                    escribir.append((ruta, directorio, tamano, mtime_ns, formato, categoria))
+                cuentas["vistos"] += len(archivos)
+                if escribir:
+                    self._con.executemany(
+                        "INSERT OR REPLACE INTO archivos VALUES (?, ?, ?, ?, ?, ?)", escribir
+                    )
+                # Lo que queda en guardados ya no está en el directorio
+                if guardados:
+                    self._con.executemany("DELETE FROM archivos WHERE ruta = ?", [(r,) for r in guardados])
+                    cuentas["borrados"] += len(guardados)
+                pendientes_escritura += len(escribir) + len(guardados)
+                if pendientes_escritura >= LOTE_ESCRITURA:
+                    self._con.execute("COMMIT")
+                    self._con.execute("BEGIN")
+                    pendientes_escritura = 0
+                if al_avanzar:
+                    al_avanzar(cuentas["vistos"])
+
+            # Directorios que desaparecieron (o que ahora se excluyen)
+            raiz, desde, hasta = self._rango(carpeta)
+            desaparecidos = [
+                (directorio,) for (directorio,) in self._con.execute(
+                    """SELECT DISTINCT directorio FROM archivos
+                       WHERE directorio = ? OR (directorio >= ? AND directorio < ?)""",
+                    (raiz, desde, hasta)
+                ) if directorio not in visitados
+            ]
+            if desaparecidos:
+                antes = self._con.total_changes
+                self._con.executemany("DELETE FROM archivos WHERE directorio = ?", desaparecidos)
+                cuentas["borrados"] += self._con.total_changes - antes
+            self._con.execute("COMMIT")
+        except BaseException:
+            self._con.execute("ROLLBACK")
+            raise
+        cuentas["segundos"] = time.perf_counter() - inicio
+        return cuentas
+
+    def archivos(self, carpeta, categorias=None):
+        """
+        Genera (ruta, tamaño, mtime_ns, formato, categoría) de lo
+        indexado bajo carpeta, por orden de ruta; categorias filtra.
+        """
+        raiz, desde, hasta = self._rango(carpeta)
+        consulta = """SELECT ruta, tamano, mtime_ns, formato, categoria FROM archivos
+                      WHERE (directorio = ? OR (directorio >= ? AND directorio < ?))"""
+        parametros = [raiz, desde, hasta]
+        if categorias:
+            consulta += f" AND categoria IN ({', '.join('?' * len(categorias))})"
+            parametros += list(categorias)
+        yield from self._con.execute(consulta + " ORDER BY ruta", parametros)
+
+    def resumen(self, carpeta):
+        """
+        {categoría: (archivos, bytes)} de lo indexado bajo carpeta.
+        """
+        raiz, desde, hasta = self._rango(carpeta)
+        filas = self._con.execute(
+            """SELECT categoria, COUNT(*), SUM(tamano) FROM archivos
+               WHERE directorio = ? OR (directorio >= ? AND directorio < ?)
+               GROUP BY categoria""",
+            (raiz, desde, hasta)
+        )
+        return {categoria: (n, total or 0) for categoria, n, total in filas}
+
+    def cerrar(self):
+        self._con.close()
+
+# --------------------------------------------------
+#   CLI
+# --------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Indexa un árbol de archivos para el File Extension Manager.")
+    parser.add_argument("carpeta", help="Carpeta a indexar")
+    parser.add_argument("--db", default=INVENTARIO_POR_DEFECTO, help="Ruta del índice SQLite")
+    parser.add_argument("--include", default="", help='Patrones a incluir separados por ";"')
+    parser.add_argument("--exclude", default="", help='Patrones a excluir separados por ";"')
+    parser.add_argument("--no-recursive", action="store_true", help="No entrar en subcarpetas")
+    args = parser.parse_args()
+
+    patrones = lambda texto: [p.strip() for p in texto.replace(",", ";").split(";") if p.strip()]
+    inventario = Inventario(args.db)
+    try:
+        cuentas = inventario.escanear(
+            args.carpeta, patrones(args.include), patrones(args.exclude), not args.no_recursive
+        )
+        print(
+            f"{cuentas['vistos']} archivos en {cuentas['segundos']:.2f} s · "
+            f"{cuentas['nuevos']} nuevos · {cuentas['cambiados']} cambiados · {cuentas['borrados']} borrados"
+        )
+        for categoria, (n, total) in sorted(inventario.resumen(args.carpeta).items(), key=lambda x: str(x[0])):
+            print(f"  {categoria or 'otros'}: {n} archivos, {total / 1e6:.1f} MB")
+    finally:
+        inventario.cerrar()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+Caché persistente de ffprobe para el File Extension Manager. Cada
+sondeo se guarda en SQLite con clave (ruta, tamaño, mtime): mientras el
+archivo no cambie no se vuelve a lanzar ffprobe, algo que en carpetas
+de red ahorra la mayor parte del tiempo de preparar un lote. Los
+archivos que faltan en la caché se sondean en un pool de hilos.
+
+Uso:
+    python sondeos.py carpeta/            # llena la caché con el audio y vídeo de la carpeta
+    python sondeos.py carpeta/ --codec h264
+"""
+import os
+import json
+import time
+import sqlite3
+import argparse
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from inventario import SCRIPT_DIR, determinar_categoria, obtener_extension, recorrer
+
+# --------------------------------------------------
+#   ffprobe
+# --------------------------------------------------
+def sondear_medio(ruta):
+    """
+    Streams, duración y bitrate según ffprobe:
+    {"streams": [{"indice", "tipo", "codec", "portada"}], "duracion", "bitrate"}.
+    Lanza RuntimeError si ffprobe falla.
+    """
+    proceso = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries",
+         "stream=index,codec_type,codec_name:stream_disposition=attached_pic"
+         ":format=duration,bit_rate", "-of", "json", ruta],
+        capture_output=True, text=True
+    )
+    if proceso.returncode != 0:
+        raise RuntimeError(f"ffprobe no pudo leer {ruta}: {proceso.stderr.strip()}")
+    datos = json.loads(proceso.stdout or "{}")
+    formato = datos.get("format") or {}
+
+    def numero(valor, tipo):
+        try:
+            return tipo(valor)
+        except (TypeError, ValueError):
+            return None
+
+    return {
+        "streams": [
+            {
+                "indice": int(flujo["index"]),
+                "tipo": flujo.get("codec_type"),
+                "codec": flujo.get("codec_name"),
+                "portada": bool((flujo.get("disposition") or {}).get("attached_pic")),
+            }
+            for flujo in datos.get("streams") or []
+        ],
+        "duracion": numero(formato.get("duration"), float),
+        "bitrate": numero(formato.get("bit_rate"), int),
+    }
+
+# --------------------------------------------------
+#   Caché SQLite
+# --------------------------------------------------
+CACHE_SONDEOS_POR_DEFECTO = os.path.join(SCRIPT_DIR, "Archive converter", "sondeos.db")
+# ffprobe pasa casi todo el tiempo esperando al disco o a la red
+WORKERS_SONDEO = min(16, 4 * (os.cpu_count() or 1))
+# Máximo de parámetros por consulta IN (...) de SQLite
+LOTE_CONSULTA = 500
+
+class CacheSondeos:
+    """
+    Tabla con una fila por archivo: tamaño y mtime con los que se
+    sondeó, el resultado de sondear_medio en JSON y, aparte, duración,
+    bitrate y códecs para poder filtrar. Un archivo que ffprobe no sabe
+    leer también se guarda (con su error), para no reintentarlo en cada
+    lote. Se puede usar desde varios hilos.
+    """
+    def __init__(self, ruta=CACHE_SONDEOS_POR_DEFECTO):
+        self.ruta = ruta
+        os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(ruta, check_same_thread=False)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.execute("PRAGMA synchronous=NORMAL")
+        with self._con:
+            self._con.execute(
+                """CREATE TABLE IF NOT EXISTS sondeos (
+                       ruta TEXT PRIMARY KEY,
+                       tamano INTEGER NOT NULL,
+                       mtime_ns INTEGER NOT NULL,
+                       info TEXT,
+                       duracion REAL,
+                       bitrate INTEGER,
+                       codecs TEXT,
+                       error TEXT,
+                       actualizado REAL NOT NULL
+                   )"""
+            )
+
+    def _buscar(self, claves):
+        """
+        {ruta: info o None} de las claves (ruta, tamaño, mtime_ns) que
+        están en la caché con el mismo tamaño y mtime.
+        """
+        encontrados = {}
+        esperado = dict((ruta, (tamano, mtime_ns)) for ruta, tamano, mtime_ns in claves)
+        rutas = list(esperado)
+        with self._lock:
+            for i in range(0, len(rutas), LOTE_CONSULTA):
+                trozo = rutas[i:i + LOTE_CONSULTA]
+                filas = self._con.execute(
+                    f"SELECT ruta, tamano, mtime_ns, info FROM sondeos WHERE ruta IN ({', '.join('?' * len(trozo))})",
+                    trozo
+                )
+                for ruta, tamano, mtime_ns, info in filas:
+                    if esperado[ruta] == (tamano, mtime_ns):
+                        encontrados[ruta] = json.loads(info) if info else None
+        return encontrados
+
+    def _guardar(self, filas):
+        """
+        filas: [(ruta, tamaño, mtime_ns, info o None, error o None)].
+        """
+        ahora = time.time()
+        with self._lock, self._con:
+            self._con.executemany(
+                "INSERT OR REPLACE INTO sondeos VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (ruta, tamano, mtime_ns,
+                     json.dumps(info) if info else None,
+                     info.get("duracion") if info else None,
+                     info.get("bitrate") if info else None,
+                     ",".join(sorted({f["codec"] for f in info["streams"] if f["codec"]})) if info else None,
+                     error, ahora)
+                    for ruta, tamano, mtime_ns, info, error in filas
+                ]
+            )
+
+    def obtener_varios(self, rutas, workers=WORKERS_SONDEO):
+        """
+        {ruta: info} para todas las rutas, con una consulta por cada
+        LOTE_CONSULTA rutas y ffprobe en paralelo solo para las que
+        faltan o han cambiado. info es None si el archivo no existe o
+        ffprobe no lo puede leer. Si ffprobe no está instalado, lanza
+        FileNotFoundError sin guardar nada.
+        """
+        # En la caché las rutas van siempre absolutas
+        absolutas = {ruta: os.path.abspath(ruta) for ruta in rutas}
+        claves = []
+        encontrados = {}
+        for absoluta in dict.fromkeys(absolutas.values()):
+            try:
+                info = os.stat(absoluta)
+            except OSError:
+                encontrados[absoluta] = None
+                continue
+            claves.append((absoluta, info.st_size, info.st_mtime_ns))
+
+        encontrados.update(self._buscar(claves))
+        faltan = [clave for clave in claves if clave[0] not in encontrados]
+        if not faltan:
+            return {ruta: encontrados[absoluta] for ruta, absoluta in absolutas.items()}
+
+        def sondear(clave):
+            try:
+                return clave + (sondear_medio(clave[0]), None)
+            except (RuntimeError, ValueError) as e:
+                return clave + (None, str(e))
+
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(faltan)))) as pool:
+            filas = list(pool.map(sondear, faltan))
+        self._guardar(filas)
+        for absoluta, _, _, info, _ in filas:
+            encontrados[absoluta] = info
+        return {ruta: encontrados[absoluta] for ruta, absoluta in absolutas.items()}
+
+    def obtener(self, ruta):
+        return self.obtener_varios([ruta])[ruta]
+
+    def rutas_con_codec(self, codec, carpeta=None):
+        """
+        Rutas sondeadas con algún stream en el códec dado, opcionalmente
+        solo las que cuelgan de carpeta.
+        """
+        consulta = "SELECT ruta FROM sondeos WHERE ',' || codecs || ',' LIKE ?"
+        parametros = [f"%,{codec},%"]
+        if carpeta:
+            base = os.path.abspath(carpeta).rstrip(os.sep)
+            consulta += " AND ruta >= ? AND ruta < ?"
+            parametros += [base + os.sep, base + chr(ord(os.sep) + 1)]
+        with self._lock:
+            return [fila[0] for fila in self._con.execute(consulta + " ORDER BY ruta", parametros)]
+
+    def cerrar(self):
+        with self._lock:
+            self._con.close()
+
+# --------------------------------------------------
+#   CLI
+# --------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Llena la caché de ffprobe con el audio y vídeo de una carpeta.")
+    parser.add_argument("carpeta", help="Carpeta a sondear (con subcarpetas)")
+    parser.add_argument("--db", default=CACHE_SONDEOS_POR_DEFECTO, help="Ruta de la caché SQLite")
+    parser.add_argument("--workers", type=int, default=WORKERS_SONDEO, help="ffprobe simultáneos")
+    parser.add_argument("--codec", help="Después, listar los archivos con este códec")
+    args = parser.parse_args()
+
+    rutas = [
+        ruta for ruta, _, _, _ in recorrer(args.carpeta)
+        if determinar_categoria(obtener_extension(ruta)) in ("video", "audio")
+    ]
+    cache = CacheSondeos(args.db)
+    try:
+        inicio = time.perf_counter()
+        infos = cache.obtener_varios(rutas, args.workers)
+        legibles = sum(1 for info in infos.values() if info)
+        print(f"{len(rutas)} archivos ({legibles} legibles) en {time.perf_counter() - inicio:.2f} s")
+        if args.codec:
+            for ruta in cache.rutas_con_codec(args.codec, args.carpeta):
+                print(f"  {ruta}")
+    finally:
+        cache.cerrar()
+
+if __name__ == "__main__":
+    main()